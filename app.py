@@ -1,5 +1,6 @@
 from flask import Flask, render_template, request, jsonify, send_file
 import os
+import re
 import json
 import threading
 import time
@@ -7,20 +8,41 @@ from datetime import datetime
 import zipfile
 import shutil
 import subprocess
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-import yt_dlp
-import assemblyai as aai
-from openai import OpenAI
-from moviepy import VideoFileClip
-from moviepy.video.fx.Crop import Crop
-from moviepy.video.fx.FadeIn import FadeIn
-from moviepy.video.fx.FadeOut import FadeOut
+# yt_dlp, openai, httpx and numpy are imported where the pipeline uses them, so a web
+# worker that only serves status and clip files never loads them (see startup_benchmark.py)
 from werkzeug.utils import secure_filename
 import uuid
+import assemblyai_client
+from providers import GROQ, estimate_tokens, provider_stats
+import artifact_store
+import render_cache
+import transcript_library
+import segmented_transcription
+import progress
+from stage_pools import StagePools
+from word_timeline import WordTimeline
+from ass_subtitles import write_ass
+from clip_stream import ClipStreamParser, parse_clips_json
+import compact_transcript
+from compact_transcript import milliseconds_to_timecode
+from render import (
+    RENDER_MODE, BATCH_SIZE, SUPPORTED_RATIOS, parse_ratios, ratio_suffix, probe_media, renderer_version, remove_outputs, run_ffmpeg,
+    render_clip, render_clips
+)
+from job_store import (
+    JOBS_FOLDER, job_path, create_job, load_job, save_job,
+    stage_done, stage_outputs, mark_stage_done, reset_stages, clip_done, mark_clip_done,
+    claim_job, release_job, is_job_locked, find_resumable_jobs, is_valid_job_id, claim_background_runner
+)
 
 app = Flask(__name__)
 
@@ -32,75 +54,80 @@ app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
 
-# Ensure upload folder exists
+# Ensure upload and jobs folders exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(JOBS_FOLDER, exist_ok=True)
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm', 'm4v', 'flv', '3gp'}
 
+# Jobs run as coroutines on one event loop; blocking work is handed off to these pools.
+# Downloads and light file work go to IO_EXECUTOR, ffmpeg rendering to RENDER_EXECUTOR
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('IO_WORKERS', '8')), thread_name_prefix='io')
+RENDER_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2))),
+                                     thread_name_prefix='render')
+
+# Slots per resource (network, remote API, CPU, disk) shared by the web-started jobs; see stage_pools.py
+PIPELINE_POOLS = StagePools()
+
+# The audio uploaded to AssemblyAI in Step 3 is reused for clip subtitles within this window
+UPLOAD_REUSE_SECONDS = 3600
+
+# Source downloads: parallel fragment fetches, resumable .part files and bandwidth caps.
+# Per-job values apply as given; the totals are shared out between the downloads running at the time
+DOWNLOAD_FRAGMENTS = int(os.getenv('DOWNLOAD_FRAGMENTS', '8'))
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv('DOWNLOAD_MAX_CONNECTIONS', '32'))
+DOWNLOAD_RATE_LIMIT = os.getenv('DOWNLOAD_RATE_LIMIT')  # e.g. 5M (bytes per second)
+DOWNLOAD_TOTAL_RATE_LIMIT = os.getenv('DOWNLOAD_TOTAL_RATE_LIMIT')
+DOWNLOAD_ATTEMPTS = int(os.getenv('DOWNLOAD_ATTEMPTS', '3'))
+# 'aria2c' fetches single-file formats over several connections too (must be installed)
+DOWNLOAD_EXTERNAL = os.getenv('DOWNLOAD_EXTERNAL', '')
+# Errors no retry will fix
+PERMANENT_DOWNLOAD_ERRORS = ('Sign in to confirm', 'Private video', 'Video unavailable', 'Unsupported URL',
+                             'not available in your country')
+
+_downloads_lock = threading.Lock()
+_active_downloads = 0
+
+GROQ_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+# Render each clip as soon as the analysis stream has produced it, instead of after the whole list
+STREAM_RENDER = os.getenv('CLIP_STREAM_RENDER', 'true').lower() == 'true'
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Global variable to track processing status
+# Global variable to track processing status of the job started from the web UI
 processing_status = {
     'status': 'idle',
     'message': '',
     'progress': 0,
     'clips': [],
-    'error': None
+    'error': None,
+    'job_id': None
 }
 
-def cleanup_previous_output():
-    """Clean up previous output files and folders"""
-    items_to_remove = [
-        'output_clips',
-        'output_clips_final', 
-        'output_subtitles',
-        'final_clips.zip',
-        'main_audio.mp3',
-        'main_transcript.vtt',
-        'main_video.webm',
-        'main_video.mp4', 
-        'raw_transcript.vtt',
-        'clipah_clips.zip',
-        'main_video.mhtml',
-        'main_video.mkv',
-        'temp-audio.m4a',
-        'cookies.txt'
-    ]
-    
-    print("🧹 Cleaning up previous output...")
-    
-    for item in items_to_remove:
-        if os.path.exists(item):
-            try:
-                if os.path.isdir(item):
-                    shutil.rmtree(item)
-                    print(f" ✅ Removed folder: {item}")
-                else:
-                    os.remove(item)
-                    print(f" ✅ Removed file: {item}")
-            except Exception as e:
-                print(f" ❌ Error removing {item}: {e}")
-        else:
-            print(f" ℹ️ Item not found, skipping: {item}")
-    
-    # Recreate uploads folder
-    os.makedirs('uploads', exist_ok=True)
-    
-    print("✅ Cleanup complete!")
-
-def log_progress(step, message, step_num=None, total_steps=None):
+def update_job_status(job, **fields):
+    """Persist status fields on the job record and mirror them to the web UI status"""
+    job.update(fields)
+    save_job(job)
+
+    if processing_status.get('job_id') == job['id']:
+        for key in ('status', 'message', 'progress', 'clips', 'error'):
+            processing_status[key] = job.get(key)
+
+def log_progress(step, message, step_num=None, total_steps=None, job=None):
     """Update processing status"""
     global processing_status
-    
+
+    fields = {'status': 'processing', 'message': f"{step}: {message}"}
     if step_num and total_steps:
-        progress = int((step_num / total_steps) * 100)
-        processing_status['progress'] = progress
-    
-    processing_status['status'] = 'processing'
-    processing_status['message'] = f"{step}: {message}"
+        fields['progress'] = int((step_num / total_steps) * 100)
+
+    if job is not None:
+        update_job_status(job, **fields)
+    else:
+        processing_status.update(fields)
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {step}: {message}")
 
 def time_to_seconds(time_str):
@@ -116,311 +143,505 @@ def time_to_seconds(time_str):
     except:
         return 0
 
-def process_video_complete(video_source, source_type='url', language="Indonesian", include_subtitles=True, 
-                         include_watermark=True, watermark_text="@clipah.com", aspect_ratio="9:16"):
+TIME_RE = re.compile(r'^\s*(\d+):([0-5]?\d):([0-5]?\d)(?:[.,](\d+))?\s*$')
+
+def time_to_ms(time_str):
+    """Convert time string (HH:MM:SS.mmm) to milliseconds; raises ValueError if it isn't one"""
+    match = TIME_RE.match(time_str) if isinstance(time_str, str) else None
+    if not match:
+        raise ValueError(f"Invalid time {time_str!r}, expected HH:MM:SS.mmm")
+    h, m, s, ms = match.groups()
+    return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int((ms or '0')[:3].ljust(3, '0'))
+
+def snap_clips_to_words(clips, word_timeline, first_index=0):
+    """Snap LLM-proposed clip boundaries onto word/pause boundaries so clips don't start or end mid-word"""
+    if not len(word_timeline):
+        return clips
+
+    for i, clip_info in enumerate(clips, start=first_index):
+        start_time_str = clip_info.get("start_time")
+        end_time_str = clip_info.get("end_time")
+        if not start_time_str or not end_time_str:
+            continue
+
+        start_ms = int(round(time_to_seconds(start_time_str) * 1000))
+        end_ms = int(round(time_to_seconds(end_time_str) * 1000))
+        if start_ms >= end_ms:
+            continue
+
+        snapped_start = word_timeline.snap_start(start_ms)
+        snapped_end = word_timeline.snap_end(end_ms)
+        if snapped_start >= snapped_end:
+            continue
+
+        clip_info["start_time"] = milliseconds_to_timecode(snapped_start)
+        clip_info["end_time"] = milliseconds_to_timecode(snapped_end)
+        print(f"[DEBUG] Snapped clip {i+1}: {start_time_str}-{end_time_str} -> {clip_info['start_time']}-{clip_info['end_time']}")
+
+    return clips
+
+def clip_basename(index, clip_info):
+    """File name (without extension) used for a clip in every output folder"""
+    clip_title = clip_info.get("clip_title", f"clip_{index+1}")
+    safe_filename = "".join(c for c in clip_title if c.isalnum() or c in (' ', '_')).rstrip()
+    return f"{index+1}_{safe_filename}"
+
+def read_file(file_path):
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Error: The file '{file_path}' was not found.")
+        return None
+    except Exception as e:
+        print(f"An error occurred while reading '{file_path}': {e}")
+        return None
+
+def check_api_keys():
+    """Fail fast before any work is done if an API key is missing"""
+    for key in ('ASSEMBLYAI_API_KEY', 'GROQ_API_KEY'):
+        if not os.getenv(key):
+            raise RuntimeError(f"{key} not found in environment variables")
+
+def get_groq_client():
+    from openai import AsyncOpenAI
+
+    groq_api_key = os.getenv('GROQ_API_KEY')
+    if not groq_api_key:
+        raise RuntimeError("GROQ_API_KEY not found in environment variables")
+    return AsyncOpenAI(
+        api_key=groq_api_key,
+        base_url="https://api.groq.com/openai/v1",
+        max_retries=0  # retries are handled by the shared provider layer
+    )
+
+async def groq_response(groq_client, prompt, expected_output=0):
+    """Send a prompt to the Groq model under the shared rate limits and retry policy"""
+    return await GROQ.call(
+        lambda: groq_client.responses.create(
+            model=GROQ_MODEL,
+            input=[{"role": "user", "content": prompt}]
+        ),
+        tokens=estimate_tokens(prompt, expected_output)
+    )
+
+async def groq_stream(groq_client, prompt, expected_output=0):
+    """Like groq_response, but yields the output text as the model writes it"""
+    # The Groq slot stays taken until the whole answer has been read
+    async with GROQ.stream(
+        lambda: groq_client.responses.create(
+            model=GROQ_MODEL,
+            input=[{"role": "user", "content": prompt}],
+            stream=True
+        ),
+        tokens=estimate_tokens(prompt, expected_output)
+    ) as stream:
+        async for event in stream:
+            if event.type == 'response.output_text.delta':
+                yield event.delta
+
+def save_transcript(transcript, output_path):
+    """Persist the words and sentences of a finished transcription so later stages can reload them"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(transcript, f, ensure_ascii=False)
+    return transcript
+
+def load_transcript(job):
+    with open(job_path(job['id'], 'transcript.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def download_share(parse_bytes):
+    """(fragments, bytes per second or None) for a download starting now, within the per-job and total limits"""
+    with _downloads_lock:
+        active = max(1, _active_downloads)
+    fragments = max(1, min(DOWNLOAD_FRAGMENTS, DOWNLOAD_MAX_CONNECTIONS // active))
+    rates = []
+    if DOWNLOAD_RATE_LIMIT:
+        rates.append(parse_bytes(DOWNLOAD_RATE_LIMIT))
+    if DOWNLOAD_TOTAL_RATE_LIMIT:
+        rates.append(parse_bytes(DOWNLOAD_TOTAL_RATE_LIMIT) / active)
+    rates = [rate for rate in rates if rate]
+    return fragments, (int(min(rates)) if rates else None)
+
+def download_with_retries(yt_dlp, download_opts, video_source):
     """
-    Complete video processing pipeline from source to final clips
+    Download with yt-dlp, retrying the whole download on failure. Partial
+    .part files are kept and continued, so a retry (or a resumed job) picks
+    up where the connection dropped instead of starting over.
     """
-    global processing_status
-    
+    global _active_downloads
+    with _downloads_lock:
+        _active_downloads += 1
     try:
-        processing_status['status'] = 'processing'
-        processing_status['error'] = None
-        
-        # Set language code
-        language_code = "en_us" if language.lower() == "english" else "id"
-        
-        # Initialize API clients
-        assemblyai_api_key = os.getenv('ASSEMBLYAI_API_KEY')
-        groq_api_key = os.getenv('GROQ_API_KEY')
-        
-        if not assemblyai_api_key:
-            raise RuntimeError("ASSEMBLYAI_API_KEY not found in environment variables")
-        if not groq_api_key:
-            raise RuntimeError("GROQ_API_KEY not found in environment variables")
-        
-        aai.settings.api_key = assemblyai_api_key
-        
-        # Initialize Groq client
-        groq_client = OpenAI(
-            api_key=groq_api_key,
-            base_url="https://api.groq.com/openai/v1"
-        )
-        
-        # Step counter
-        total_steps = 7  
-        if include_subtitles:
-            total_steps += 2 
-        elif include_watermark:  
-            total_steps += 1 
-        
-        current_step = 0
-        
-        # Step 1: Handle Video Source
-        current_step += 1
-        
-        if source_type == 'url':
-            log_progress("Downloading video", f"Downloading video from: {video_source}", current_step, total_steps)
-            
-            # First list available formats
-            list_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': True
-            }
-            
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            # Limits are worked out per attempt, as other downloads start and finish
+            fragments, rate = download_share(yt_dlp.utils.parse_bytes)
+            opts = dict(download_opts, concurrent_fragment_downloads=fragments, ratelimit=rate)
+            if DOWNLOAD_EXTERNAL == 'aria2c':
+                opts['external_downloader'] = {'default': 'aria2c'}
+                opts['external_downloader_args'] = {'aria2c': ['-x', str(fragments), '-s', str(fragments), '-k', '1M']}
+            print(f"[INFO] Download attempt {attempt}/{DOWNLOAD_ATTEMPTS}: {fragments} connections, "
+                  f"{f'{rate / 2**20:.1f} MB/s cap' if rate else 'no bandwidth cap'}")
             try:
-                with yt_dlp.YoutubeDL(list_opts) as ydl:
-                    print("[INFO] Getting available formats...")
-                    info = ydl.extract_info(video_source, download=False)
-                    
-                    # Get list of formats and print them for debugging
-                    formats = info.get('formats', [])
-                    print("[DEBUG] Available formats:")
-                    for f in formats:
-                        print(f"Format ID: {f.get('format_id')} - "
-                              f"Ext: {f.get('ext')} - "
-                              f"Resolution: {f.get('resolution')} - "
-                              f"Note: {f.get('format_note')} - "
-                              f"vcodec: {f.get('vcodec')} - "
-                              f"acodec: {f.get('acodec')}")
-                    
-                    # Filter for formats that definitely have video
-                    video_formats = [f for f in formats if f.get('vcodec') != 'none']
-                    if not video_formats:
-                        raise RuntimeError("No video formats found")
-                    
-                    # Try to find best format with both video and audio
-                    format_id = None
-                    for f in video_formats:
-                        if (f.get('acodec') != 'none' and 
-                            f.get('ext') == 'mp4' and 
-                            f.get('format_note') in ['medium', 'high', '720p', '1080p']):
-                            format_id = f['format_id']
-                            print(f"[INFO] Selected format: {format_id}")
-                            break
-                    
-                    download_opts = {
-                        'format': '137+140/96/best',  # 1080p MP4 + best audio, fallback to format 96 (1080p), then best available
-                        'merge_output_format': 'mp4',
-                        'outtmpl': 'main_video.%(ext)s',
-                        'cookiefile': './cookies.txt',
-                        'nocheckcertificate': True,
-                        'ignoreerrors': False,
-                        'no_warnings': False,
-                        'verbose': True,
-                        'postprocessor_args': {
-                            'ffmpeg': [
-                                '-c:v', 'copy',  # Copy video stream without re-encoding
-                                '-c:a', 'aac',   # Convert audio to AAC
-                                '-strict', 'experimental'
-                            ]
-                        }
-                    }
-                    print(f"[INFO] Selected format options: {download_opts}")
-                    
-                    # If we found a specific good format, use it
-                    if format_id:
-                        download_opts['format'] = f"{format_id}+bestaudio[ext=m4a]/bestvideo[ext=mp4]+bestaudio[ext=m4a]"
-                    
-                    print(f"[INFO] Using download options: {download_opts}")
-                    
-                    print("[INFO] Starting download...")
-                    with yt_dlp.YoutubeDL(download_opts) as ydl:
-                        ydl.download([video_source])
-                    
-                    # Verify the downloaded video file
-                    if not os.path.exists('main_video.mp4'):
-                        raise RuntimeError("Download completed but video file not found")
-                    
-                    # Check if the video file has video streams
-                    try:
-                        result = subprocess.run([
-                            'ffmpeg', '-i', 'main_video.mp4'
-                        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                        
-                        if result.stderr and 'Video: ' in result.stderr:
-                            print("[INFO] Successfully verified video file contains video streams")
-                            print("[INFO] FFmpeg output:", result.stderr)
-                        else:
-                            raise RuntimeError("Downloaded file contains no video streams")
-                    except subprocess.CalledProcessError as e:
-                        print(f"[ERROR] FFmpeg error output: {e.stderr}")
-                        raise RuntimeError(f"Failed to verify video file: FFmpeg error")
-                
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    ydl.download([video_source])
+                return
             except Exception as e:
-                error_msg = str(e)
-                print(f"[ERROR] Download failed: {error_msg}")
-                if "Sign in to confirm your age" in error_msg:
-                    raise RuntimeError("Age-restricted video. Please provide a URL that doesn't require age verification.")
-                if os.path.exists('main_video.mp4'):
-                    os.remove('main_video.mp4')  # Clean up potentially corrupt file
-                raise RuntimeError(f"YouTube download failed: {error_msg}")
-        else:
-            # Handle uploaded file
-            log_progress("Processing uploaded video", f"Processing uploaded file: {os.path.basename(video_source)}", current_step, total_steps)
-            
-            # Copy uploaded file to main_video.mp4 and convert if necessary
-            file_extension = os.path.splitext(video_source)[1].lower()
-            
-            if file_extension == '.mp4':
-                # If it's already MP4, just copy it
-                shutil.copy2(video_source, 'main_video.mp4')
-            else:
-                # Convert to MP4 using FFmpeg
+                if attempt == DOWNLOAD_ATTEMPTS or any(text in str(e) for text in PERMANENT_DOWNLOAD_ERRORS):
+                    raise
+                wait = min(60, 5 * 2 ** (attempt - 1))
+                print(f"[WARNING] Download failed ({e}); resuming in {wait}s")
+                time.sleep(wait)
+    finally:
+        with _downloads_lock:
+            _active_downloads -= 1
+
+def prepare_source(job, step_num, total_steps):
+    """Step 1: Download the video or take over the uploaded file as main_video.mp4"""
+    import yt_dlp
+
+    options = job['options']
+    video_source = options['video_source']
+    main_video = job_path(job['id'], 'main_video.mp4')
+
+    if options['source_type'] == 'url':
+        log_progress("Downloading video", f"Downloading video from: {video_source}", step_num, total_steps, job=job)
+
+        def report_download(status):
+            # Per file: video and audio streams are downloaded one after the other
+            total = status.get('total_bytes') or status.get('total_bytes_estimate')
+            if status.get('status') == 'downloading' and total:
+                progress.set_fraction(job['id'], status.get('downloaded_bytes', 0) / total)
+
+        # First list available formats
+        list_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': True
+        }
+
+        try:
+            with yt_dlp.YoutubeDL(list_opts) as ydl:
+                print("[INFO] Getting available formats...")
+                info = ydl.extract_info(video_source, download=False)
+
+                # Get list of formats and print them for debugging
+                formats = info.get('formats', [])
+                print("[DEBUG] Available formats:")
+                for f in formats:
+                    print(f"Format ID: {f.get('format_id')} - "
+                          f"Ext: {f.get('ext')} - "
+                          f"Resolution: {f.get('resolution')} - "
+                          f"Note: {f.get('format_note')} - "
+                          f"vcodec: {f.get('vcodec')} - "
+                          f"acodec: {f.get('acodec')}")
+
+                # Filter for formats that definitely have video
+                video_formats = [f for f in formats if f.get('vcodec') != 'none']
+                if not video_formats:
+                    raise RuntimeError("No video formats found")
+
+                # Try to find best format with both video and audio
+                format_id = None
+                for f in video_formats:
+                    if (f.get('acodec') != 'none' and
+                        f.get('ext') == 'mp4' and
+                        f.get('format_note') in ['medium', 'high', '720p', '1080p']):
+                        format_id = f['format_id']
+                        print(f"[INFO] Selected format: {format_id}")
+                        break
+
+                download_opts = {
+                    'format': '137+140/96/best',  # 1080p MP4 + best audio, fallback to format 96 (1080p), then best available
+                    'merge_output_format': 'mp4',
+                    'outtmpl': job_path(job['id'], 'main_video.%(ext)s'),
+                    'cookiefile': './cookies.txt',
+                    'nocheckcertificate': True,
+                    'ignoreerrors': False,
+                    'no_warnings': False,
+                    'verbose': True,
+                    # Resume .part files; retry dropped connections and fragments with backoff
+                    'continuedl': True,
+                    'retries': 10,
+                    'fragment_retries': 10,
+                    'retry_sleep_functions': {'http': lambda n: min(30, 2 ** n), 'fragment': lambda n: min(30, 2 ** n)},
+                    'socket_timeout': 30,
+                    # Ranged requests of this size dodge per-connection throttling on long progressive files
+                    'http_chunk_size': 10 * 1024 * 1024,
+                    'progress_hooks': [report_download],
+                    'postprocessor_args': {
+                        'ffmpeg': [
+                            '-c:v', 'copy',  # Copy video stream without re-encoding
+                            '-c:a', 'aac',   # Convert audio to AAC
+                            '-strict', 'experimental'
+                        ]
+                    }
+                }
+                print(f"[INFO] Selected format options: {download_opts}")
+
+                # If we found a specific good format, use it
+                if format_id:
+                    download_opts['format'] = f"{format_id}+bestaudio[ext=m4a]/bestvideo[ext=mp4]+bestaudio[ext=m4a]"
+
+                print(f"[INFO] Using download options: {download_opts}")
+
+                print("[INFO] Starting download...")
+                download_with_retries(yt_dlp, download_opts, video_source)
+
+                # Verify the downloaded video file
+                if not os.path.exists(main_video):
+                    raise RuntimeError("Download completed but video file not found")
+
+                # Check if the video file has video streams
                 try:
-                    log_progress("Converting video format", f"Converting {file_extension} to MP4", current_step, total_steps)
                     result = subprocess.run([
-                        'ffmpeg', '-i', video_source, 
-                        '-c:v', 'libx264', '-c:a', 'aac',
-                        '-preset', 'fast', '-crf', '23',
-                        '-y', 'main_video.mp4'
-                    ], capture_output=True, text=True, check=True, timeout=600)
-                    
-                    if not os.path.exists('main_video.mp4'):
-                        raise RuntimeError("Failed to convert video to MP4")
-                        
+                        'ffmpeg', '-i', main_video
+                    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+                    if result.stderr and 'Video: ' in result.stderr:
+                        print("[INFO] Successfully verified video file contains video streams")
+                        print("[INFO] FFmpeg output:", result.stderr)
+                    else:
+                        os.remove(main_video)  # A finished but useless file; download it again next time
+                        raise RuntimeError("Downloaded file contains no video streams")
                 except subprocess.CalledProcessError as e:
-                    raise RuntimeError(f"Video conversion failed: {e.stderr}")
-                except subprocess.TimeoutExpired:
-                    raise RuntimeError("Video conversion timed out (file too large or corrupt)")
-                except FileNotFoundError:
-                    raise RuntimeError("FFmpeg not found. Please install FFmpeg for video conversion.")
-        
-        # Verify main video file exists
-        if not os.path.exists('main_video.mp4'):
-            raise RuntimeError("Failed to create main_video.mp4")
-        
-        # Step 2: Convert to MP3
-        current_step += 1
-        log_progress("Converting audio", "Converting video to MP3 format", current_step, total_steps)
-        
-        try:
-            result = subprocess.run([
-                'ffmpeg', '-i', 'main_video.mp4', '-y', 'main_audio.mp3'
-            ], capture_output=True, text=True, check=True)
-            
-            if not os.path.exists('main_audio.mp3'):
-                raise RuntimeError("Failed to create main_audio.mp3 - ffmpeg conversion failed")
-                
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"FFmpeg conversion failed: {e.stderr}")
-        except FileNotFoundError:
-            raise RuntimeError("FFmpeg not found. Please install FFmpeg and add it to your PATH")
-        
-        # Step 3: Transcribe Audio
-        current_step += 1
-        log_progress("Transcribing audio", f"Transcribing audio in {language} language", current_step, total_steps)
-        audio_file = "main_audio.mp3"
-        main_config = aai.TranscriptionConfig(speech_model=aai.SpeechModel.universal, language_code=language_code)
-        transcript = aai.Transcriber(config=main_config).transcribe(audio_file)
-        
-        if transcript.status == "error":
-            raise RuntimeError(f"Transcription failed: {transcript.error}")
-        
-        # Step 4: Generate Raw Subtitles
-        current_step += 1
-        log_progress("Generating subtitles", "Creating VTT subtitle file", current_step, total_steps)
-        
-        def second_to_timecode(x: float) -> str:
-            hour, x = divmod(x, 3600)
-            minute, x = divmod(x, 60)
-            second, x = divmod(x, 1)
-            millisecond = int(x * 1000.)
-            return '%.2d:%.2d:%.2d.%.3d' % (hour, minute, second, millisecond)
-        
-        def generate_subtitles_by_sentence(transcript):
-            output = ["WEBVTT\n"]
-            for sentence in transcript.get_sentences():
-                start_time = second_to_timecode(sentence.start / 1000)
-                end_time = second_to_timecode(sentence.end / 1000)
-                subtitle_text = sentence.text
-                output.append("%s --> %s" % (start_time, end_time))
-                output.append(subtitle_text)
-                output.append("")
-            return output
-        
-        vtt = generate_subtitles_by_sentence(transcript)
-        with open("raw_transcript.vtt", 'w') as o:
-            final = '\n'.join(vtt)
-            o.write(final)
-        
-        # Step 5: Speaker Diarization
-        current_step += 1
-        log_progress("Speaker diarization", "Identifying different speakers in the audio", current_step, total_steps)
-        
-        def read_file(file_path):
+                    print(f"[ERROR] FFmpeg error output: {e.stderr}")
+                    raise RuntimeError(f"Failed to verify video file: FFmpeg error")
+
+        except Exception as e:
+            error_msg = str(e)
+            print(f"[ERROR] Download failed: {error_msg}")
+            if "Sign in to confirm your age" in error_msg:
+                raise RuntimeError("Age-restricted video. Please provide a URL that doesn't require age verification.")
+            # Partial downloads are kept: resuming the job continues them
+            raise RuntimeError(f"YouTube download failed: {error_msg}")
+    else:
+        # Handle uploaded file
+        log_progress("Processing uploaded video", f"Processing uploaded file: {os.path.basename(video_source)}", step_num, total_steps, job=job)
+
+        # Copy uploaded file to main_video.mp4 and convert if necessary
+        file_extension = os.path.splitext(video_source)[1].lower()
+
+        if file_extension == '.mp4':
+            # If it's already MP4, just copy it
+            shutil.copy2(video_source, main_video)
+        else:
+            # Convert to MP4 using FFmpeg
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+                log_progress("Converting video format", f"Converting {file_extension} to MP4", step_num, total_steps, job=job)
+                result = subprocess.run([
+                    'ffmpeg', '-i', video_source,
+                    '-c:v', 'libx264', '-c:a', 'aac',
+                    '-preset', 'fast', '-crf', '23',
+                    '-y', main_video
+                ], capture_output=True, text=True, check=True, timeout=600)
+
+                if not os.path.exists(main_video):
+                    raise RuntimeError("Failed to convert video to MP4")
+
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Video conversion failed: {e.stderr}")
+            except subprocess.TimeoutExpired:
+                raise RuntimeError("Video conversion timed out (file too large or corrupt)")
             except FileNotFoundError:
-                print(f"Error: The file '{file_path}' was not found.")
-                return None
-            except Exception as e:
-                print(f"An error occurred while reading '{file_path}': {e}")
+                raise RuntimeError("FFmpeg not found. Please install FFmpeg for video conversion.")
+
+    # Verify main video file exists
+    if not os.path.exists(main_video):
+        raise RuntimeError("Failed to create main_video.mp4")
+
+    # Length and resolution drive the progress and ETA estimates
+    job['media'] = probe_media(main_video)
+    if render_cache.ENABLED:
+        job_source_hash(job)
+    return {'video': main_video}
+
+def job_media(job):
+    """Duration, height and audio presence of the job's source (probed now for jobs from before this was stored)"""
+    if not job.get('media'):
+        job['media'] = probe_media(job_path(job['id'], 'main_video.mp4'))
+    return job['media']
+
+def job_source_hash(job):
+    """Content hash of the job's source video, the base of its render cache keys"""
+    media = job_media(job)
+    if not media.get('sha256'):
+        media['sha256'] = render_cache.file_hash(job_path(job['id'], 'main_video.mp4'))
+    return media['sha256']
+
+def clip_cache_keys(job, start, end, ratios):
+    """Render cache key of a clip cut (before subtitles and watermark) in each ratio"""
+    source = job_source_hash(job)
+    return [render_cache.cache_key(kind='clip', source=source, start=round(start, 3), end=round(end, 3),
+                                   ratio=ratio, renderer=renderer_version())
+            for ratio in ratios]
+
+def fetch_cached_clip(job, target, ratios):
+    """Link a clip's renders in from the render cache; True only if every ratio was there"""
+    i, start, end, output_paths = target
+    if not render_cache.ENABLED:
+        return False
+    keys = clip_cache_keys(job, start, end, ratios)
+    if not all(render_cache.contains(key) for key in keys):
+        return False
+    if not all(render_cache.fetch(key, path) for key, path in zip(keys, output_paths)):
+        return False
+    print(f"[INFO] Clip {i+1} served from the render cache: {', '.join(output_paths)}")
+    return True
+
+def cache_rendered_clip(job, target, ratios):
+    i, start, end, output_paths = target
+    if render_cache.ENABLED:
+        for key, path in zip(clip_cache_keys(job, start, end, ratios), output_paths):
+            render_cache.store(key, path)
+
+def extract_audio(job, step_num, total_steps):
+    """Step 2: Convert to MP3"""
+    log_progress("Converting audio", "Converting video to MP3 format", step_num, total_steps, job=job)
+    main_video = job_path(job['id'], 'main_video.mp4')
+    main_audio = job_path(job['id'], 'main_audio.mp3')
+
+    duration = job_media(job)['duration']
+    report = (lambda position: progress.set_fraction(job['id'], position / duration)) if duration else None
+    try:
+        run_ffmpeg(['ffmpeg', '-i', main_video, '-y', main_audio], timeout=6 * 3600, on_progress=report)
+    except RuntimeError as e:
+        raise RuntimeError(f"FFmpeg conversion failed: {e}")
+
+    if not os.path.exists(main_audio):
+        raise RuntimeError("Failed to create main_audio.mp3 - ffmpeg conversion failed")
+
+    return {'audio': main_audio}
+
+async def transcribe_audio(job, step_num, total_steps):
+    """Step 3: Transcribe Audio"""
+    language = job['options']['language']
+    log_progress("Transcribing audio", f"Transcribing audio in {language} language", step_num, total_steps, job=job)
+    audio_file = job_path(job['id'], 'main_audio.mp3')
+
+    duration = job_media(job)['duration']
+    segmented = segmented_transcription.should_segment(duration)
+
+    async with assemblyai_client.create_client() as client:
+        # The upload URL is kept so the per-clip subtitle transcriptions don't upload the audio again
+        upload = assemblyai_client.upload_file(client, audio_file)
+        if segmented:
+            # Find the silences to cut long audio at while it uploads
+            audio_url, silences = await asyncio.gather(
+                upload, asyncio.to_thread(segmented_transcription.detect_silences, audio_file))
+        else:
+            audio_url = await upload
+        try:
+            if segmented:
+                transcript = await segmented_transcription.transcribe_segmented(
+                    client, audio_url, duration, silences,
+                    on_progress=lambda fraction: progress.set_fraction(job['id'], fraction),
+                    language_code=job['options']['language_code'])
+            else:
+                transcript = await assemblyai_client.transcribe(client, audio_url, with_sentences=True,
+                                                                language_code=job['options']['language_code'])
+        except assemblyai_client.TranscriptionError as e:
+            raise RuntimeError(f"Transcription failed: {e}")
+
+    transcript_path = job_path(job['id'], 'transcript.json')
+    save_transcript(transcript, transcript_path)
+    return {'transcript': transcript_path, 'transcript_id': transcript['id'],
+            'audio_url': audio_url, 'uploaded_at': time.time()}
+
+def generate_raw_subtitles(job, step_num, total_steps):
+    """Step 4: Generate Raw Subtitles"""
+    log_progress("Generating subtitles", "Creating VTT subtitle file", step_num, total_steps, job=job)
+
+    def generate_subtitles_by_sentence(sentences):
+        output = ["WEBVTT\n"]
+        for sentence in sentences:
+            start_time = milliseconds_to_timecode(sentence['start'])
+            end_time = milliseconds_to_timecode(sentence['end'])
+            subtitle_text = sentence['text']
+            output.append("%s --> %s" % (start_time, end_time))
+            output.append(subtitle_text)
+            output.append("")
+        return output
+
+    vtt = generate_subtitles_by_sentence(load_transcript(job)['sentences'])
+    raw_transcript = job_path(job['id'], 'raw_transcript.vtt')
+    with open(raw_transcript, 'w') as o:
+        final = '\n'.join(vtt)
+        o.write(final)
+
+    return {'raw_transcript': raw_transcript}
+
+async def diarize_transcript(job, step_num, total_steps):
+    """Step 5: Speaker Diarization"""
+    log_progress("Speaker diarization", "Identifying different speakers in the audio", step_num, total_steps, job=job)
+    output_filename = job_path(job['id'], 'main_transcript.vtt')
+
+    async def diarize_audio(groq_client, audio_file_path, transcript_file_path):
+        try:
+            # Note: Groq doesn't directly support audio file uploads, so we'll work with the transcript only
+            transcript_content = read_file(transcript_file_path)
+            if not transcript_content:
                 return None
-        
-        def diarize_audio(audio_file_path, transcript_file_path):
-            try:
-                # Note: Groq doesn't directly support audio file uploads, so we'll work with the transcript only
-                transcript_content = read_file(transcript_file_path)
-                if not transcript_content:
-                    return None
-                
-                prompt = f"""You are an AI audio analysis expert specializing in speaker diarization.
 
-                Your task is to analyze the provided VTT transcript to determine who is speaking for each line of dialogue.
+            # One numbered line per cue; the model only answers with who speaks which lines
+            cues = compact_transcript.parse_vtt(transcript_content)
+            lines = compact_transcript.merge_lines(cues, max_seconds=0)
+            compact = compact_transcript.encode(lines, with_speakers=False)
+            print(f"[DEBUG] Diarization transcript: {len(compact)} characters instead of {len(transcript_content)} as VTT")
+
+            prompt = f"""You are an AI audio analysis expert specializing in speaker diarization.
+
+                Your task is to analyze the provided transcript to determine who is speaking for each line of dialogue.
+
+                {compact_transcript.format_description(with_speakers=False)}
 
                 **Follow these rules:**
                 1.  Analyze the content to identify the distinct speakers.
-                2.  Label them sequentially as "Speaker A," "Speaker B," and so on.
-                3.  Modify the input VTT content by adding the correct speaker label before each line of text. For example: `Gue yakin, hidup itu seperti matahari.` should become `Speaker A: Gue yakin, hidup itu seperti matahari.`
-                4.  Do not modify the timestamps or any other part of the VTT file. Your only job is to insert the speaker labels.
-                5.  Your final output should be the full, modified VTT content as a single block of text.
+                2.  Label them sequentially as "A", "B", and so on, in the order they first speak.
+                3.  Answer only with runs of consecutive lines spoken by the same speaker, one run per row, as `<first line>-<last line> <speaker>`. Cover every line from 0 to {len(lines) - 1}.
+                4.  Do not repeat the transcript text and do not add any explanation.
 
                 Here is the transcript:
                 ---
-                {transcript_content}
+                {compact}
                 ---
 
                 **Example Output:**
-                ```vtt
-                WEBVTT
+                0-1 A
+                2 B
+                3-7 A"""
+
+            # A row per speaker turn, far shorter than the transcript itself
+            response = await groq_response(groq_client, prompt, expected_output=4 * len(lines) + 64)
+            labels = compact_transcript.parse_speaker_runs(response.output_text, len(lines))
+            if not any(labels):
+                print("[WARNING] Diarization returned no speaker labels")
+                return None
 
-                00:00:00.008 --> 00:00:03.228
-                Speaker A: Gue yakin, hidup itu seperti matahari.
+            # Timestamps come from the raw transcript, never from the model
+            try:
+                with open(output_filename, "w", encoding="utf-8") as f:
+                    f.write(compact_transcript.labelled_vtt(
+                        cues, compact_transcript.cue_labels(lines, labels, len(cues))))
+            except Exception as e:
+                print(f"Error saving file: {e}")
 
-                00:00:03.228 --> 00:00:07.008
-                Speaker A: Ya, kadang terbit, kadang juga terbenam.
+        except Exception as e:
+            print(f"Error in diarization: {e}")
+            return None
 
-                00:00:07.008 --> 00:00:10.247
-                Speaker B: Dan bagaimana kamu menyikapi hal itu?
-                ```"""
+    async with get_groq_client() as groq_client:
+        await diarize_audio(groq_client, job_path(job['id'], 'main_audio.mp3'), job_path(job['id'], 'raw_transcript.vtt'))
+    return {'main_transcript': output_filename}
 
-                response = groq_client.responses.create(
-                    model="meta-llama/llama-4-scout-17b-16e-instruct",
-                    input=[{"role": "user", "content": prompt}]
-                )
-                
-                output_filename = "main_transcript.vtt"
-                try:
-                    with open(output_filename, "w", encoding="utf-8") as f:
-                        f.write(response.output_text)
-                except Exception as e:
-                    print(f"Error saving file: {e}")
-                    
-            except Exception as e:
-                print(f"Error in diarization: {e}")
-                return None
-        
-        diarize_audio("main_audio.mp3", "raw_transcript.vtt")
-        
-        # Step 6: Analyze Transcript and Get Clips
-        current_step += 1
-        log_progress("Analyzing transcript", "Finding the best segments for viral clips", current_step, total_steps)
-        
-        def analyze_transcript(vtt_content):
-            prompt = f"""
+async def analyze_clips(job, step_num, total_steps):
+    """Step 6: Analyze Transcript and Get Clips"""
+    import candidates
+
+    log_progress("Analyzing transcript", "Finding the best segments for viral clips", step_num, total_steps, job=job)
+
+    async def analyze_transcript(groq_client, vtt_content, on_clip):
+        prompt = f"""
             You are a world-class short-form viral video producer and editor with a deep understanding of narrative structure and audience retention. Your primary goal is to analyze the following transcript and extract segments that feel like **complete, satisfying mini-stories** or thoughts, avoiding clips that feel cut off or incomplete. The segments will be turned into short-form videos (like TikToks, Reels, Shorts).
 
             First, analyze the overall tone and topic of the transcript (e.g., 'Comedy Interview', 'Tech Tutorial', 'Motivational Speech').
@@ -450,13 +671,11 @@ def process_video_complete(video_source, source_type='url', language="Indonesian
                     * A clear "before and after" transformation.
                     * An emotional story.
 
-            4.  **Provide Timestamps:** Use the timestamps from the transcript to provide the exact start and end time for each proposed clip.
+            4.  **Provide Line Numbers:** {compact_transcript.format_description()} Give the number of the first and the last transcript line of each proposed clip; the clip runs from the start of the first line to the end of the last. Use the seconds to judge clip length.
 
-            5.  **Strict Timestamp Formatting:** The start_time and end_time values must strictly adhere to the HH:MM:SS.mmm format. Always include two digits for the hour, even if they are zero. For example, use 00:01:23.456 and never 01:23.456.
+            5.  **Language Consistency:** The clip_title and summary values must be written in the same language as the source transcript. Do not translate them. If the transcript is in Indonesian, the title and summary must also be in Indonesian.
 
-            6.  **Language Consistency:** The clip_title and summary values must be written in the same language as the source transcript. Do not translate them. If the transcript is in Indonesian, the title and summary must also be in Indonesian.
-
-            7.  **Point of View (Conditional & Intelligent):** The summary's point of view depends on the number of unique speakers identified *within that specific clip*:
+            6.  **Point of View (Conditional & Intelligent):** The summary's point of view depends on the number of unique speakers identified *within that specific clip*:
                 * **If a clip contains only one speaker:** Write a detailed summary in the **first-person** from that speaker's perspective. The summary should be 2-3 sentences long and include:
                     - The main topic or argument being discussed
                     - Any key examples or analogies used
@@ -471,536 +690,959 @@ def process_video_complete(video_source, source_type='url', language="Indonesian
                         - Any conclusions or agreements reached
                     - If you cannot confidently identify their names,** fall back to using the provided labels (e.g., "Speaker A asks about X, and Speaker B responds...").
 
-            8.  **Final Quality Check:** Before finalizing your JSON output, review each suggested clip. Ask yourself: "If I were a user, would this clip feel abrupt or incomplete?" If the answer is yes, adjust the timestamps to include the necessary context.
+            7.  **Final Quality Check:** Before finalizing your JSON output, review each suggested clip. Ask yourself: "If I were a user, would this clip feel abrupt or incomplete?" If the answer is yes, widen its line range to include the necessary context.
 
-            9.  **Output in JSON:** Format your entire response as a single, valid JSON array. Each object must contain these exact keys: "clip_title", "start_time", "end_time", "summary", and "full_text". The "full_text" should be the complete text of that specific segment.
+            8.  **Output in JSON:** Format your entire response as a single, valid JSON array. Each object must contain these exact keys: "clip_title", "start_line", "end_line" and "summary", with the line numbers as integers.
 
             Here is the transcript:
             ---
             {vtt_content}
             ---
             """
-            
+
+        # Each clip object is handed to on_clip as soon as the model has finished writing it
+        parser = ClipStreamParser()
+        chunks = []
+        parsed = 0
+        started = time.time()
+        try:
+            async for delta in groq_stream(groq_client, prompt, expected_output=2048):
+                chunks.append(delta)
+                for clip_info in parser.feed(delta):
+                    if not parsed:
+                        print(f"[DEBUG] First clip parsed {time.time() - started:.1f}s into the analysis response")
+                    parsed += 1
+                    on_clip(clip_info)
+        except Exception as e:
+            print(f"An error occurred during the API call or JSON parsing: {e}")
+            if parsed:
+                print(f"[WARNING] Analysis stopped early; keeping the {parsed} clips received")
+            return
+
+        if not parsed:
+            # Output the streaming parser couldn't follow; parse the whole response instead
             try:
-                response = groq_client.responses.create(
-                    model="meta-llama/llama-4-scout-17b-16e-instruct",
-                    input=[{"role": "user", "content": prompt}]
-                )
-
-                # Extract JSON from the response
-                response_text = response.output_text.strip()
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].strip()
-                
-                suggested_clips = json.loads(response_text)
-                return suggested_clips
+                suggested_clips = parse_clips_json(''.join(chunks))
             except Exception as e:
                 print(f"An error occurred during the API call or JSON parsing: {e}")
-                return None
-        
-        transcript_content = read_file("main_transcript.vtt")
-        clips = analyze_transcript(transcript_content)
-        
-        if not clips:
-            raise RuntimeError("Failed to generate clips")
-        
-        # Step 7: Create Video Clips
-        current_step += 1
-        log_progress("Creating video clips", f"Cutting {len(clips)} video segments", current_step, total_steps)
-        
-        def create_video_clips(video_path, clips_to_generate, output_folder="output_clips"):
-            if not os.path.exists(video_path):
-                raise RuntimeError(f"Source video not found at '{video_path}'")
-            
-            if not os.path.exists(output_folder):
-                os.makedirs(output_folder)
-            
-            try:
-                source_video = VideoFileClip(video_path)
-            except Exception as e:
-                raise RuntimeError(f"Error loading video file: {e}")
-            
-            for i, clip_info in enumerate(clips_to_generate):
-                clip_title = clip_info.get("clip_title", f"clip_{i+1}")
-                start_time_str = clip_info.get("start_time")
-                end_time_str = clip_info.get("end_time")
-
-                start = time_to_seconds(start_time_str)
-                end = time_to_seconds(end_time_str)
-                
-                safe_filename = "".join(c for c in clip_title if c.isalnum() or c in (' ', '_')).rstrip()
-                output_path = os.path.join(output_folder, f"{i+1}_{safe_filename}.mp4")
-                
-                try:
-                    print(f"[DEBUG] Creating clip {i+1}: '{clip_title}' from {start}s to {end}s")
-                    
-                    # Validate time range
-                    if start >= end or start < 0:
-                        print(f"[ERROR] Invalid time range for clip {i+1}: start={start}, end={end}")
-                        continue
-                    
-                    # Ensure end time doesn't exceed video duration
-                    video_duration = source_video.duration
-                    if end > video_duration:
-                        print(f"[WARNING] End time {end}s exceeds video duration {video_duration}s, adjusting")
-                        end = video_duration - 0.1  # Leave small buffer
-                    
-                    # original_clip = source_video.subclip(start, end)
-                    original_clip = source_video.subclipped(start, end)
-                    
-                    w, h = original_clip.size
-                    print(f"[DEBUG] Original clip size: {w}x{h}, duration: {original_clip.duration}")
-                    
-                    # Validate clip dimensions and duration
-                    if w <= 0 or h <= 0:
-                        print(f"[ERROR] Invalid dimensions for clip {i+1}: {w}x{h}")
-                        original_clip.close()
-                        continue
-                    
-                    if original_clip.duration <= 0:
-                        print(f"[ERROR] Invalid duration for clip {i+1}: {original_clip.duration}")
-                        original_clip.close()
-                        continue
-                    
-                    # Apply aspect ratio cropping
-                    if aspect_ratio == "9:16":
-                        target_width = int(h * 9 / 16)
-                        if target_width > w:
-                            print(f"[WARNING] Target width ({target_width}) > source width ({w}), using original")
-                            final_clip = original_clip
-                        else:
-                            x_center = w // 2
-                            x1 = max(0, x_center - target_width // 2)
-                            x2 = min(w, x_center + target_width // 2)
-                            # final_clip = Crop(original_clip, x1=x1, x2=x2)
-                            final_clip = original_clip.with_effects([Crop(x1=x1, x2=x2)])
-                    elif aspect_ratio == "16:9":
-                        target_height = int(w * 9 / 16)
-                        if target_height > h:
-                            print(f"[WARNING] Target height ({target_height}) > source height ({h}), using original")
-                            final_clip = original_clip
-                        else:
-                            y_center = h // 2
-                            y1 = max(0, y_center - target_height // 2)
-                            y2 = min(h, y_center + target_height // 2)
-                            # final_clip = Crop(original_clip, y1=y1, y2=y2)
-                            final_clip = original_clip.with_effects([Crop(y1=y1, y2=y2)])
-                    else:
-                        final_clip = original_clip
-                    
-                    print(f"[DEBUG] Final clip size: {final_clip.size}, duration: {final_clip.duration}")
-                    
-                    # Apply fade effects 
-                    try:
-                        if final_clip.duration > 1.0:  
-                            fade_duration = min(0.5, final_clip.duration / 4)  
-                            print(f"[DEBUG] Adding fade effects with duration: {fade_duration}")
-                            # final_clip = FadeIn(final_clip, duration=fade_duration)
-                            # final_clip = FadeOut(final_clip, duration=fade_duration)
-                            final_clip = final_clip.with_effects([
-                                FadeIn(duration=fade_duration),
-                                FadeOut(duration=fade_duration)
-                            ])
-                        else:
-                            print(f"[DEBUG] Clip too short for fade effects, skipping fades")
-                    except Exception as fade_error:
-                        print(f"[WARNING] Fade effects failed: {fade_error}, proceeding without fades")
-                    
-                    print(f"[DEBUG] Writing video file: {output_path}")
-                    
-                    # first attempt
-                    try:
-                        final_clip.write_videofile(
-                            output_path, 
-                            codec="libx264", 
-                            preset="medium", 
-                            logger=None,
-                            threads=2 
-                        )
-                        print(f"[SUCCESS] Clip {i+1} created successfully: {output_path}")
-                    except Exception as write_error:
-                        print(f"[ERROR] Failed to write video file: {write_error}")
-
-                        # second attempt
-                        try:
-                            print(f"[DEBUG] Retrying with different codec settings...")
-                            final_clip.write_videofile(
-                                output_path, 
-                                codec="libx264", 
-                                preset="fast",
-                                logger=None,
-                                threads=2 
-                            )
-                            print(f"[SUCCESS] Clip {i+1} created successfully on retry: {output_path}")
-                        except Exception as retry_error:
-                            print(f"[ERROR] Retry also failed: {retry_error}")
-                            raise retry_error
-                    
-                    final_clip.close()
-                    original_clip.close()
-                    
-                except Exception as e:
-                    print(f"[ERROR] Error creating clip '{clip_title}': {e}")
-                    print(f"[ERROR] Exception type: {type(e).__name__}")
-                    import traceback
-                    print(f"[ERROR] Full traceback:\n{traceback.format_exc()}")
-                    
-                    # Clean up any open clips
-                    try:
-                        if 'original_clip' in locals():
-                            original_clip.close()
-                        if 'final_clip' in locals() and final_clip != original_clip:
-                            final_clip.close()
-                    except:
-                        pass
-                    continue
-            
-            source_video.close()
-        
-        create_video_clips('main_video.mp4', clips)
-        
-        # Handle subtitles
-        if include_subtitles:
-            # Step 8: Create Subtitles
-            current_step += 1
-            log_progress("Creating subtitles", "Generating word-level subtitles for each clip", current_step, total_steps)
-
-            def time_to_ms(time_str):
-                parts = time_str.split(':')
-                if len(parts) == 3:
-                    h, m, s_ms = parts
-                    s, ms = s_ms.split('.')
-                    return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(ms[:3])
-                else:
-                    try:
-                        t = datetime.strptime(time_str, "%H:%M:%S.%f")
-                        return (t.hour * 3600 + t.minute * 60 + t.second) * 1000 + int(t.microsecond / 1000)
-                    except ValueError:
-                        return 0
-
-            def milliseconds_to_timecode(ms: int) -> str:
-                seconds = ms / 1000.0
-                hour, seconds = divmod(seconds, 3600)
-                minute, seconds = divmod(seconds, 60)
-                second, millisecond = divmod(seconds, 1)
-                millisecond = int(millisecond * 1000)
-                return '%.2d:%.2d:%.2d.%.3d' % (int(hour), int(minute), int(second), millisecond)
-
-            def generate_word_level_subtitles(transcript, clip_start_ms):
-                output = ["WEBVTT\n"]
-
-                if not hasattr(transcript, 'words'):
-                    print("Error: Transcript object does not contain word timestamps.")
-                    return output
-
-                for word in transcript.words:
-                    adjusted_start_ms = word.start - clip_start_ms
-                    adjusted_end_ms = word.end - clip_start_ms
-                    adjusted_start_ms = max(0, adjusted_start_ms)
-                    adjusted_end_ms = max(0, adjusted_end_ms)
-
-                    start_timecode = milliseconds_to_timecode(adjusted_start_ms)
-                    end_timecode = milliseconds_to_timecode(adjusted_end_ms)
-                    word_text = word.text
-
-                    output.append("%s --> %s" % (start_timecode, end_timecode))
-                    output.append(word_text)
-                    output.append("")
-
-                return output
-
-            output_subtitle_folder = "output_subtitles"
-            if not os.path.exists(output_subtitle_folder):
-                os.makedirs(output_subtitle_folder)
-
-            for i, clip_info in enumerate(clips):
-                clip_title = clip_info.get("clip_title", f"clip_{i+1}")
-                start = clip_info.get("start_time")
-                end = clip_info.get("end_time")
-
-                if not start or not end:
-                    continue
-
-                start_ms = time_to_ms(start)
-                end_ms = time_to_ms(end)
+                return
+            for clip_info in suggested_clips if isinstance(suggested_clips, list) else []:
+                if isinstance(clip_info, dict):
+                    on_clip(clip_info)
+
+    # Fall back to the raw transcript if diarization didn't produce one
+    main_transcript = job_path(job['id'], 'main_transcript.vtt')
+    if not os.path.exists(main_transcript):
+        main_transcript = job_path(job['id'], 'raw_transcript.vtt')
+    transcript_content = read_file(main_transcript)
+
+    # The model sees numbered compact lines and answers with line numbers; on long sources
+    # only the best locally scored windows are sent
+    cues = compact_transcript.parse_vtt(transcript_content)
+    lines = compact_transcript.merge_lines(cues)
+    if candidates.should_prerank(cues):
+        prompt_content = candidates.build_candidate_transcript(cues, lines)
+        print(f"[INFO] Pre-ranked {len(cues)} subtitle lines; sending {len(prompt_content)} "
+              f"of {len(transcript_content)} characters to the LLM")
+    else:
+        prompt_content = compact_transcript.encode(lines)
+        print(f"[INFO] Sending {len(lines)} transcript lines in {len(prompt_content)} characters "
+              f"({len(transcript_content)} as VTT)")
+    transcript_content = prompt_content
+
+    # Clips (and renders) left by an interrupted earlier analysis may not match what this run returns
+    job['clips'] = []
+    reset_stages(job, ['clips'])
+
+    # Index word timings once and snap clip boundaries onto them
+    word_timeline = WordTimeline.from_words(load_transcript(job)['words'])
+
+    loop = asyncio.get_running_loop()
+    video_path = job_path(job['id'], 'main_video.mp4')
+    ratios = job_aspect_ratios(job['options'])
+    renders = []
+    if STREAM_RENDER:
+        output_folder = job_path(job['id'], 'output_clips')
+        shutil.rmtree(output_folder, ignore_errors=True)
+        os.makedirs(output_folder)
+        media = await loop.run_in_executor(IO_EXECUTOR, job_media, job)
+
+    async def render_streamed_clip(i, clip_info):
+        # Failures are left to Step 7, which renders every clip not marked done
+        try:
+            target = clip_render_target(i, clip_info, ratios, output_folder, media['duration'])
+            if target is None:
+                return
+            _, start, end, output_paths = target
+            cached = await loop.run_in_executor(IO_EXECUTOR, fetch_cached_clip, job, target, ratios)
+            if not cached:
+                # The analysis stage holds an API slot; the encode needs a CPU slot like any clips stage
+                gate = current_stage_gate.get()
+                async with gate('clips', remaining_work_seconds(job)) if gate else nullcontext():
+                    await loop.run_in_executor(RENDER_EXECUTOR, lambda: render_clip(
+                        video_path, start, end, ratios, output_paths,
+                        on_progress=lambda fraction: progress.set_clip_progress(job['id'], i, fraction)))
+                await loop.run_in_executor(IO_EXECUTOR, cache_rendered_clip, job, target, ratios)
+        except Exception as e:
+            print(f"[WARNING] Early render of clip {i+1} failed, it will be retried with the other clips: {e}")
+            return
+        print(f"[SUCCESS] Clip {i+1} created while the analysis continues: {', '.join(output_paths)}")
+        mark_clip_done(job, 'clips', i, output_paths[0])
+
+    def add_clip(clip_info):
+        i = len(job['clips'])
+        if compact_transcript.resolve_clip(clip_info, lines) is None:
+            print(f"[WARNING] Skipping a clip without valid transcript lines: {clip_info}")
+            return
+        try:
+            # A model that answered with timestamps instead of line numbers may have garbled them
+            time_to_ms(clip_info['start_time']), time_to_ms(clip_info['end_time'])
+        except ValueError as e:
+            print(f"[WARNING] Skipping a clip with an unreadable time range: {e}")
+            return
+        snap_clips_to_words([clip_info], word_timeline, first_index=i)
+        # The text comes from the words, not from the model
+        if len(word_timeline):
+            clip_info['full_text'] = word_timeline.text_between(*word_timeline.index_range(
+                time_to_ms(clip_info['start_time']), time_to_ms(clip_info['end_time'])))
+        job['clips'].append(clip_info)
+        if STREAM_RENDER:
+            renders.append(asyncio.ensure_future(render_streamed_clip(i, clip_info)))
 
-                print(f"   Creating subtitles for clip {i+1}/{len(clips)}: {clip_title}")
+    try:
+        async with get_groq_client() as groq_client:
+            await analyze_transcript(groq_client, transcript_content, add_clip)
+    finally:
+        # Renders run in worker threads and can't be abandoned halfway
+        await asyncio.gather(*renders)
+
+    if not job['clips']:
+        raise RuntimeError("Failed to generate clips")
+
+    return {'clip_count': len(job['clips'])}
+
+def job_aspect_ratios(options):
+    """The aspect ratios a job renders, first one primary (jobs from before multi-ratio have only aspect_ratio)"""
+    return options.get('aspect_ratios') or [options['aspect_ratio']]
+
+def clip_video_name(index, clip_info, ratio, ratios):
+    """File name of a clip rendered in one of the job's aspect ratios"""
+    return f"{clip_basename(index, clip_info)}{ratio_suffix(ratio, ratios[0])}.mp4"
+
+def clip_render_target(index, clip_info, ratios, output_folder, video_duration=None):
+    """(clip index, start, end, output paths) for rendering a clip, or None if its time range is invalid"""
+    clip_title = clip_info.get("clip_title", f"clip_{index+1}")
+    start = time_to_seconds(clip_info.get("start_time"))
+    end = time_to_seconds(clip_info.get("end_time"))
+    output_paths = [os.path.join(output_folder, clip_video_name(index, clip_info, ratio, ratios)) for ratio in ratios]
+
+    print(f"[DEBUG] Clip {index+1}: '{clip_title}' from {start}s to {end}s in {', '.join(ratios)}")
+
+    # Validate time range
+    if start >= end or start < 0:
+        print(f"[ERROR] Invalid time range for clip {index+1}: start={start}, end={end}")
+        return None
+
+    # Ensure end time doesn't exceed video duration
+    if video_duration and end > video_duration:
+        print(f"[WARNING] End time {end}s exceeds video duration {video_duration}s, adjusting")
+        end = video_duration - 0.1  # Leave small buffer
+
+    return (index, start, end, output_paths)
+
+def create_video_clips(job, step_num, total_steps):
+    """Step 7: Create Video Clips"""
+    clips_to_generate = job['clips']
+    ratios = job_aspect_ratios(job['options'])
+    log_progress("Creating video clips", f"Cutting {len(clips_to_generate)} video segments", step_num, total_steps, job=job)
+
+    video_path = job_path(job['id'], 'main_video.mp4')
+    output_folder = job_path(job['id'], 'output_clips')
+
+    if not os.path.exists(video_path):
+        raise RuntimeError(f"Source video not found at '{video_path}'")
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    media = job_media(job)
+    video_duration = media['duration']
+
+    # (clip index, start, end, output paths) for every clip that still needs rendering
+    pending = []
+    for i, clip_info in enumerate(clips_to_generate):
+        output_paths = [os.path.join(output_folder, clip_video_name(i, clip_info, ratio, ratios)) for ratio in ratios]
+
+        # Clips already rendered while the analysis was streaming, or before an interruption
+        if clip_done(job, 'clips', i) and all(os.path.exists(path) for path in output_paths):
+            print(f"[INFO] Clip {i+1} already created, skipping: {output_paths[0]}")
+            continue
+
+        target = clip_render_target(i, clip_info, ratios, output_folder, video_duration)
+        if target is None:
+            continue
+        if fetch_cached_clip(job, target, ratios):
+            mark_clip_done(job, 'clips', i, output_paths[0])
+            continue
+        pending.append(target)
+
+    # Stage progress weighs each clip by its length
+    clip_lengths = {i: end - start for i, start, end, _ in pending}
+    clip_fractions = dict.fromkeys(clip_lengths, 0.0)
+
+    def report(i, fraction):
+        clip_fractions[i] = fraction
+        progress.set_clip_progress(job['id'], i, fraction)
+        done = sum(clip_fractions[k] * clip_lengths[k] for k in clip_lengths)
+        progress.set_fraction(job['id'], done / max(sum(clip_lengths.values()), 0.001))
+
+    def render_one(i, start, end, output_paths):
+        try:
+            # One decode of the segment, one encoder per aspect ratio
+            render_clip(video_path, start, end, ratios, output_paths, on_progress=lambda fraction: report(i, fraction))
+            cache_rendered_clip(job, (i, start, end, output_paths), ratios)
+            print(f"[SUCCESS] Clip {i+1} created successfully: {', '.join(output_paths)}")
+            mark_clip_done(job, 'clips', i, output_paths[0])
+        except Exception as e:
+            print(f"[ERROR] Error creating clip {i+1}: {e}")
 
-                clip_config = aai.TranscriptionConfig(speech_model=aai.SpeechModel.universal,
-                                                      language_code=language_code,
-                                                      audio_start_from=start_ms,
-                                                      audio_end_at=end_ms)
+    if RENDER_MODE != 'batch':
+        for clip in pending:
+            render_one(*clip)
+        return {'output_folder': output_folder}
 
-                try:
-                    transcript = aai.Transcriber(config=clip_config).transcribe(audio_file)
+    # Batch mode: clips in source order, up to BATCH_SIZE per ffmpeg process reading the source once
+    pending.sort(key=lambda clip: clip[1])
+    for b in range(0, len(pending), BATCH_SIZE):
+        batch = pending[b:b + BATCH_SIZE]
+        print(f"[DEBUG] Rendering clips {', '.join(str(i + 1) for i, _, _, _ in batch)} in one pass")
 
-                    if transcript.status == "error":
-                        continue
+        def report_batch(fractions, batch=batch):
+            for (i, _, _, _), fraction in zip(batch, fractions):
+                report(i, fraction)
 
-                    clip_start_ms = time_to_ms(start)
-                    vtt = generate_word_level_subtitles(transcript, clip_start_ms)
+        try:
+            render_clips(video_path, [(start, end, paths) for _, start, end, paths in batch], ratios,
+                         has_audio=media['has_audio'], on_progress=report_batch)
+            for target in batch:
+                cache_rendered_clip(job, target, ratios)
+            for i, _, _, output_paths in batch:
+                print(f"[SUCCESS] Clip {i+1} created successfully: {', '.join(output_paths)}")
+                mark_clip_done(job, 'clips', i, output_paths[0])
+        except Exception as e:
+            # Retry one by one so a single bad clip doesn't lose the whole batch
+            print(f"[WARNING] Batch render failed, rendering clips separately: {e}")
+            for clip in batch:
+                render_one(*clip)
 
-                    if vtt:
-                        safe_filename = "".join(c for c in clip_title if c.isalnum() or c in (' ', '_')).rstrip()
-                        output_path = os.path.join(output_subtitle_folder, f"{i+1}_{safe_filename}_word.vtt")
+    return {'output_folder': output_folder}
 
-                        with open(output_path, 'w') as o:
-                            final = '\n'.join(vtt)
-                            o.write(final)
+def load_clip_words(words_path, start_ms, end_ms):
+    """Clip-relative words saved by an earlier subtitle run for the same clip range, or None"""
+    try:
+        with open(words_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if saved.get('start_ms') != start_ms or saved.get('end_ms') != end_ms:
+        return None
+    return [tuple(word) for word in saved['words']]
+
+def save_clip_words(words_path, start_ms, end_ms, clip_words):
+    with open(words_path, 'w', encoding='utf-8') as f:
+        json.dump({'start_ms': start_ms, 'end_ms': end_ms, 'words': clip_words}, f, ensure_ascii=False)
+
+async def create_clip_subtitles(job, step_num, total_steps):
+    """Step 8: Create Subtitles"""
+    log_progress("Creating subtitles", "Generating word-level subtitles for each clip", step_num, total_steps, job=job)
+    options = job['options']
+    clips = job['clips']
+    audio_file = job_path(job['id'], 'main_audio.mp3')
+
+    output_subtitle_folder = job_path(job['id'], 'output_subtitles')
+    if not os.path.exists(output_subtitle_folder):
+        os.makedirs(output_subtitle_folder)
+
+    def clip_words_in(timeline, start_ms, end_ms):
+        # Only words that start inside the clip; anything outside is skipped, not clamped to 0
+        return [(word_start - start_ms, word_end - start_ms, word_text)
+                for word_start, word_end, word_text in timeline.words_between(start_ms, end_ms)]
+
+    def write_clip_subtitles(i, output_path, clip_words):
+        write_ass(output_path, clip_words,
+                  max_words=options['subtitle_words_per_line'],
+                  highlight=options['subtitle_highlight'])
+        mark_clip_done(job, 'subtitles', i, output_path)
+
+    # Clips whose words are already known (a re-render) are written locally; the rest are transcribed
+    to_transcribe = []
+    main_timeline = None
+    for i, clip_info in enumerate(clips):
+        clip_title = clip_info.get("clip_title", f"clip_{i+1}")
+        start = clip_info.get("start_time")
+        end = clip_info.get("end_time")
+
+        if not start or not end:
+            continue
+
+        base_filename = clip_basename(i, clip_info)
+        output_path = os.path.join(output_subtitle_folder, f"{base_filename}.ass")
+        words_path = os.path.join(output_subtitle_folder, f"{base_filename}.words.json")
+        if clip_done(job, 'subtitles', i) and os.path.exists(output_path):
+            print(f"   Subtitles for clip {i+1} already created, skipping")
+            continue
+
+        start_ms = time_to_ms(start)
+        end_ms = time_to_ms(end)
+
+        clip_words = load_clip_words(words_path, start_ms, end_ms)
+        if clip_words is None and options.get('subtitles_from_transcript'):
+            if main_timeline is None:
+                main_timeline = WordTimeline.from_words(load_transcript(job)['words'])
+            clip_words = clip_words_in(main_timeline, start_ms, end_ms)
+            save_clip_words(words_path, start_ms, end_ms, clip_words)
+
+        if clip_words is not None:
+            print(f"   Creating subtitles for clip {i+1}/{len(clips)} from stored words: {clip_title}")
+            write_clip_subtitles(i, output_path, clip_words)
+        else:
+            to_transcribe.append((i, clip_title, start_ms, end_ms, output_path, words_path))
 
-                except Exception as e:
-                    print(f"   Error processing subtitles for clip {i+1}: {e}")
+    async def subtitle_clip(client, audio_url, i, clip_title, start_ms, end_ms, output_path, words_path):
+        print(f"   Creating subtitles for clip {i+1}/{len(clips)}: {clip_title}")
 
-            print("✅ Subtitles created successfully!")
+        try:
+            transcript = await assemblyai_client.transcribe(client, audio_url,
+                                                            language_code=options['language_code'],
+                                                            audio_start_from=start_ms,
+                                                            audio_end_at=end_ms)
 
-            # Step 9: Apply Subtitles and Watermark
-            current_step += 1
-            log_progress("Finalizing clips", "Adding subtitles and watermark to video clips", current_step, total_steps)
+            clip_words = clip_words_in(WordTimeline.from_words(transcript['words']), start_ms, end_ms)
+            save_clip_words(words_path, start_ms, end_ms, clip_words)
+            write_clip_subtitles(i, output_path, clip_words)
 
-            # Convert VTT to ASS and apply styling
-            custom_style = """[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,Montserrat,16,&H00FFFFFF,&H000000FF,&H00000000,&H64000000,-1,0,0,0,100,100,0,0,1,2,2,2,50,50,40,1
-"""
+        except Exception as e:
+            print(f"   Error processing subtitles for clip {i+1}: {e}")
+
+    if to_transcribe:
+        async with assemblyai_client.create_client() as client:
+            # Reuse the upload from Step 3 unless the job was resumed long after it
+            transcribed = stage_outputs(job, 'transcribe')
+            audio_url = transcribed.get('audio_url')
+            if not audio_url or time.time() - transcribed.get('uploaded_at', 0) > UPLOAD_REUSE_SECONDS:
+                audio_url = await assemblyai_client.upload_file(client, audio_file)
+
+            # Submit every clip's transcription at once and wait on them together
+            await asyncio.gather(*(subtitle_clip(client, audio_url, *clip) for clip in to_transcribe))
+
+    print("✅ Subtitles created successfully!")
+    return {'output_folder': output_subtitle_folder}
+
+def finalize_clips(job, step_num, total_steps):
+    """Step 9: Apply subtitles and/or watermark, or copy clips to the final folder"""
+    options = job['options']
+    include_subtitles = options['include_subtitles']
+    include_watermark = options['include_watermark']
+    watermark_text = options['watermark_text']
+
+    if include_subtitles:
+        log_progress("Finalizing clips", "Adding subtitles and watermark to video clips", step_num, total_steps, job=job)
+    elif include_watermark:
+        log_progress("Adding watermark", "Adding watermark to video clips", step_num, total_steps, job=job)
+
+    font_path = "styles/arial.ttf"
+    output_folder_clips = job_path(job['id'], 'output_clips')
+    output_subtitle_folder = job_path(job['id'], 'output_subtitles')
+    output_folder_final = job_path(job['id'], 'output_clips_final')
+
+    if not os.path.exists(output_folder_final):
+        os.makedirs(output_folder_final)
+
+    ratios = job_aspect_ratios(options)
+    clips = job['clips']
+    for i, clip_info in enumerate(clips):
+        base_filename = clip_basename(i, clip_info)
+        input_subtitle_path = os.path.join(output_subtitle_folder, f"{base_filename}.ass")
+        # One (input, output) pair per aspect ratio the clip was rendered in
+        videos = []
+        for ratio in ratios:
+            video_name = clip_video_name(i, clip_info, ratio, ratios)
+            videos.append((os.path.join(output_folder_clips, video_name),
+                           os.path.join(output_folder_final, video_name[:-len('.mp4')] + '_final.mp4')))
+
+        if not os.path.exists(videos[0][0]):
+            print(f"[DEBUG] Skipping {base_filename} - no matching video file")
+            continue
+
+        if clip_done(job, 'final', i) and all(os.path.exists(output) for _, output in videos):
+            print(f"   Clip {i+1} already finalized, skipping")
+            continue
+
+        filters = []
+        subtitle_hash = None
+        if include_subtitles:
+            if os.path.exists(input_subtitle_path):
+                subtitle_hash = render_cache.file_hash(input_subtitle_path) if render_cache.ENABLED else None
+                escaped_subtitle_path = input_subtitle_path.replace('\\', '/')
+                filters.append(f"ass='{escaped_subtitle_path}'")
+            else:
+                print(f"[WARNING] No subtitles for {base_filename}, finalizing without them")
+        if include_watermark:
+            filters.append(f"drawtext=text='{watermark_text}':fontfile='{font_path}':fontcolor=white@0.5:fontsize=10:x=(w-text_w)/2:y=h-text_h-15")
 
-            subtitle_files = [f for f in os.listdir(output_subtitle_folder) if f.endswith('_word.vtt')]
+        clip_seconds = max(time_to_seconds(clip_info.get("end_time")) - time_to_seconds(clip_info.get("start_time")), 0.001)
+        for n, (input_video_path, output_video_path) in enumerate(videos):
+            if not os.path.exists(input_video_path):
+                continue
 
-            for subtitle_file in subtitle_files:
-                base_filename = subtitle_file.replace('_word.vtt', '')
-                input_vtt_path = os.path.join(output_subtitle_folder, subtitle_file)
-                output_ass_path = os.path.join(output_subtitle_folder, f"{base_filename}.ass")
+            # The old output may be a hardlink shared with the render cache; never write through it
+            remove_outputs([output_video_path])
 
-                try:
-                    subprocess.run([
-                        'ffmpeg', '-i', input_vtt_path, output_ass_path, '-y'
-                    ], capture_output=True, text=True, check=True)
-                except subprocess.CalledProcessError as e:
-                    print(f"FFmpeg VTT to ASS conversion failed for {subtitle_file}: {e.stderr}")
-                    continue
-                except FileNotFoundError:
-                    print("FFmpeg not found for subtitle conversion.")
+            if not filters:
+                # Copy clips to final folder
+                shutil.copy2(input_video_path, output_video_path)
+                continue
+
+            final_key = None
+            if render_cache.ENABLED:
+                final_key = render_cache.cache_key(kind='final', clip=render_cache.file_hash(input_video_path),
+                                                   subtitles=subtitle_hash, font=font_path, renderer=renderer_version(),
+                                                   watermark=watermark_text if include_watermark else None)
+                if render_cache.fetch(final_key, output_video_path):
+                    print(f"   Clip {i+1}/{len(clips)} served from the render cache: {os.path.basename(output_video_path)}")
                     continue
 
-                if os.path.exists(output_ass_path):
-                    try:
-                        with open(output_ass_path, "r", encoding="utf-8") as f:
-                            lines = f.readlines()
-
-                        new_lines = []
-                        inside_style_block = False
-                        for line in lines:
-                            if line.strip().startswith("[V4+ Styles]"):
-                                new_lines.append(custom_style + "\n")
-                                inside_style_block = True
-                            elif line.strip().startswith("[Events]"):
-                                new_lines.append(line)
-                                inside_style_block = False
-                            elif not inside_style_block:
-                                new_lines.append(line)
-
-                        with open(output_ass_path, "w", encoding="utf-8") as f:
-                            f.writelines(new_lines)
-
-                    except Exception as e:
-                        print(f"   Error styling subtitles: {e}")
-
-            # Apply subtitles and watermark to final videos
-            output_folder_clips = "output_clips"
-            output_folder_final = "output_clips_final"
-
-            if not os.path.exists(output_folder_final):
-                os.makedirs(output_folder_final)
-
-            subtitle_files = [f for f in os.listdir(output_subtitle_folder) if f.endswith('.ass')]
-
-            print(f"[DEBUG] Found {len(subtitle_files)} subtitle files: {subtitle_files}")
-            print(f"[DEBUG] Looking for clips in: {output_folder_clips}")
-            if os.path.exists(output_folder_clips):
-                clip_files = [f for f in os.listdir(output_folder_clips) if f.endswith('.mp4')]
-                print(f"[DEBUG] Found {len(clip_files)} clip files: {clip_files}")
-            else:
-                print(f"[DEBUG] Clips folder doesn't exist: {output_folder_clips}")
+            print(f"   Finalizing clip {i+1}/{len(clips)}: {os.path.basename(input_video_path)}")
 
-            for i, subtitle_file in enumerate(subtitle_files):
-                base_filename = subtitle_file.replace('.ass', '')
-                input_video_path = os.path.join(output_folder_clips, f"{base_filename}.mp4")
-                input_subtitle_path = os.path.join(output_subtitle_folder, subtitle_file)
-                output_video_path = os.path.join(output_folder_final, f"{base_filename}_final.mp4")
+            def report(position, i=i, n=n):
+                fraction = (n + min(1.0, position / clip_seconds)) / len(videos)
+                progress.set_clip_progress(job['id'], i, fraction)
+                progress.set_fraction(job['id'], (i + fraction) / len(clips))
 
-                print(f"[DEBUG] Processing subtitle file: {subtitle_file}")
-                print(f"[DEBUG] Looking for video file: {input_video_path}")
-                print(f"[DEBUG] Video file exists: {os.path.exists(input_video_path)}")
+            try:
+                run_ffmpeg([
+                    'ffmpeg', '-threads', '2', '-i', input_video_path,
+                    '-vf', ','.join(filters),
+                    '-c:a', 'copy',
+                    '-y',
+                    output_video_path
+                ], timeout=600, on_progress=report)
+
+                if not os.path.exists(output_video_path):
+                    raise RuntimeError(f"Failed to create final video: {output_video_path}")
+                if final_key:
+                    render_cache.store(final_key, output_video_path)
+
+            except RuntimeError as e:
+                print(f"FFmpeg finalization failed for {base_filename}: {e}")
+                shutil.copy2(input_video_path, output_video_path)
+            except Exception as e:
+                print(f"Unexpected error during finalization {base_filename}: {e}")
+                shutil.copy2(input_video_path, output_video_path)
+
+        mark_clip_done(job, 'final', i, videos[0][1])
+
+    return {'output_folder': output_folder_final}
+
+def write_clip_summary(job, step_num, total_steps):
+    """Create clip data summary file"""
+    print("📝 Creating clip data summary...")
+    options = job['options']
+    clips = job['clips']
+
+    clip_data_summary = []
+    clip_data_summary.append("=" * 80)
+    clip_data_summary.append("CLIPAH VIDEO PROCESSING SUMMARY")
+    clip_data_summary.append("=" * 80)
+    clip_data_summary.append(f"Video Source: {options['video_source']}")
+    clip_data_summary.append(f"Processing Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    clip_data_summary.append(f"Language: {options['language']} ({options['language_code']})")
+    clip_data_summary.append(f"Aspect Ratio: {', '.join(job_aspect_ratios(options))}")
+    clip_data_summary.append(f"Number of Clips Generated: {len(clips)}")
+    clip_data_summary.append(f"Subtitles Included: {'Yes' if options['include_subtitles'] else 'No'}")
+    clip_data_summary.append(f"Watermark Included: {'Yes' if options['include_watermark'] else 'No'}")
+    if options['include_watermark']:
+        clip_data_summary.append(f"Watermark Text: {options['watermark_text']}")
+    clip_data_summary.append("")
+    clip_data_summary.append("=" * 80)
+    clip_data_summary.append("CLIP DETAILS")
+    clip_data_summary.append("=" * 80)
+
+    for i, clip in enumerate(clips, 1):
+        clip_data_summary.append(f"\nCLIP {i}: {clip.get('clip_title', 'No Title')}")
+        clip_data_summary.append("-" * (len(clip.get('clip_title', 'No Title')) + 10))
+        clip_data_summary.append(f"Start Time: {clip.get('start_time', 'N/A')}")
+        clip_data_summary.append(f"End Time: {clip.get('end_time', 'N/A')}")
+        clip_data_summary.append(f"Summary: {clip.get('summary', 'N/A')}")
+        clip_data_summary.append("")
+        clip_data_summary.append("Full Text:")
+        clip_data_summary.append(clip.get('full_text', 'N/A'))
+        clip_data_summary.append("")
+        clip_data_summary.append("-" * 80)
 
-                if not os.path.exists(input_video_path):
-                    print(f"[DEBUG] Skipping {subtitle_file} - no matching video file")
-                    continue
+    # Save clip data to text file
+    output_folder_final = job_path(job['id'], 'output_clips_final')
+    os.makedirs(output_folder_final, exist_ok=True)
+    clip_data_file = os.path.join(output_folder_final, "clip_data_summary.txt")
 
-                print(f"   Finalizing clip {i+1}/{len(subtitle_files)}: {base_filename}")
+    try:
+        with open(clip_data_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(clip_data_summary))
+        print(f"✅ Clip data summary saved to: {clip_data_file}")
+    except Exception as e:
+        print(f"⚠️ Error saving clip data summary: {e}")
+
+    return {'summary': clip_data_file}
+
+# Pipeline stages in order: (stage name, function, counts as a progress step, executor).
+# Coroutine stages (remote API calls) run on the event loop and have no executor;
+# blocking stages run in the given thread pool.
+PIPELINE_STAGES = [
+    ('source', prepare_source, True, IO_EXECUTOR),
+    ('audio', extract_audio, True, RENDER_EXECUTOR),
+    ('transcribe', transcribe_audio, True, None),
+    ('raw_subtitles', generate_raw_subtitles, True, IO_EXECUTOR),
+    ('diarize', diarize_transcript, True, None),
+    ('analyze', analyze_clips, True, None),
+    ('clips', create_video_clips, True, RENDER_EXECUTOR),
+    ('subtitles', create_clip_subtitles, True, None),
+    ('finalize', finalize_clips, True, RENDER_EXECUTOR),
+    ('package', write_clip_summary, False, IO_EXECUTOR),
+]
+
+def job_stages(options):
+    """The stages that apply to a job's options, with whether each one counts as a progress step"""
+    stages = []
+    for name, func, counted, executor in PIPELINE_STAGES:
+        if name == 'subtitles' and not options['include_subtitles']:
+            continue
+        if name == 'finalize' and not (options['include_subtitles'] or options['include_watermark']):
+            # A plain copy to the final folder isn't shown as a step
+            counted = False
+        stages.append((name, func, counted, executor))
+    return stages
+
+def stage_media_seconds(job, stage):
+    """Seconds of media a stage works through (None while the source length is unknown), for the throughput model"""
+    duration = (job.get('media') or {}).get('duration')
+    if stage == 'package':
+        return 0
+    if stage not in ('clips', 'subtitles', 'finalize'):
+        return duration
+
+    if job['clips']:
+        seconds = sum(max(0.0, time_to_seconds(clip.get('end_time')) - time_to_seconds(clip.get('start_time')))
+                      for clip in job['clips'])
+    elif duration:
+        seconds = min(duration, progress.ESTIMATED_CLIP_SECONDS)
+    else:
+        return None
+    # Renders encode every aspect ratio; subtitles are per clip
+    return seconds if stage == 'subtitles' else seconds * len(job_aspect_ratios(job['options']))
+
+def job_resolution(job):
+    return progress.resolution_bucket((job.get('media') or {}).get('height'))
+
+def job_live_progress(job):
+    """Progress, ETA and per-clip progress of a running job (in any worker process), or None"""
+    plan = [(name, stage_media_seconds(job, name), stage_done(job, name)) for name, _, _, _ in job_stages(job['options'])]
+    return progress.estimate(job['id'], plan, job_resolution(job))
+
+def remaining_work_seconds(job):
+    """Expected seconds of a job's unfinished stages from the throughput model (stages of unknown length count as 0)"""
+    resolution = job_resolution(job)
+    total = 0.0
+    for name, _, _, _ in job_stages(job['options']):
+        if stage_done(job, name):
+            continue
+        media_seconds = stage_media_seconds(job, name)
+        rate = progress.THROUGHPUT.rate(name, resolution)
+        if media_seconds and rate:
+            total += media_seconds / rate
+    return total
+
+def build_job_options(video_source, source_type='url', language="Indonesian", include_subtitles=True,
+                      include_watermark=True, watermark_text="@clipah.com", aspect_ratio="9:16",
+                      subtitle_words_per_line=1, subtitle_highlight=False, ttl_hours=None, aspect_ratios=None):
+    """Processing options stored on the job; aspect_ratios renders every clip in several ratios (aspect_ratio is the first)"""
+    aspect_ratios = parse_ratios(aspect_ratios) if aspect_ratios else [aspect_ratio]
+    return {
+        'video_source': video_source,
+        'source_type': source_type,
+        'language': language,
+        'language_code': "en_us" if language.lower() == "english" else "id",
+        'include_subtitles': include_subtitles,
+        'include_watermark': include_watermark,
+        'watermark_text': watermark_text,
+        'aspect_ratio': aspect_ratios[0],
+        'aspect_ratios': aspect_ratios,
+        'subtitle_words_per_line': subtitle_words_per_line,
+        'subtitle_highlight': subtitle_highlight,
+        'ttl_hours': ttl_hours,  # None: artifact_store.DEFAULT_TTL_HOURS
+    }
 
-                try:
-                    escaped_subtitle_path = input_subtitle_path.replace('\\', '/').replace('output_subtitles/', './output_subtitles/')
-                    
-                    font_path = "styles/arial.ttf"
-
-                    if include_watermark:
-                        subprocess.run([
-                            'ffmpeg', '-threads', '2', '-i', input_video_path,
-                            '-vf', f"ass='{escaped_subtitle_path}',drawtext=text='{watermark_text}':fontfile='{font_path}':fontcolor=white@0.5:fontsize=10:x=(w-text_w)/2:y=h-text_h-15",
-                            '-c:a', 'copy',
-                            '-y',
-                            output_video_path
-                        ], capture_output=True, text=True, check=True, timeout=600)
-                    else:
-                        subprocess.run([
-                            'ffmpeg', '-threads', '2', '-i', input_video_path,
-                            '-vf', f"ass='{escaped_subtitle_path}'",
-                            '-c:a', 'copy', 
-                            '-y',
-                            output_video_path
-                        ], capture_output=True, text=True, check=True, timeout=600)
-                        
-                    if not os.path.exists(output_video_path):
-                        raise RuntimeError(f"Failed to create final video: {output_video_path}")
-                        
-                except subprocess.CalledProcessError as e:
-                    print(f"FFmpeg finalization failed for {base_filename}: {e.stderr}")
-                    shutil.copy2(input_video_path, output_video_path)
-                except FileNotFoundError:
-                    print("FFmpeg not found for finalization. Copying original files.")
-                    shutil.copy2(input_video_path, output_video_path)
-                except Exception as e:
-                    print(f"Unexpected error during finalization {base_filename}: {e}")
-                    shutil.copy2(input_video_path, output_video_path)
+def index_transcript(job):
+    """Add the job's transcript to the library; a failure here never fails the job"""
+    if not transcript_library.ENABLED:
+        return
+    try:
+        if job['options']['source_type'] != 'url':
+            # Uploads are matched by content, since their file name is a temporary one
+            job_source_hash(job)
+        transcript_library.index_job(job)
+    except Exception as e:
+        print(f"[WARNING] Could not add the transcript to the library: {e}")
 
-        else:
-            # If no subtitles, handle watermark as before
-            if include_watermark:
+def remove_uploaded_source(job):
+    """Delete the temporary upload; local files passed to the batch CLI ('local' sources) are left alone"""
+    options = job['options']
+    video_source = options['video_source']
+    if options['source_type'] == 'file' and os.path.exists(video_source):
+        try:
+            os.remove(video_source)
+            print(f"✅ Cleaned up uploaded file: {video_source}")
+        except Exception as e:
+            print(f"⚠️ Could not clean up uploaded file: {e}")
+
+# The stage_gate of the job running in the current task
+current_stage_gate = contextvars.ContextVar('current_stage_gate', default=None)
+
+async def run_job_async(job, stage_gate=None):
+    """
+    Run (or resume) a job's pipeline. Stages and clips that the job record
+    marks as completed are skipped, so an interrupted job picks up where it stopped.
+
+    stage_gate, if given, is called with each stage name and the job's remaining
+    work in expected seconds and must return an async context manager held while
+    that stage runs (a StagePools, bounding concurrency per resource).
+    """
+    lock = claim_job(job['id'])
+    if lock is None:
+        print(f"[INFO] Job {job['id']} is already being processed by another worker")
+        return False
+    # For work a stage starts on another resource (the clips analyze_clips renders while streaming)
+    current_stage_gate.set(stage_gate)
+
+    try:
+        update_job_status(job, status='processing', error=None)
+        check_api_keys()
 
-                font_path = "styles/arial.ttf"
+        loop = asyncio.get_running_loop()
+        stages = job_stages(job['options'])
+        total_steps = sum(1 for _, _, counted, _ in stages if counted)
+        current_step = 0
 
+        for name, func, counted, executor in stages:
+            if counted:
                 current_step += 1
-                log_progress("Adding watermark", "Adding watermark to video clips", current_step, total_steps)
-                
-                output_folder_clips = "output_clips"
-                output_folder_final = "output_clips_final"
-                if not os.path.exists(output_folder_final):
-                    os.makedirs(output_folder_final)
-                
-                clip_files = [f for f in os.listdir(output_folder_clips) if f.endswith('.mp4')]
-                for clip_file in clip_files:
-                    input_video_path = os.path.join(output_folder_clips, clip_file)
-                    output_video_path = os.path.join(output_folder_final, clip_file.replace('.mp4', '_final.mp4'))
-                    
-                    try:
-                        result = subprocess.run([
-                            'ffmpeg', '-i', input_video_path,
-                            '-vf', f"drawtext=text='{watermark_text}':fontfile='{font_path}':fontcolor=white@0.5:fontsize=10:x=(w-text_w)/2:y=h-text_h-15",
-                            '-c:a', 'copy',
-                            '-y',
-                            output_video_path
-                        ], capture_output=True, text=True, check=True, timeout=600)
-                        
-                        if not os.path.exists(output_video_path):
-                            raise RuntimeError(f"Failed to create watermarked video: {output_video_path}")
-                            
-                    except subprocess.CalledProcessError as e:
-                        print(f"FFmpeg watermark failed for {clip_file}: {e.stderr}")
-                        shutil.copy2(input_video_path, output_video_path)
-                    except FileNotFoundError:
-                        print("FFmpeg not found for watermarking. Copying original files.")
-                        shutil.copy2(input_video_path, output_video_path)
-                    except Exception as e:
-                        print(f"Unexpected error during watermarking {clip_file}: {e}")
-                        shutil.copy2(input_video_path, output_video_path)
-            else:
-                # Copy clips to final folder
-                output_folder_clips = "output_clips"
-                output_folder_final = "output_clips_final"
-                if not os.path.exists(output_folder_final):
-                    os.makedirs(output_folder_final)
-                
-                clip_files = [f for f in os.listdir(output_folder_clips) if f.endswith('.mp4')]
-                for clip_file in clip_files:
-                    input_video_path = os.path.join(output_folder_clips, clip_file)
-                    output_video_path = os.path.join(output_folder_final, clip_file.replace('.mp4', '_final.mp4'))
-                    shutil.copy2(input_video_path, output_video_path)
-
-        # Create clip data summary file
-        print("📝 Creating clip data summary...")
-
-        clip_data_summary = []
-        clip_data_summary.append("=" * 80)
-        clip_data_summary.append("CLIPAH VIDEO PROCESSING SUMMARY")
-        clip_data_summary.append("=" * 80)
-        clip_data_summary.append(f"Video Source: {video_source}")
-        clip_data_summary.append(f"Processing Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        clip_data_summary.append(f"Language: {language} ({language_code})")
-        clip_data_summary.append(f"Aspect Ratio: {aspect_ratio}")
-        clip_data_summary.append(f"Number of Clips Generated: {len(clips)}")
-        clip_data_summary.append(f"Subtitles Included: {'Yes' if include_subtitles else 'No'}")
-        clip_data_summary.append(f"Watermark Included: {'Yes' if include_watermark else 'No'}")
-        if include_watermark:
-            clip_data_summary.append(f"Watermark Text: {watermark_text}")
-        clip_data_summary.append("")
-        clip_data_summary.append("=" * 80)
-        clip_data_summary.append("CLIP DETAILS")
-        clip_data_summary.append("=" * 80)
-
-        for i, clip in enumerate(clips, 1):
-            clip_data_summary.append(f"\nCLIP {i}: {clip.get('clip_title', 'No Title')}")
-            clip_data_summary.append("-" * (len(clip.get('clip_title', 'No Title')) + 10))
-            clip_data_summary.append(f"Start Time: {clip.get('start_time', 'N/A')}")
-            clip_data_summary.append(f"End Time: {clip.get('end_time', 'N/A')}")
-            clip_data_summary.append(f"Summary: {clip.get('summary', 'N/A')}")
-            clip_data_summary.append("")
-            clip_data_summary.append("Full Text:")
-            clip_data_summary.append(clip.get('full_text', 'N/A'))
-            clip_data_summary.append("")
-            clip_data_summary.append("-" * 80)
-
-        # Save clip data to text file
-        output_folder_final = "output_clips_final"
-        clip_data_file = os.path.join(output_folder_final, "clip_data_summary.txt");
 
-        try:
-            with open(clip_data_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(clip_data_summary))
-            print(f"✅ Clip data summary saved to: {clip_data_file}")
-        except Exception as e:
-            print(f"⚠️ Error saving clip data summary: {e}")
-        
+            if stage_done(job, name):
+                print(f"[INFO] Stage '{name}' already completed, skipping")
+                continue
+
+            # Jobs with the least work left get a busy pool's next slot
+            async with stage_gate(name, remaining_work_seconds(job)) if stage_gate else nullcontext():
+                # A stage resuming with some clips already done would overstate throughput
+                progress.start_stage(job['id'], name, measure=not job['clip_stages'].get(name))
+                if asyncio.iscoroutinefunction(func):
+                    outputs = await func(job, current_step, total_steps)
+                else:
+                    outputs = await loop.run_in_executor(executor, func, job, current_step, total_steps)
+                progress.finish_stage(job['id'], stage_media_seconds(job, name), job_resolution(job))
+            mark_stage_done(job, name, outputs)
+
+            # The uploaded file is no longer needed once main_video.mp4 exists
+            if name == 'source':
+                remove_uploaded_source(job)
+            # Transcript and speaker labels are final now; keep them searchable after the job expires
+            if name == 'diarize':
+                await loop.run_in_executor(IO_EXECUTOR, index_transcript, job)
+
         # Update processing status with clips data
-        processing_status['clips'] = clips
-        processing_status['status'] = 'completed'
-        processing_status['message'] = 'Processing completed successfully!'
-        processing_status['progress'] = 100
-        
-        # Clean up uploaded file after processing
-        if source_type == 'file' and os.path.exists(video_source):
-            try:
-                os.remove(video_source)
-                print(f"✅ Cleaned up uploaded file: {video_source}")
-            except Exception as e:
-                print(f"⚠️ Could not clean up uploaded file: {e}")
-        
+        update_job_status(job, status='completed', message='Processing completed successfully!',
+                          progress=100, clips=job['clips'])
         return True
-        
+
     except Exception as e:
-        processing_status['status'] = 'error'
-        processing_status['error'] = str(e)
-        processing_status['message'] = f'Error: {str(e)}'
+        update_job_status(job, status='error', error=str(e), message=f'Error: {str(e)}')
         print(f"ERROR: {str(e)}")
-        
-        # Clean up uploaded file on error
-        if 'video_source' in locals() and source_type == 'file' and os.path.exists(video_source):
-            try:
-                os.remove(video_source)
-            except:
-                pass
-        
+        # An uploaded source is kept so a retry can resume; the sweeper removes it when the job expires
         return False
+    finally:
+        progress.forget(job['id'])
+        release_job(lock)
+        # The job has written new files; let the sweeper check the disk quota
+        artifact_store.request_sweep()
+
+# Stages that only depend on the stored source, transcript and clip list
+RENDER_STAGES = ('clips', 'subtitles', 'finalize', 'package')
+
+def edit_clips(job, edited):
+    """Merge edited clips (by position) into the job's clip list; boundaries are taken as given, not snapped"""
+    if not isinstance(edited, list) or not edited:
+        raise ValueError("clips must be a non-empty list")
+
+    duration = job_media(job).get('duration')
+    timeline = None
+    clips = []
+    for i, changes in enumerate(edited):
+        if not isinstance(changes, dict):
+            raise ValueError(f"Clip {i+1} must be an object")
+        old = job['clips'][i] if i < len(job['clips']) else {}
+        clip = dict(old)
+        clip.update({key: changes[key] for key in ('clip_title', 'start_time', 'end_time', 'summary') if key in changes})
+
+        if not clip.get('start_time') or not clip.get('end_time'):
+            raise ValueError(f"Clip {i+1} needs start_time and end_time (HH:MM:SS.mmm)")
+        try:
+            start_ms = time_to_ms(clip['start_time'])
+            end_ms = time_to_ms(clip['end_time'])
+        except ValueError as e:
+            raise ValueError(f"Clip {i+1}: {e}")
+        if start_ms >= end_ms:
+            raise ValueError(f"Clip {i+1}: start_time must be before end_time")
+        if duration and end_ms > duration * 1000:
+            raise ValueError(f"Clip {i+1}: end_time is past the end of the video ({milliseconds_to_timecode(int(duration * 1000))})")
+
+        if (clip['start_time'], clip['end_time']) != (old.get('start_time'), old.get('end_time')):
+            if timeline is None:
+                timeline = WordTimeline.from_words(load_transcript(job)['words'])
+            clip['full_text'] = timeline.text_between(*timeline.index_range(start_ms, end_ms))
+        clips.append(clip)
+    return clips
+
+def parse_flag(value):
+    """A yes/no request field: JSON booleans, or form strings such as 'true', 'false' and checkbox 'on'"""
+    return value is True or str(value).strip().lower() in ('true', '1', 'on', 'yes')
+
+def parse_words_per_line(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"subtitle_words_per_line must be a whole number, got {value!r}")
+
+def parse_ttl_hours(value):
+    """ttl_hours from request data: None if not given, else a positive number of hours; raises ValueError"""
+    if value in (None, ''):
+        return None
+    try:
+        hours = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"ttl_hours must be a number of hours, got {value!r}")
+    if not 0 < hours < float('inf'):
+        raise ValueError(f"ttl_hours must be a positive number of hours, got {value!r}")
+    return hours
+
+def apply_render_options(options, data):
+    """Update render options (subtitles, watermark, aspect ratios) from request data; raises ValueError on bad values"""
+    for key in ('include_subtitles', 'include_watermark', 'subtitle_highlight'):
+        if key in data:
+            options[key] = parse_flag(data[key])
+    if 'watermark_text' in data:
+        options['watermark_text'] = data['watermark_text']
+    if 'subtitle_words_per_line' in data:
+        options['subtitle_words_per_line'] = parse_words_per_line(data['subtitle_words_per_line'])
+    if data.get('aspect_ratios') or data.get('aspect_ratio'):
+        ratios = parse_ratios(data.get('aspect_ratios') or data['aspect_ratio'])
+        options['aspect_ratios'] = ratios
+        options['aspect_ratio'] = ratios[0]
+    if data.get('ttl_hours'):
+        options['ttl_hours'] = parse_ttl_hours(data['ttl_hours'])
+
+def apply_rerender(job, data):
+    """
+    Apply new render options (and optionally edited clips) to a finished job and
+    return the render stages that have to run again. Raises ValueError on bad input.
+    """
+    options = job['options']
+    before = dict(options)
+    apply_render_options(options, data)
+
+    clips = edit_clips(job, data['clips']) if 'clips' in data else job['clips']
+    clips_changed = clips != job['clips']
+    job['clips'] = clips
+
+    def changed(*keys):
+        return any(before.get(key) != options.get(key) for key in keys)
+
+    stages = {'finalize', 'package'}
+    if clips_changed or changed('aspect_ratio', 'aspect_ratios'):
+        stages.add('clips')
+    if clips_changed or changed('include_subtitles', 'subtitle_words_per_line', 'subtitle_highlight'):
+        stages.add('subtitles')
+
+    # Cut clips may have been evicted by the artifact store
+    ratios = job_aspect_ratios(options)
+    if not all(os.path.exists(job_path(job['id'], 'output_clips', clip_video_name(i, clip, ratio, ratios)))
+               for i, clip in enumerate(clips) for ratio in ratios):
+        stages.add('clips')
+
+    # Subtitles come from stored words, never from a new transcription
+    options['subtitles_from_transcript'] = True
+    return [stage for stage in RENDER_STAGES if stage in stages]
+
+# Stages a job started from the transcript library takes over from the job that indexed the source
+LIBRARY_STAGES = ('audio', 'transcribe', 'raw_subtitles', 'diarize')
+
+def library_clips(moments):
+    """
+    The library source and clip time ranges (ms) for moments given by cue_id or by
+    source_id with start_time/end_time. Raises ValueError on bad input.
+    """
+    if not isinstance(moments, list) or not moments:
+        raise ValueError("clips must be a non-empty list")
+
+    source_id = None
+    ranges = []
+    for i, moment in enumerate(moments):
+        if not isinstance(moment, dict):
+            raise ValueError(f"Clip {i+1} must be an object")
+        if moment.get('cue_id') is not None:
+            found = transcript_library.moment(moment['cue_id'])
+            if found is None:
+                raise ValueError(f"Clip {i+1}: unknown cue_id {moment['cue_id']}")
+            moment_source, start_ms, end_ms = found
+        elif moment.get('source_id') is not None and moment.get('start_time') and moment.get('end_time'):
+            moment_source = int(moment['source_id'])
+            start_ms, end_ms = time_to_ms(moment['start_time']), time_to_ms(moment['end_time'])
+        else:
+            raise ValueError(f"Clip {i+1} needs a cue_id, or a source_id with start_time and end_time")
+        if start_ms >= end_ms:
+            raise ValueError(f"Clip {i+1}: start_time must be before end_time")
+        if source_id is not None and moment_source != source_id:
+            raise ValueError("All clips of one render must come from the same source")
+        source_id = moment_source
+        ranges.append((start_ms, end_ms, moment))
+
+    source = transcript_library.get_source(source_id)
+    if source is None:
+        raise LookupError(f"Library source {source_id} not found")
+    return source, ranges
+
+def create_library_job(source, ranges, data):
+    """
+    A job that renders moments of a library source: the stored words stand in for
+    transcription and analysis, and the source video is linked from the job that
+    still has it (only a URL source that has expired everywhere is downloaded again).
+    """
+    options = build_job_options(source['video_source'], source['source_type'], source['language'] or 'Indonesian',
+                                include_subtitles=False, include_watermark=False)
+    apply_render_options(options, data)
+    options['subtitles_from_transcript'] = True
+    options['library_source'] = source['id']
+    job = create_job(options)
+
+    transcript = transcript_library.source_transcript(source['id'])
+    save_transcript(transcript, job_path(job['id'], 'transcript.json'))
+    timeline = WordTimeline.from_words(transcript['words'])
+    for start_ms, end_ms, moment in ranges:
+        text = timeline.text_between(*timeline.index_range(start_ms, end_ms))
+        job['clips'].append({
+            'clip_title': moment.get('clip_title') or ' '.join(text.split()[:6]) or f"clip_{len(job['clips'])+1}",
+            'start_time': milliseconds_to_timecode(start_ms),
+            'end_time': milliseconds_to_timecode(end_ms),
+            'summary': moment.get('summary', ''),
+            'full_text': text,
+        })
+
+    job['media'] = dict(source['media'])
+    origin = transcript_library.local_source_path(source)
+    if origin:
+        main_video = job_path(job['id'], 'main_video.mp4')
+        render_cache.link_or_copy(origin, main_video)
+        mark_stage_done(job, 'source', {'video': main_video, 'library_source': source['id']})
+    for stage in LIBRARY_STAGES:
+        mark_stage_done(job, stage, {'library_source': source['id']})
+    mark_stage_done(job, 'analyze', {'clip_count': len(job['clips'])})
+    return job
+
+_pipeline_loop = None
+_pipeline_loop_lock = threading.Lock()
+
+def get_pipeline_loop():
+    """The event loop web-started jobs run on, started in a background thread on first use"""
+    global _pipeline_loop
+    with _pipeline_loop_lock:
+        if _pipeline_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='pipeline-loop', daemon=True).start()
+            _pipeline_loop = loop
+    return _pipeline_loop
+
+def submit_job(job):
+    """Schedule a job on the pipeline loop; returns a concurrent.futures.Future with its result"""
+    return asyncio.run_coroutine_threadsafe(run_job_async(job, stage_gate=PIPELINE_POOLS), get_pipeline_loop())
+
+def run_job(job):
+    """Run a job on the pipeline loop and wait for it to finish"""
+    return submit_job(job).result()
+
+def process_video_complete(video_source, source_type='url', language="Indonesian", include_subtitles=True,
+                         include_watermark=True, watermark_text="@clipah.com", aspect_ratio="9:16",
+                         subtitle_words_per_line=1, subtitle_highlight=False, job_id=None):
+    """
+    Complete video processing pipeline from source to final clips.
+    Pass job_id to resume an existing job instead of starting a new one.
+    """
+    job = load_job(job_id) if job_id else None
+    if job is None:
+        job = create_job(build_job_options(
+            video_source, source_type, language, include_subtitles, include_watermark,
+            watermark_text, aspect_ratio, subtitle_words_per_line, subtitle_highlight
+        ))
+    return run_job(job)
+
+def resume_interrupted_jobs():
+    """Resume jobs left unfinished by a crashed or redeployed worker"""
+    for job in find_resumable_jobs():
+        print(f"🔁 Resuming interrupted job {job['id']} ({job['options']['video_source']})")
+        if processing_status['status'] in ('idle', 'completed', 'error'):
+            processing_status.update({'job_id': job['id'], 'status': job['status'], 'clips': job['clips'],
+                                      'message': job['message'], 'progress': job['progress'], 'error': None})
+        submit_job(job)
+
+_background_runner = None
+
+def start_background_services():
+    """
+    Start the background work that must run once per jobs folder, not once per
+    process: resuming jobs interrupted by a crash or redeploy, and the sweeper
+    that expires old jobs and keeps disk use under the quota. Called from
+    __main__ and by gunicorn for each worker (gunicorn.conf.py); only the
+    process that takes the runner lock does the work, and when it dies the
+    lock passes to the next worker started. Returns whether this process runs it.
+    """
+    global _background_runner
+    if _background_runner is None:
+        _background_runner = claim_background_runner()
+        if _background_runner is None:
+            return False
+        if os.getenv('RESUME_JOBS_ON_START', 'true').lower() == 'true':
+            threading.Thread(target=resume_interrupted_jobs, name='job-resumer', daemon=True).start()
+        # The job shown in this process's web UI is never evicted
+        artifact_store.start_sweeper(protected=lambda: [processing_status.get('job_id')],
+                                     upload_folder=app.config['UPLOAD_FOLDER'])
+    return True
+
+def requested_job_id():
+    """The job a request is for: ?job_id= if given (so any worker process can serve it), else the web UI's job"""
+    job_id = request.args.get('job_id')
+    if is_valid_job_id(job_id):
+        return job_id
+    return processing_status.get('job_id')
+
+def current_job_path(folder, filename=''):
+    """Path of an output of the requested job"""
+    job_id = requested_job_id()
+    if not job_id:
+        return os.path.join(folder, filename) if filename else folder
+    return job_path(job_id, folder, filename)
+
+def touch_current_job():
+    """Mark the requested job as used so the sweeper keeps it around"""
+    job_id = requested_job_id()
+    if job_id:
+        artifact_store.touch_job(job_id)
 
 @app.route('/')
 def index():
@@ -1009,7 +1651,7 @@ def index():
 @app.route('/process', methods=['POST'])
 def process_video():
     global processing_status
-    
+
     try:
         # Handle both JSON and form data
         if request.is_json:
@@ -1020,135 +1662,310 @@ def process_video():
         else:
             # File upload processing (new)
             data = request.form.to_dict()
-            
+
             # Check if file was uploaded
             if 'video_file' not in request.files:
                 return jsonify({'error': 'No video file uploaded'}), 400
-            
+
             file = request.files['video_file']
             if file.filename == '' or not file:
                 return jsonify({'error': 'No video file selected'}), 400
-            
+
             if not allowed_file(file.filename):
                 return jsonify({'error': 'File type not supported. Please upload MP4, AVI, MOV, MKV, WEBM, M4V, FLV, or 3GP files.'}), 400
-            
+
             # Save uploaded file
             filename = secure_filename(file.filename)
             unique_filename = f"{uuid.uuid4().hex}_{filename}"
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
             file.save(file_path)
-            
+
             video_source = file_path
             source_type = 'file'
-        
+
         # Extract other parameters
         language = data.get('language', 'Indonesian')
-        include_subtitles = data.get('include_subtitles', False)
-        include_watermark = data.get('include_watermark', False)
+        include_subtitles = parse_flag(data.get('include_subtitles', False))
+        include_watermark = parse_flag(data.get('include_watermark', False))
         watermark_text = data.get('watermark_text', '@clipah.com')
         aspect_ratio = data.get('aspect_ratio', '9:16')
-        
+        if aspect_ratio not in SUPPORTED_RATIOS:
+            # As before multi-ratio rendering, an unknown ratio keeps the source's shape
+            print(f"[WARNING] Unknown aspect ratio {aspect_ratio!r}, keeping the original")
+            aspect_ratio = 'original'
+        subtitle_highlight = parse_flag(data.get('subtitle_highlight', False))
+        try:
+            subtitle_words_per_line = parse_words_per_line(data.get('subtitle_words_per_line', 1))
+            ttl_hours = parse_ttl_hours(data.get('ttl_hours'))
+            # Optional list (or comma-separated string) of ratios to render every clip in
+            aspect_ratios = parse_ratios(data.get('aspect_ratios') or aspect_ratio)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         if not video_source:
             return jsonify({'error': 'Video source is required (URL or file)'}), 400
-        
-        # Clean up previous files before starting
-        cleanup_previous_output()
-        
+
+        job = create_job(build_job_options(
+            video_source=video_source,
+            source_type=source_type,
+            language=language,
+            include_subtitles=include_subtitles,
+            include_watermark=include_watermark,
+            watermark_text=watermark_text,
+            aspect_ratio=aspect_ratio,
+            subtitle_words_per_line=subtitle_words_per_line,
+            subtitle_highlight=subtitle_highlight,
+            ttl_hours=ttl_hours,
+            aspect_ratios=aspect_ratios
+        ))
+
         # Reset processing status
         processing_status = {
             'status': 'starting',
             'message': 'Starting video processing...',
             'progress': 0,
             'clips': [],
-            'error': None
+            'error': None,
+            'job_id': job['id']
         }
-        
-        # Start processing in background thread
-        def process_in_background():
-            process_video_complete(
-                video_source=video_source,
-                source_type=source_type,
-                language=language,
-                include_subtitles=include_subtitles,
-                include_watermark=include_watermark,
-                watermark_text=watermark_text,
-                aspect_ratio=aspect_ratio
-            )
-        
-        thread = threading.Thread(target=process_in_background)
-        thread.daemon = True
-        thread.start()
-        
-        return jsonify({'message': 'Processing started', 'status': 'started'})
-        
+
+        # Schedule the job on the pipeline event loop
+        submit_job(job)
+
+        return jsonify({'message': 'Processing started', 'status': 'started', 'job_id': job['id']})
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/status')
 def get_status():
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = load_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        status = {key: job.get(key) for key in ('status', 'message', 'progress', 'clips', 'error')}
+        status['job_id'] = job['id']
+        if job.get('status') == 'processing':
+            status.update(job_live_progress(job) or {})
+        return jsonify(status)
+
     print(f"Status request - Current status: {processing_status['status']}")
     if processing_status['status'] == 'completed':
         print(f"Clips data being returned: {len(processing_status.get('clips', []))} clips")
         for i, clip in enumerate(processing_status.get('clips', [])):
             print(f"  Clip {i+1}: {clip.get('clip_title', 'No title')}")
-    return jsonify(processing_status)
+
+    status = dict(processing_status)
+    if status['status'] == 'processing' and status.get('job_id'):
+        job = load_job(status['job_id'])
+        if job:
+            status.update(job_live_progress(job) or {})
+    return jsonify(status)
+
+@app.route('/providers')
+def get_provider_stats():
+    """Call counts, retries and queue wait times per remote API, for sizing rate limits"""
+    return jsonify(provider_stats())
+
+@app.route('/throughput')
+def get_throughput():
+    """Recorded media seconds processed per second, by stage and source resolution, for capacity planning"""
+    return jsonify(progress.THROUGHPUT.snapshot())
+
+@app.route('/pools')
+def get_pool_stats():
+    """Busy and waiting jobs per stage resource pool"""
+    return jsonify(PIPELINE_POOLS.stats())
+
+@app.route('/storage')
+def get_storage_stats():
+    """Disk used by job workspaces against the quota"""
+    return jsonify(artifact_store.storage_stats())
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = load_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    global processing_status
+
+    job = load_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'completed':
+        return jsonify({'error': 'Job already completed'}), 400
+    if is_job_locked(job['id']):
+        return jsonify({'error': 'Job is already running'}), 409
+
+    processing_status = {
+        'status': 'starting',
+        'message': 'Resuming video processing...',
+        'progress': job.get('progress', 0),
+        'clips': [],
+        'error': None,
+        'job_id': job['id']
+    }
+    submit_job(job)
+
+    return jsonify({'message': 'Processing resumed', 'status': 'started', 'job_id': job['id']})
+
+@app.route('/jobs/<job_id>/rerender', methods=['POST'])
+def rerender_job(job_id):
+    """Run only the render stages again with new render options and/or edited clip boundaries"""
+    global processing_status
+
+    job = load_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if not stage_done(job, 'analyze') or not job.get('clips'):
+        return jsonify({'error': 'Job has no clip selection yet'}), 400
+    if is_job_locked(job['id']):
+        return jsonify({'error': 'Job is already running'}), 409
+
+    data = request.get_json(silent=True) or {}
+    try:
+        stages = apply_rerender(job, data)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if 'clips' in stages and not os.path.exists(job_path(job['id'], 'main_video.mp4')):
+        return jsonify({'error': 'Source video has expired from storage; process the video again'}), 410
+
+    # Final files of the previous render (e.g. a dropped aspect ratio) must not end up in the zip
+    shutil.rmtree(job_path(job['id'], 'output_clips_final'), ignore_errors=True)
+    if 'clips' in stages:
+        shutil.rmtree(job_path(job['id'], 'output_clips'), ignore_errors=True)
+
+    reset_stages(job, stages)
+    update_job_status(job, status='pending', error=None, message='Re-rendering clips...')
+
+    processing_status = {
+        'status': 'starting',
+        'message': 'Re-rendering clips...',
+        'progress': 0,
+        'clips': [],
+        'error': None,
+        'job_id': job['id']
+    }
+    submit_job(job)
+
+    return jsonify({'message': 'Re-render started', 'status': 'started', 'job_id': job['id'], 'stages': stages})
+
+@app.route('/library/search')
+def search_library():
+    """Subtitle lines matching ?q= across every processed source (optional speaker, source_id, limit)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        results, seconds = transcript_library.search(query, limit=request.args.get('limit', 20),
+                                                     source_id=request.args.get('source_id'),
+                                                     speaker=request.args.get('speaker'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'query': query, 'results': results, 'took_ms': round(seconds * 1000, 2)})
+
+@app.route('/library/sources')
+def get_library_sources():
+    return jsonify(transcript_library.list_sources())
+
+@app.route('/library/render', methods=['POST'])
+def render_library_moments():
+    """Render search results as a new job without transcribing (or, while the source is on disk, downloading) again"""
+    global processing_status
+
+    data = request.get_json(silent=True) or {}
+    try:
+        source, ranges = library_clips(data['clips'] if 'clips' in data else [data])
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if source['source_type'] != 'url' and not transcript_library.local_source_path(source):
+        return jsonify({'error': 'The uploaded source video has expired from storage; upload it again'}), 410
+
+    try:
+        job = create_library_job(source, ranges, data)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    processing_status = {
+        'status': 'starting',
+        'message': 'Rendering clips from the library...',
+        'progress': 0,
+        'clips': [],
+        'error': None,
+        'job_id': job['id']
+    }
+    submit_job(job)
+
+    return jsonify({'message': 'Render started', 'status': 'started', 'job_id': job['id'],
+                    'clips': job['clips'], 'downloading': not stage_done(job, 'source')})
 
 @app.route('/download')
 def download_clips():
     try:
         # Create zip file of all clips
-        output_folder = "output_clips_final"
-        zip_filename = "clipah_clips.zip"
-        
+        output_folder = current_job_path("output_clips_final")
+        zip_filename = current_job_path("clipah_clips.zip")
+
         if not os.path.exists(output_folder):
             return jsonify({'error': 'No clips available for download'}), 404
-        
+        touch_current_job()
+
         clip_files = [f for f in os.listdir(output_folder) if f.endswith(('.mp4', '.txt'))]
         if not clip_files:
             return jsonify({'error': 'No video clips found'}), 404
-        
+
         # Create zip file
         with zipfile.ZipFile(zip_filename, 'w') as zipf:
             for clip_file in clip_files:
                 file_path = os.path.join(output_folder, clip_file)
                 zipf.write(file_path, clip_file)
-        
-        return send_file(zip_filename, as_attachment=True, download_name='clipah_clips.zip')
-        
+
+        return send_file(os.path.abspath(zip_filename), as_attachment=True, download_name='clipah_clips.zip')
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/reset', methods=['POST'])
 def reset_processing():
     global processing_status
-    
-    # First, clean up previous output using your specified cleanup code
-    cleanup_previous_output()
-    
+
+    # Outputs are not deleted here; the artifact sweeper expires them once they go unused
     # Reset processing status
     processing_status = {
         'status': 'idle',
         'message': '',
         'progress': 0,
         'clips': [],
-        'error': None
+        'error': None,
+        'job_id': None
     }
-    
+
     return jsonify({'message': 'Reset completed', 'status': 'idle'})
 
 @app.route('/output_clips/<filename>')
 def serve_output_clip(filename):
     """Serve video files from output_clips folder"""
+    touch_current_job()
     try:
-        return send_file(os.path.join('output_clips', filename), mimetype='video/mp4')
+        return send_file(os.path.abspath(current_job_path('output_clips', filename)), mimetype='video/mp4')
     except FileNotFoundError:
         return jsonify({'error': 'File not found'}), 404
 
 @app.route('/output_clips_final/<filename>')
 def serve_final_clip(filename):
     """Serve video files from output_clips_final folder"""
+    touch_current_job()
     try:
-        return send_file(os.path.join('output_clips_final', filename), mimetype='video/mp4')
+        return send_file(os.path.abspath(current_job_path('output_clips_final', filename)), mimetype='video/mp4')
     except FileNotFoundError:
         return jsonify({'error': 'File not found'}), 404
 
@@ -1157,5 +1974,9 @@ if __name__ == '__main__':
     debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
     host = os.getenv('FLASK_HOST', '0.0.0.0')
     port = int(os.getenv('FLASK_PORT', '5000'))
-    
+
+    # With the debug reloader, only the child process that serves requests runs jobs
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+
     app.run(debug=debug, host=host, port=port)
@@ -0,0 +1,288 @@
+"""
+Disk management for job workspaces.
+
+Instead of wiping everything when the next job starts, job folders are kept
+until they expire (a per-job TTL counted from the last time the job was run
+or its outputs were served) and a global disk quota is enforced by evicting
+the least recently used jobs' artifacts in priority order: sources first,
+then intermediates, then finals. A background sweeper does both.
+
+Cached renders (render_cache) are expired on the same TTL and are the first
+thing evicted under disk pressure, since they are only extra copies.
+
+Nothing in use is ever deleted: a job is only touched while its lock can be
+taken (so running jobs are skipped), and jobs used within MIN_IDLE_SECONDS
+or passed in as protected are left alone.
+"""
+import os
+import glob
+import time
+import shutil
+import threading
+from contextlib import suppress
+from datetime import datetime
+
+import render_cache
+from job_store import (
+    JOBS_FOLDER, FINISHED_STATUSES, job_dir, job_path, list_jobs, load_job, save_job, claim_job, release_job
+)
+
+DEFAULT_TTL_HOURS = float(os.getenv('CLIPAH_JOB_TTL_HOURS', '24'))
+DISK_QUOTA_BYTES = int(float(os.getenv('CLIPAH_DISK_QUOTA_GB', '20')) * 1024 ** 3)
+# Evict down to this fraction of the quota so the sweeper doesn't run on every new file
+QUOTA_LOW_WATER = 0.9
+SWEEP_INTERVAL = int(os.getenv('CLIPAH_SWEEP_INTERVAL', '300'))
+MIN_IDLE_SECONDS = 600
+ACCESS_MARKER = '.accessed'
+# Touched by any process to ask the sweeper (which may run in another worker) for an early sweep
+SWEEP_REQUEST_MARKER = '.sweep_requested'
+# How often the sweeper checks for that marker between sweeps
+SWEEP_POLL_SECONDS = 5
+
+# Artifact classes in eviction order, with the paths (relative to the job folder) they cover.
+# job.json and transcript.json are small and are kept until the whole job expires.
+ARTIFACT_CLASSES = (
+    ('source', ['main_video.*', 'main_audio.mp3']),
+    ('intermediate', ['output_clips', 'output_subtitles', 'raw_transcript.vtt', 'main_transcript.vtt', 'clipah_clips.zip']),
+    ('final', ['output_clips_final']),
+)
+
+
+def path_size(path):
+    """Bytes used under path; files hardlinked more than once (render cache entries) are counted once"""
+    if os.path.isfile(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+def remove_path(path):
+    """Delete a file or folder; one that is already gone counts as removed"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def touch_job(job_id):
+    """Record that a job's outputs were just used (served, downloaded), which keeps it alive"""
+    marker = job_path(job_id, ACCESS_MARKER)
+    try:
+        with open(marker, 'a'):
+            pass
+        os.utime(marker)
+    except OSError:
+        pass
+
+
+def last_used(job):
+    """When the job was last run or had its outputs served, as a timestamp"""
+    used = datetime.fromisoformat(job['updated_at']).timestamp()
+    try:
+        used = max(used, os.path.getmtime(job_path(job['id'], ACCESS_MARKER)))
+    except OSError:
+        pass
+    return used
+
+
+def job_ttl_seconds(job):
+    return float(job['options'].get('ttl_hours') or DEFAULT_TTL_HOURS) * 3600
+
+
+def class_paths(job_id, artifact_class):
+    patterns = dict(ARTIFACT_CLASSES)[artifact_class]
+    paths = []
+    for pattern in patterns:
+        paths += glob.glob(job_path(job_id, pattern))
+    return paths
+
+
+def disk_usage():
+    return path_size(JOBS_FOLDER) if os.path.isdir(JOBS_FOLDER) else 0
+
+
+def evict_artifacts(job_id, artifact_class):
+    """Delete one class of a job's artifacts and note it on the record; returns bytes freed (0 if the job is busy)"""
+    try:
+        lock = claim_job(job_id)
+    except FileNotFoundError:  # Removed by another sweep
+        return 0
+    if lock is None:
+        return 0
+    try:
+        job = load_job(job_id)
+        if job is None:
+            return 0
+        freed = 0
+        for path in class_paths(job_id, artifact_class):
+            freed += path_size(path)
+            remove_path(path)
+        if artifact_class not in job.get('evicted', []):
+            job.setdefault('evicted', []).append(artifact_class)
+            save_job(job)
+        return freed
+    finally:
+        release_job(lock)
+
+
+def remove_job(job_id):
+    """Delete a whole job folder unless the job is running; returns bytes freed"""
+    try:
+        lock = claim_job(job_id)
+    except FileNotFoundError:  # Removed by another sweep
+        return 0
+    if lock is None:
+        return 0
+    try:
+        freed = path_size(job_dir(job_id))
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+        return freed
+    finally:
+        release_job(lock)
+
+
+def sweep(protected=(), upload_folder=None):
+    """Remove expired jobs, then evict artifacts of idle jobs (LRU first) until under the disk quota"""
+    now = time.time()
+    protected = set(protected)
+    removed = 0
+    freed = 0
+
+    candidates = []
+    uploads_in_use = set()
+    for job in list_jobs():
+        idle = now - last_used(job)
+        in_use = job['id'] in protected or idle < MIN_IDLE_SECONDS
+        # Interrupted jobs expire too, or one that never resumes would be kept forever
+        if not in_use and idle > job_ttl_seconds(job):
+            freed += remove_job(job['id'])
+            removed += 1
+            continue
+        options = job.get('options') or {}
+        if options.get('source_type') == 'file':
+            uploads_in_use.add(os.path.abspath(options['video_source']))
+        if not in_use and job.get('status') in FINISHED_STATUSES:
+            candidates.append((last_used(job), job['id']))
+
+    # Stale uploads from requests that never got as far as a job, or whose job has expired
+    if upload_folder and os.path.isdir(upload_folder):
+        for name in os.listdir(upload_folder):
+            path = os.path.join(upload_folder, name)
+            if os.path.abspath(path) in uploads_in_use:
+                continue
+            try:
+                modified = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if now - modified > DEFAULT_TTL_HOURS * 3600:
+                freed += path_size(path)
+                remove_path(path)
+
+    expired, cache_freed = render_cache.expire(DEFAULT_TTL_HOURS * 3600)
+    removed += expired
+    freed += cache_freed
+
+    usage = disk_usage()
+    if usage > DISK_QUOTA_BYTES:
+        target = DISK_QUOTA_BYTES * QUOTA_LOW_WATER
+        # Cached renders no job links to any more are the cheapest to lose
+        evicted = render_cache.evict(usage - target)
+        if evicted:
+            print(f"[INFO] Evicted {evicted // (1024 * 1024)} MB of cached renders")
+        usage -= evicted
+        freed += evicted
+        candidates.sort()
+        for artifact_class, _ in ARTIFACT_CLASSES:
+            for _, job_id in candidates:
+                if usage <= target:
+                    break
+                evicted = evict_artifacts(job_id, artifact_class)
+                if evicted:
+                    print(f"[INFO] Evicted {artifact_class} artifacts of job {job_id} ({evicted // (1024 * 1024)} MB)")
+                usage -= evicted
+                freed += evicted
+            if usage <= target:
+                break
+        # Files the evicted jobs shared with the render cache are only freed once the cache lets go of them too
+        usage = disk_usage()
+        if usage > target:
+            evicted = render_cache.evict(usage - target)
+            usage -= evicted
+            freed += evicted
+        if usage > DISK_QUOTA_BYTES:
+            print(f"[WARNING] Disk usage {usage // (1024 * 1024)} MB is still over the quota; remaining jobs are in use")
+
+    if removed or freed:
+        print(f"🧹 Sweep removed {removed} expired jobs and cached renders and freed {freed // (1024 * 1024)} MB")
+    return {'removed_jobs': removed, 'freed_bytes': freed, 'usage_bytes': usage}
+
+
+def storage_stats():
+    return {
+        'usage_bytes': disk_usage(),
+        'quota_bytes': DISK_QUOTA_BYTES,
+        'default_ttl_hours': DEFAULT_TTL_HOURS,
+        'jobs': len(list_jobs()),
+        'render_cache': render_cache.cache_stats(),
+    }
+
+
+_sweeper_started = False
+_sweeper_lock = threading.Lock()
+
+
+def request_sweep():
+    """Ask the sweeper to run soon, e.g. after a job has written new files; works from any worker"""
+    marker = os.path.join(JOBS_FOLDER, SWEEP_REQUEST_MARKER)
+    with suppress(OSError):
+        os.makedirs(JOBS_FOLDER, exist_ok=True)
+        with open(marker, 'a'):
+            pass
+        os.utime(marker)
+
+
+def sweep_requested_since(timestamp):
+    try:
+        return os.path.getmtime(os.path.join(JOBS_FOLDER, SWEEP_REQUEST_MARKER)) > timestamp
+    except OSError:
+        return False
+
+
+def start_sweeper(protected=lambda: (), upload_folder=None, interval=SWEEP_INTERVAL):
+    """
+    Run sweep() in a background thread every interval seconds, or sooner when
+    request_sweep() has been called. protected is a function returning job ids to keep.
+    """
+    global _sweeper_started
+    with _sweeper_lock:
+        if _sweeper_started:
+            return
+        _sweeper_started = True
+
+    def run():
+        while True:
+            started = time.time()
+            try:
+                sweep(protected(), upload_folder)
+            except Exception as e:
+                print(f"[ERROR] Artifact sweep failed: {e}")
+            while time.time() - started < interval and not sweep_requested_since(started):
+                time.sleep(min(SWEEP_POLL_SECONDS, interval))
+
+    threading.Thread(target=run, name='artifact-sweeper', daemon=True).start()
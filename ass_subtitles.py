@@ -0,0 +1,136 @@
+"""
+Build ASS subtitle files straight from word timings.
+
+Replaces the old VTT -> `ffmpeg -i x.vtt x.ass` -> restyle round-trip with a
+single in-process write per clip.
+"""
+
+# Same canvas ffmpeg uses when converting VTT to ASS, so font sizes keep their look
+PLAY_RES_X = 384
+PLAY_RES_Y = 288
+
+DEFAULT_STYLE = {
+    'fontname': 'Montserrat',
+    'fontsize': 16,
+    'primary_colour': '&H00FFFFFF',
+    'secondary_colour': '&H000000FF',
+    'outline_colour': '&H00000000',
+    'back_colour': '&H64000000',
+    'bold': -1,
+    'outline': 2,
+    'shadow': 2,
+    'alignment': 2,
+    'margin_l': 50,
+    'margin_r': 50,
+    'margin_v': 40,
+}
+
+# Colour applied to the word currently being spoken when highlighting is on (&HBBGGRR, yellow)
+DEFAULT_HIGHLIGHT_COLOUR = '&H00FFFF&'
+
+STYLE_FORMAT = ("Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+                "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+                "Alignment, MarginL, MarginR, MarginV, Encoding")
+EVENT_FORMAT = "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"
+
+
+def ass_timestamp(ms):
+    """Convert milliseconds to the ASS H:MM:SS.cc format"""
+    centiseconds = max(0, int(round(ms / 10.0)))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    return '%d:%02d:%02d.%02d' % (hours, minutes, seconds, centiseconds)
+
+
+def escape_ass_text(text):
+    """Keep transcript text from being read as override tags or line breaks"""
+    return (text.replace('\\', '/')
+                .replace('{', '(')
+                .replace('}', ')')
+                .replace('\r', ' ')
+                .replace('\n', ' '))
+
+
+def group_words(words, max_words=1, max_phrase_ms=2500, pause_ms=300):
+    """
+    Group (start_ms, end_ms, text) words into short phrases.
+
+    A phrase is closed when it reaches max_words, would run longer than
+    max_phrase_ms, the speaker pauses, or a word ends a sentence.
+    """
+    phrases = []
+    current = []
+
+    for word in words:
+        if current:
+            phrase_start = current[0][0]
+            previous_end = current[-1][1]
+            if (len(current) >= max_words
+                    or word[1] - phrase_start > max_phrase_ms
+                    or word[0] - previous_end >= pause_ms
+                    or current[-1][2].rstrip().endswith(('.', '?', '!'))):
+                phrases.append(current)
+                current = []
+        current.append(word)
+
+    if current:
+        phrases.append(current)
+    return phrases
+
+
+def build_style_section(style=None):
+    style = dict(DEFAULT_STYLE, **(style or {}))
+    return '\n'.join([
+        '[V4+ Styles]',
+        STYLE_FORMAT,
+        'Style: Default,{fontname},{fontsize},{primary_colour},{secondary_colour},{outline_colour},{back_colour},'
+        '{bold},0,0,0,100,100,0,0,1,{outline},{shadow},{alignment},{margin_l},{margin_r},{margin_v},1'.format(**style),
+    ])
+
+
+def build_events(words, max_words=1, highlight=False, highlight_colour=DEFAULT_HIGHLIGHT_COLOUR):
+    """Yield Dialogue lines for the given clip-relative (start_ms, end_ms, text) words"""
+    for phrase in group_words(words, max_words=max_words):
+        texts = [escape_ass_text(text) for _, _, text in phrase]
+        phrase_end = phrase[-1][1]
+
+        if not highlight:
+            yield 'Dialogue: 0,%s,%s,Default,,0,0,0,,%s' % (
+                ass_timestamp(phrase[0][0]), ass_timestamp(phrase_end), ' '.join(texts))
+            continue
+
+        # One event per word: the whole phrase stays on screen and the current word is recoloured
+        for i, (start, _, _) in enumerate(phrase):
+            end = phrase[i + 1][0] if i + 1 < len(phrase) else phrase_end
+            if end <= start:
+                continue
+            line = ' '.join(
+                '{\\c%s}%s{\\r}' % (highlight_colour, text) if j == i else text
+                for j, text in enumerate(texts)
+            )
+            yield 'Dialogue: 0,%s,%s,Default,,0,0,0,,%s' % (ass_timestamp(start), ass_timestamp(end), line)
+
+
+def build_ass(words, max_words=1, highlight=False, style=None, highlight_colour=DEFAULT_HIGHLIGHT_COLOUR):
+    """Return the full ASS document for one clip"""
+    lines = [
+        '[Script Info]',
+        'ScriptType: v4.00+',
+        'PlayResX: %d' % PLAY_RES_X,
+        'PlayResY: %d' % PLAY_RES_Y,
+        'ScaledBorderAndShadow: yes',
+        '',
+        build_style_section(style),
+        '',
+        '[Events]',
+        EVENT_FORMAT,
+    ]
+    lines.extend(build_events(words, max_words=max_words, highlight=highlight, highlight_colour=highlight_colour))
+    return '\n'.join(lines) + '\n'
+
+
+def write_ass(path, words, **options):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(build_ass(words, **options))
+    return path
@@ -0,0 +1,119 @@
+"""
+Minimal asyncio client for the AssemblyAI REST API.
+
+The SDK's Transcriber.transcribe() blocks a thread for the whole upload and
+polling loop. Here the audio is uploaded once, transcription requests are
+submitted, and their status is polled with asyncio.sleep between checks, so
+one event loop can wait on many transcriptions at almost no cost. Every HTTP
+request goes through the shared AssemblyAI rate limiter and retry policy.
+"""
+import os
+import asyncio
+
+from providers import ASSEMBLYAI
+
+ASSEMBLYAI_BASE_URL = os.getenv('ASSEMBLYAI_BASE_URL', 'https://api.assemblyai.com')
+POLL_INTERVAL = float(os.getenv('ASSEMBLYAI_POLL_INTERVAL', '3'))
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+
+class TranscriptionError(RuntimeError):
+    pass
+
+
+async def _request(client, method, url, **kwargs):
+    """One API request under the provider limits; 429s, timeouts and 5xx are retried"""
+    async def send():
+        # Upload bodies are generators, so build them again for each attempt
+        request_kwargs = dict(kwargs)
+        if callable(request_kwargs.get('content')):
+            request_kwargs['content'] = request_kwargs['content']()
+        response = await client.request(method, url, **request_kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    return await ASSEMBLYAI.call(send)
+
+
+def create_client(api_key=None):
+    import httpx
+
+    api_key = api_key or os.getenv('ASSEMBLYAI_API_KEY')
+    if not api_key:
+        raise RuntimeError("ASSEMBLYAI_API_KEY not found in environment variables")
+    return httpx.AsyncClient(
+        base_url=ASSEMBLYAI_BASE_URL,
+        headers={'authorization': api_key},
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
+
+async def upload_file(client, path):
+    """Upload a local audio file and return the URL AssemblyAI can read it from"""
+    async def chunks():
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(UPLOAD_CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+
+    response = await _request(client, 'POST', '/v2/upload', content=chunks)
+    return response['upload_url']
+
+
+async def submit_transcript(client, audio_url, language_code=None, audio_start_from=None, audio_end_at=None,
+                            speech_model='universal'):
+    """Queue a transcription and return its id without waiting for it"""
+    body = {'audio_url': audio_url, 'speech_model': speech_model}
+    if language_code:
+        body['language_code'] = language_code
+    if audio_start_from is not None:
+        body['audio_start_from'] = int(audio_start_from)
+    if audio_end_at is not None:
+        body['audio_end_at'] = int(audio_end_at)
+
+    response = await _request(client, 'POST', '/v2/transcript', json=body)
+    return response['id']
+
+
+async def wait_for_transcript(client, transcript_id, poll_interval=POLL_INTERVAL):
+    """Poll until the transcript is completed; raises TranscriptionError if it failed"""
+    while True:
+        transcript = await _request(client, 'GET', f'/v2/transcript/{transcript_id}')
+
+        if transcript['status'] == 'completed':
+            return transcript
+        if transcript['status'] == 'error':
+            raise TranscriptionError(transcript.get('error') or 'unknown error')
+
+        await asyncio.sleep(poll_interval)
+
+
+async def get_sentences(client, transcript_id):
+    response = await _request(client, 'GET', f'/v2/transcript/{transcript_id}/sentences')
+    return response.get('sentences', [])
+
+
+async def transcribe(client, audio_url, with_sentences=False, **config):
+    """
+    Submit a transcription and wait for it. Returns a dict with the transcript
+    id, its words and (if asked for) its sentences, each with start/end in ms.
+    """
+    transcript_id = await submit_transcript(client, audio_url, **config)
+    transcript = await wait_for_transcript(client, transcript_id)
+
+    result = {
+        'id': transcript_id,
+        'words': [
+            {'text': w['text'], 'start': w['start'], 'end': w['end'],
+             'confidence': w.get('confidence'), 'speaker': w.get('speaker')}
+            for w in transcript.get('words') or []
+        ],
+    }
+    if with_sentences:
+        result['sentences'] = [
+            {'text': s['text'], 'start': s['start'], 'end': s['end']}
+            for s in await get_sentences(client, transcript_id)
+        ]
+    return result
@@ -0,0 +1,217 @@
+"""
+Command-line batch processing for Clipah.
+
+Takes video URLs, YouTube playlists/channels or a folder of local files and
+runs them all through the pipeline. All jobs run as coroutines on one event
+loop, and each pipeline phase has its own bounded slot pool, so job N+1 can
+download and transcribe while job N is rendering.
+
+Examples:
+    python batch.py https://youtu.be/abc https://youtu.be/def
+    python batch.py --playlist "https://www.youtube.com/playlist?list=..." --subtitles
+    python batch.py --channel https://www.youtube.com/@somechannel --limit 20
+    python batch.py --dir ./videos --language English --watermark "@me"
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+
+# Batch runs manage their own jobs; don't let importing the web app resume old ones
+os.environ.setdefault('RESUME_JOBS_ON_START', 'false')
+
+import yt_dlp
+import app
+from job_store import create_job, job_path
+from providers import provider_stats
+from render import SUPPORTED_RATIOS
+from stage_pools import StagePools
+
+
+def enumerate_playlist(url, limit=None):
+    """List the video URLs of a playlist or channel without downloading anything (flat extraction)"""
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'skip_download': True,
+    }
+    if limit:
+        opts['playlistend'] = limit
+
+    urls = []
+
+    def collect(info):
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            if entry.get('_type') == 'playlist' or (entry.get('ie_key') == 'YoutubeTab' and entry.get('url')):
+                # Channels list their tabs (Videos, Shorts, ...) as nested playlists
+                with yt_dlp.YoutubeDL(opts) as nested:
+                    collect(nested.extract_info(entry['url'], download=False))
+                if limit and len(urls) >= limit:
+                    return
+                continue
+            video_url = entry.get('url') or entry.get('webpage_url')
+            if not video_url and entry.get('id'):
+                video_url = f"https://www.youtube.com/watch?v={entry['id']}"
+            if video_url and video_url not in urls:
+                urls.append(video_url)
+            if limit and len(urls) >= limit:
+                return
+
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        collect(ydl.extract_info(url, download=False))
+
+    return urls[:limit] if limit else urls
+
+
+def enumerate_directory(path):
+    """List the supported video files in a folder"""
+    files = []
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if os.path.isfile(full_path) and app.allowed_file(name):
+            files.append(full_path)
+    return files
+
+
+def collect_sources(args):
+    """Return a list of (video_source, source_type) from the command-line arguments"""
+    sources = [(url, 'url') for url in args.urls]
+
+    if args.url_file:
+        with open(args.url_file, 'r', encoding='utf-8') as f:
+            sources += [(line.strip(), 'url') for line in f if line.strip() and not line.startswith('#')]
+
+    for playlist in (args.playlist or []) + (args.channel or []):
+        print(f"[INFO] Enumerating {playlist}...")
+        urls = enumerate_playlist(playlist, args.limit)
+        print(f"[INFO] Found {len(urls)} videos")
+        sources += [(url, 'url') for url in urls]
+
+    if args.dir:
+        sources += [(path, 'local') for path in enumerate_directory(args.dir)]
+
+    return sources
+
+
+def copy_outputs(job, output_root):
+    """Copy a finished job's final clips out of the job folder"""
+    final_folder = job_path(job['id'], 'output_clips_final')
+    if not os.path.isdir(final_folder):
+        return None
+    destination = os.path.join(output_root, job['id'])
+    shutil.copytree(final_folder, destination, dirs_exist_ok=True)
+    return destination
+
+
+async def run_batch(sources, options, limits, max_in_flight, output_root):
+    # Per-resource slot pools shared by all jobs; each stage holds a slot of its pool only while it runs
+    gate = StagePools(limits)
+    in_flight = asyncio.BoundedSemaphore(max_in_flight)
+    results = []
+
+    async def run_source(video_source, source_type):
+        job = None
+        started = time.time()
+        try:
+            job = create_job(app.build_job_options(video_source, source_type, **options))
+            print(f"[INFO] Job {job['id']} started: {video_source}")
+            ok = await app.run_job_async(job, stage_gate=gate)
+            destination = copy_outputs(job, output_root) if ok else None
+            error = job.get('error')
+        except Exception as e:
+            # One source failing outside its job (bad options, a full disk while copying) must not stop the batch
+            print(f"[ERROR] {video_source}: {e}")
+            ok, destination, error = False, None, str(e)
+        finally:
+            in_flight.release()
+        results.append({
+            'source': video_source,
+            'job_id': job['id'] if job else None,
+            'ok': ok,
+            'clips': len(job.get('clips') or []) if job else 0,
+            'seconds': time.time() - started,
+            'output': destination,
+            'error': error,
+        })
+
+    tasks = []
+    for video_source, source_type in sources:
+        # Only admit as many jobs as can usefully overlap; the rest wait here in order
+        await in_flight.acquire()
+        tasks.append(asyncio.create_task(run_source(video_source, source_type)))
+
+    await asyncio.gather(*tasks)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate clips for many videos in one run.")
+    parser.add_argument('urls', nargs='*', help="Video URLs to process")
+    parser.add_argument('--url-file', help="Text file with one URL per line")
+    parser.add_argument('--playlist', action='append', help="Playlist URL (repeatable)")
+    parser.add_argument('--channel', action='append', help="Channel URL (repeatable)")
+    parser.add_argument('--limit', type=int, help="Maximum number of videos per playlist/channel")
+    parser.add_argument('--dir', help="Folder of local video files")
+    parser.add_argument('--output', default='batch_output', help="Where finished clips are copied (default: batch_output)")
+
+    parser.add_argument('--language', default='Indonesian', choices=['Indonesian', 'English'])
+    parser.add_argument('--subtitles', action='store_true', help="Burn word-level subtitles into the clips")
+    parser.add_argument('--watermark', help="Watermark text (no watermark if omitted)")
+    parser.add_argument('--aspect-ratio', action='append', choices=list(SUPPORTED_RATIOS),
+                        help="Aspect ratio to render (repeatable: every clip is rendered in each; default 9:16)")
+
+    parser.add_argument('--download-workers', type=int, default=2, help="Concurrent downloads")
+    parser.add_argument('--analyze-workers', type=int, default=4, help="Concurrent transcription/LLM stages (remote API pool)")
+    parser.add_argument('--render-workers', type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Concurrent audio extraction/render stages (CPU pool)")
+    parser.add_argument('--max-in-flight', type=int, help="Jobs admitted at once (default: sum of the worker counts)")
+    args = parser.parse_args(argv)
+
+    sources = collect_sources(args)
+    if not sources:
+        parser.error("no videos to process")
+
+    limits = {
+        'network': args.download_workers,
+        'api': args.analyze_workers,
+        'cpu': args.render_workers,
+    }
+    max_in_flight = args.max_in_flight or sum(limits.values())
+    options = {
+        'language': args.language,
+        'include_subtitles': args.subtitles,
+        'include_watermark': bool(args.watermark),
+        'watermark_text': args.watermark or '@clipah.com',
+        'aspect_ratios': args.aspect_ratio or ['9:16'],
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    print(f"[INFO] Processing {len(sources)} videos (download={limits['network']}, "
+          f"transcribe/LLM={limits['api']}, audio/render={limits['cpu']}, in flight={max_in_flight})")
+
+    started = time.time()
+    results = asyncio.run(run_batch(sources, options, limits, max_in_flight, args.output))
+
+    print("=" * 80)
+    print(f"BATCH SUMMARY ({time.time() - started:.0f}s)")
+    print("=" * 80)
+    for result in results:
+        status = f"✅ {result['clips']} clips -> {result['output']}" if result['ok'] else f"❌ {result['error']}"
+        print(f"{result['job_id'] or '(no job)'}  {result['seconds']:7.0f}s  {result['source']}")
+        print(f"    {status}")
+
+    for stats in provider_stats():
+        print(f"{stats['provider']}: {stats['calls']} calls, {stats['retries']} retries, {stats['failures']} failures, "
+              f"queue wait avg {stats['queue_wait_avg_ms']}ms / p95 {stats['queue_wait_p95_ms']}ms / max {stats['queue_wait_max_ms']}ms")
+
+    failed = sum(1 for result in results if not result['ok'])
+    print(f"{len(results) - failed} succeeded, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
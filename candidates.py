@@ -0,0 +1,187 @@
+"""
+Local pre-ranking of clip candidates.
+
+On a long source, sending the whole transcript makes the LLM read everything
+to find a handful of moments. Instead, every window of consecutive cues of
+roughly clip length is scored here with cheap signals from the timeline:
+
+  - speech rate compared with the rest of the video (energy),
+  - clean pauses at the window edges and little dead air inside it,
+  - speaker turns (exchanges between people),
+  - questions (setups that usually get an answer),
+  - whether the window starts and ends on complete sentences.
+
+All windows are scored at once with numpy prefix sums, and only the best
+non-overlapping ones (padded with some context) plus a short summary of the
+whole video go to the LLM, which still makes the final picks and titles.
+"""
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from compact_transcript import merge_lines, line_ranges, encode
+
+# Sources shorter than this are sent whole; pre-ranking only pays off on long ones
+PRERANK_MIN_SECONDS = float(os.getenv('CLIP_PRERANK_MIN_MINUTES', '15')) * 60
+# Number of candidate windows sent to the LLM (0 disables pre-ranking)
+CANDIDATE_COUNT = int(os.getenv('CLIP_CANDIDATES', '12'))
+# Window lengths scored, in seconds, around the 30-70s the prompt asks for
+WINDOW_SECONDS = (35, 50, 70)
+# Context added on both sides of a window so the LLM can move the clip boundaries
+CONTEXT_SECONDS = 10
+# A gap inside a window longer than this counts as dead air
+DEAD_AIR_SECONDS = 2.0
+
+WEIGHTS = {
+    'rate': 1.0,
+    'edge_pauses': 0.75,
+    'dead_air': -1.0,
+    'turns': 0.75,
+    'questions': 1.0,
+    'complete': 1.0,
+}
+
+SENTENCE_END = ('.', '!', '?', '…', '"', '”', '？', '！', '。')
+
+
+def should_prerank(cues, count=CANDIDATE_COUNT):
+    if count <= 0 or not cues:
+        return False
+    return cues[-1]['end'] - cues[0]['start'] >= PRERANK_MIN_SECONDS
+
+
+def cue_features(cues):
+    """Per-cue arrays the window scores are built from"""
+    starts = np.array([cue['start'] for cue in cues], dtype=float)
+    # LLM-labelled VTTs can be slightly out of order; searchsorted needs non-decreasing ends
+    ends = np.maximum.accumulate(np.maximum(np.array([cue['end'] for cue in cues], dtype=float), starts))
+    words = np.array([len(cue['text'].split()) for cue in cues], dtype=float)
+    texts = [cue['text'].rstrip() for cue in cues]
+    speakers = [cue['speaker'] for cue in cues]
+
+    gaps = np.empty(len(cues))
+    gaps[0] = DEAD_AIR_SECONDS
+    gaps[1:] = np.clip(starts[1:] - ends[:-1], 0, None)
+    turns = np.zeros(len(cues))
+    turns[1:] = [a is not None and b is not None and a != b for a, b in zip(speakers, speakers[1:])]
+
+    return {
+        'starts': starts,
+        'ends': ends,
+        'words': words,
+        'speaking': np.maximum(ends - starts, 0.1),
+        'gaps': gaps,
+        'turns': turns,
+        'questions': np.array([text.endswith(('?', '？')) for text in texts], dtype=float),
+        'complete': np.array([text.endswith(SENTENCE_END) for text in texts], dtype=float),
+    }
+
+
+def score_windows(cues):
+    """
+    Score every window of consecutive cues of about each WINDOW_SECONDS length.
+    Returns arrays (first cue, last cue, score), one entry per window.
+    """
+    f = cue_features(cues)
+    count = len(cues)
+
+    def prefix(values):
+        return np.concatenate(([0.0], np.cumsum(values)))
+
+    words, speaking = prefix(f['words']), prefix(f['speaking'])
+    turns, questions = prefix(f['turns']), prefix(f['questions'])
+    dead_air = prefix(np.clip(f['gaps'] - DEAD_AIR_SECONDS, 0, None))
+
+    first = np.concatenate([np.arange(count)] * len(WINDOW_SECONDS))
+    targets = np.repeat(np.array(WINDOW_SECONDS, dtype=float), count)
+    # Last cue of each window: the first one ending at least target seconds after the window starts
+    last = np.minimum(np.searchsorted(f['ends'], f['starts'][first] + targets), count - 1)
+    stop = last + 1
+    minutes = np.maximum(f['ends'][last] - f['starts'][first], 1.0) / 60
+
+    global_rate = f['words'].sum() / f['speaking'].sum()
+    window_rate = (words[stop] - words[first]) / (speaking[stop] - speaking[first])
+    gap_after = np.append(f['gaps'][1:], DEAD_AIR_SECONDS)
+    previous_complete = np.append(1.0, f['complete'][:-1])
+
+    features = np.column_stack([
+        np.clip(window_rate / global_rate - 1, -1, 1),
+        np.minimum(f['gaps'][first], 1.5) + np.minimum(gap_after[last], 1.5),
+        # Gaps strictly inside the window
+        (dead_air[stop] - dead_air[first + 1]) / minutes,
+        np.minimum((turns[stop] - turns[first + 1]) / minutes, 6),
+        np.minimum(questions[stop] - questions[first], 3),
+        previous_complete[first] + f['complete'][last],
+    ])
+    # Put the signals on a common scale before weighting them
+    spread = features.std(axis=0)
+    features = (features - features.mean(axis=0)) / np.where(spread > 0, spread, 1)
+    scores = features @ np.array([WEIGHTS[name] for name in
+                                  ('rate', 'edge_pauses', 'dead_air', 'turns', 'questions', 'complete')])
+    return first, last, scores
+
+
+def select_candidates(cues, count=CANDIDATE_COUNT):
+    """Best non-overlapping windows as (first cue, last cue) pairs, in time order"""
+    first, last, scores = score_windows(cues)
+    starts = np.array([cue['start'] for cue in cues])
+    ends = np.array([cue['end'] for cue in cues])
+
+    chosen = []
+    for k in np.argsort(-scores, kind='stable'):
+        start, end = starts[first[k]], ends[last[k]]
+        if any(start < ends[b] and starts[a] < end for a, b in chosen):
+            continue
+        chosen.append((int(first[k]), int(last[k])))
+        if len(chosen) >= count:
+            break
+    return sorted(chosen)
+
+
+def global_summary(cues, opening_chars=400, keyword_count=15):
+    """A few lines describing the whole video: length, speakers, how it opens and its most frequent terms"""
+    duration = cues[-1]['end'] - cues[0]['start']
+    speakers = sorted({cue['speaker'] for cue in cues if cue['speaker']})
+    opening = ' '.join(cue['text'] for cue in cues)[:opening_chars]
+    terms = Counter(
+        word for cue in cues for word in re.findall(r'\w+', cue['text'].lower()) if len(word) >= 5 and not word.isdigit()
+    )
+
+    lines = [f"Video length: {int(duration // 60)} minutes, {len(cues)} subtitle lines."]
+    if speakers:
+        lines.append(f"Speakers: {', '.join(speakers)}.")
+    lines.append(f"Opening: {opening}...")
+    lines.append(f"Frequent terms: {', '.join(term for term, _ in terms.most_common(keyword_count))}.")
+    return '\n'.join(lines)
+
+
+def candidate_excerpts(cues, count=CANDIDATE_COUNT):
+    """(first cue, last cue) of the selected windows padded with context, overlapping ones merged, in time order"""
+    starts = np.array([cue['start'] for cue in cues])
+    ends = np.maximum.accumulate(np.array([cue['end'] for cue in cues]))
+
+    excerpts = []
+    for a, b in select_candidates(cues, count):
+        a = int(np.searchsorted(ends, starts[a] - CONTEXT_SECONDS))
+        b = max(b, int(np.searchsorted(starts, ends[b] + CONTEXT_SECONDS, side='right')) - 1)
+        # Windows whose context overlaps become one excerpt
+        if excerpts and a <= excerpts[-1][1] + 1:
+            excerpts[-1][1] = max(excerpts[-1][1], b)
+        else:
+            excerpts.append([a, b])
+    return [tuple(excerpt) for excerpt in excerpts]
+
+
+def build_candidate_transcript(cues, lines=None, count=CANDIDATE_COUNT):
+    """The summary and the compact lines of the selected windows (with context), for the analysis prompt"""
+    lines = lines if lines is not None else merge_lines(cues)
+    return '\n'.join([
+        global_summary(cues),
+        "",
+        "The full transcript is long, so only the most promising excerpts are included below. "
+        "Choose clips from within these excerpts.",
+        "",
+        encode(lines, line_ranges(lines, candidate_excerpts(cues, count))),
+    ])
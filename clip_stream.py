@@ -0,0 +1,75 @@
+"""
+Incremental parsing of the clip list an LLM streams back.
+
+The analysis prompt asks for a JSON array of clip objects, often wrapped in
+```json fences and some prose. ClipStreamParser is fed the text as it arrives
+and returns every top-level object of the array as soon as its closing brace
+is seen, so a clip can be rendered while the model is still writing the next.
+"""
+import json
+
+
+class ClipStreamParser:
+    def __init__(self):
+        self.state = 'before'  # before, inside or after the array
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.current = []
+
+    def feed(self, text):
+        """Consume a chunk of output; returns the clip objects completed by it"""
+        clips = []
+        for char in text:
+            if self.state != 'inside':
+                # Anything around the array (prose, ```json fences) is skipped
+                if self.state == 'before' and char == '[':
+                    self.state = 'inside'
+                continue
+
+            if self.depth:
+                self.current.append(char)
+                if self.in_string:
+                    if self.escaped:
+                        self.escaped = False
+                    elif char == '\\':
+                        self.escaped = True
+                    elif char == '"':
+                        self.in_string = False
+                elif char == '"':
+                    self.in_string = True
+                elif char in '{[':
+                    self.depth += 1
+                elif char in '}]':
+                    self.depth -= 1
+                    if not self.depth:
+                        clip = self._parse(''.join(self.current))
+                        if clip is not None:
+                            clips.append(clip)
+                        self.current = []
+            elif char == '{':
+                self.depth = 1
+                self.current = [char]
+            elif char == ']':
+                # End of the array; a later one (e.g. an example) is ignored
+                self.state = 'after'
+        return clips
+
+    @staticmethod
+    def _parse(text):
+        try:
+            clip = json.loads(text)
+        except ValueError as e:
+            print(f"[WARNING] Skipping a clip the model returned as invalid JSON: {e}")
+            return None
+        return clip if isinstance(clip, dict) else None
+
+
+def parse_clips_json(response_text):
+    """Parse a complete response the old way: strip ```json fences and load the whole array"""
+    response_text = response_text.strip()
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].strip()
+    return json.loads(response_text)
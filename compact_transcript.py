@@ -0,0 +1,208 @@
+"""
+Token-compact transcripts for LLM prompts.
+
+A VTT cue spends more tokens on its `00:00:00.008 --> 00:00:03.228` line and
+blank lines than on most of its text. Prompts get a compact form instead:
+
+    0 @0 A: Gue yakin, hidup itu seperti matahari. Ya, kadang terbit.
+    1 @7 B: Dan bagaimana kamu menyikapi hal itu?
+    2 @10 Tergantung situasinya.
+
+one numbered line per run of short cues by the same speaker, the whole seconds
+since the start of the video, and the speaker label only where the speaker
+changes. The model answers with line numbers, which are mapped back to the
+exact cue timestamps here, so it never has to copy or format a timestamp.
+"""
+import re
+
+TIMING_RE = re.compile(r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})')
+SPEAKER_RE = re.compile(r'^(Speaker [A-Z0-9]+)\s*:\s*')
+
+# Consecutive cues of one speaker are merged into a line up to this long...
+MERGE_MAX_SECONDS = 10.0
+# ...as long as the pause between them is shorter than this
+MERGE_MAX_GAP = 1.0
+
+# "12-18 B", "19: Speaker A", "20 A" in a diarization answer, one per row or several on a row ("1-4 A, 5-9 B")
+SPEAKER_RUN_RE = re.compile(r'\b(\d+)\s*(?:(?:-|–|to)\s*(\d+))?\s*[:=\-]?\s*(?:Speaker\s+)?([A-Z0-9]{1,2})\b')
+
+
+def _seconds(hours, minutes, seconds, millis):
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def parse_vtt(content):
+    """Cues of a (possibly speaker-labelled) VTT as dicts with start/end seconds, text, speaker and the original lines"""
+    cues = []
+    lines = (content or '').splitlines()
+    i = 0
+    while i < len(lines):
+        match = TIMING_RE.search(lines[i])
+        if not match:
+            i += 1
+            continue
+        timing = lines[i].strip()
+        text_lines = []
+        i += 1
+        while i < len(lines) and lines[i].strip() and not TIMING_RE.search(lines[i]):
+            text_lines.append(lines[i].strip())
+            i += 1
+
+        text = ' '.join(text_lines).strip('` ')
+        speaker_match = SPEAKER_RE.match(text)
+        cues.append({
+            'start': _seconds(*match.groups()[:4]),
+            'end': _seconds(*match.groups()[4:]),
+            'text': text[speaker_match.end():] if speaker_match else text,
+            'speaker': speaker_match.group(1) if speaker_match else None,
+            'block': '\n'.join([timing] + text_lines),
+        })
+    return cues
+
+
+def milliseconds_to_timecode(ms):
+    """HH:MM:SS.mmm, the format clip boundaries are stored in"""
+    # Integer arithmetic so 2300ms doesn't come out as 00:00:02.299
+    hours, ms = divmod(int(round(ms)), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    secs, ms = divmod(ms, 1000)
+    return '%.2d:%.2d:%.2d.%.3d' % (hours, minutes, secs, ms)
+
+
+def seconds_to_timecode(seconds):
+    return milliseconds_to_timecode(seconds * 1000)
+
+
+def merge_lines(cues, max_seconds=MERGE_MAX_SECONDS, max_gap=MERGE_MAX_GAP):
+    """
+    Group cues into prompt lines: consecutive cues of one speaker with short
+    pauses between them share a line. Each line keeps its time span and the
+    cue indices (first, last) it covers.
+    """
+    lines = []
+    for k, cue in enumerate(cues):
+        if not cue['text']:
+            continue
+        line = lines[-1] if lines else None
+        if (line is not None and cue['speaker'] == line['speaker']
+                and cue['start'] - line['end'] < max_gap and cue['end'] - line['start'] <= max_seconds):
+            line['text'] += ' ' + cue['text']
+            line['end'] = max(line['end'], cue['end'])
+            line['last'] = k
+        else:
+            lines.append({'start': cue['start'], 'end': max(cue['end'], cue['start']), 'text': cue['text'],
+                          'speaker': cue['speaker'], 'first': k, 'last': k})
+    return lines
+
+
+def line_ranges(lines, cue_ranges):
+    """Map (first cue, last cue) ranges onto the lines covering them"""
+    ranges = []
+    for a, b in cue_ranges:
+        covering = [n for n, line in enumerate(lines) if line['last'] >= a and line['first'] <= b]
+        if covering:
+            ranges.append((covering[0], covering[-1]))
+    return ranges
+
+
+def short_speaker(speaker):
+    return speaker[len('Speaker '):] if speaker and speaker.startswith('Speaker ') else speaker
+
+
+def encode(lines, ranges=None, with_speakers=True):
+    """
+    The compact text of lines (all of them, or only the given (first, last)
+    line ranges, separated by "..."). Line numbers are the lines' positions,
+    so an answer can be mapped back whichever lines were sent.
+    """
+    out = []
+    for a, b in ranges if ranges is not None else [(0, len(lines) - 1)]:
+        if out:
+            out.append('...')
+        speaker = None
+        for n in range(a, b + 1):
+            line = lines[n]
+            label = ''
+            if with_speakers and line['speaker'] and line['speaker'] != speaker:
+                label = f"{short_speaker(line['speaker'])}: "
+                speaker = line['speaker']
+            out.append(f"{n} @{int(line['start'])} {label}{line['text']}")
+    return '\n'.join(out)
+
+
+def format_description(with_speakers=True):
+    """How to read encode()'s output, for the prompt"""
+    description = ("Each transcript line is `<line number> @<seconds from the start of the video> <text>`")
+    if with_speakers:
+        description += (", with a speaker label (`A:`, `B:` ...) before the text wherever the speaker changes; "
+                        "lines without a label are spoken by the same speaker as the line before")
+    return description + ". `...` marks a jump to a later part of the video."
+
+
+def resolve_clip(clip_info, lines):
+    """
+    Turn the line numbers of a clip the model returned (start_line, end_line)
+    into start_time/end_time from the lines' exact timestamps. Returns None
+    if the clip doesn't point at valid lines.
+    """
+    try:
+        first = int(clip_info['start_line'])
+        last = int(clip_info.get('end_line', first))
+    except (KeyError, TypeError, ValueError):
+        # A model that answered with timestamps anyway is taken at its word
+        if clip_info.get('start_time') and clip_info.get('end_time'):
+            return clip_info
+        return None
+    if not lines or first > last or first < 0 or last >= len(lines):
+        return None
+    clip_info['start_time'] = seconds_to_timecode(lines[first]['start'])
+    clip_info['end_time'] = seconds_to_timecode(lines[last]['end'])
+    return clip_info
+
+
+def parse_speaker_runs(text, count):
+    """
+    Speaker label of each of count lines from a diarization answer listing
+    runs ("0-4 A"). Lines the answer skips keep the previous line's speaker.
+    """
+    labels = [None] * count
+    for match in SPEAKER_RUN_RE.finditer(text or ''):
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) else first
+        for n in range(max(first, 0), min(last, count - 1) + 1):
+            labels[n] = f"Speaker {match.group(3).upper()}"
+
+    previous = next((label for label in labels if label), None)
+    for n, label in enumerate(labels):
+        if label is None:
+            labels[n] = previous
+        previous = labels[n]
+    return labels
+
+
+def cue_labels(lines, line_labels, cue_count):
+    """
+    Speaker label of each cue from the labels of the lines merge_lines() built
+    from them. Cues no line covers (empty text) take the previous cue's speaker.
+    """
+    labels = [None] * cue_count
+    for line, label in zip(lines, line_labels):
+        for k in range(line['first'], line['last'] + 1):
+            labels[k] = label
+
+    previous = next((label for label in labels if label), None)
+    for k, label in enumerate(labels):
+        if label is None:
+            labels[k] = previous
+        previous = labels[k]
+    return labels
+
+
+def labelled_vtt(cues, labels):
+    """A VTT of cues with their original timestamps and a "Speaker X: " prefix from labels (one per cue)"""
+    out = ["WEBVTT", ""]
+    for cue, label in zip(cues, labels):
+        out.append(f"{seconds_to_timecode(cue['start'])} --> {seconds_to_timecode(cue['end'])}")
+        out.append(f"{label}: {cue['text']}" if label else cue['text'])
+        out.append("")
+    return '\n'.join(out)
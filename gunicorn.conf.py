@@ -0,0 +1,14 @@
+"""
+gunicorn settings hook (read from the working directory when gunicorn starts).
+
+Every worker imports app, but resuming interrupted jobs and sweeping old
+artifacts must only happen once per jobs folder: each worker asks, and the
+first to take the runner lock does it.
+"""
+
+
+def post_worker_init(worker):
+    from app import start_background_services
+
+    if start_background_services():
+        worker.log.info("Worker %s runs the background services", worker.pid)
@@ -0,0 +1,208 @@
+"""
+Durable job records for the processing pipeline.
+
+Every job gets its own folder under JOBS_FOLDER holding its working files and
+a job.json record. Each pipeline stage (and each clip inside the per-clip
+stages) writes its outputs and a completion marker to that record, so a job
+interrupted by a crash, restart or redeploy can resume from where it stopped
+instead of starting over from the download.
+"""
+import os
+import re
+import json
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is best-effort (single process in development)
+    fcntl = None
+
+JOBS_FOLDER = os.getenv('CLIPAH_JOBS_FOLDER', 'jobs')
+JOB_RECORD = 'job.json'
+LOCK_FILE = '.lock'
+RUNNER_LOCK_FILE = '.background.lock'
+# A job still pending after this long was submitted by a worker that died before starting it
+PENDING_STALE_SECONDS = 600
+
+# Job statuses that are finished and will not be resumed automatically
+FINISHED_STATUSES = ('completed', 'error')
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def job_dir(job_id):
+    return os.path.join(JOBS_FOLDER, job_id)
+
+
+def job_path(job_id, *parts):
+    # Empty parts are skipped: os.path.join would turn a trailing '' into a trailing separator
+    return os.path.join(JOBS_FOLDER, job_id, *(part for part in parts if part))
+
+
+def create_job(options):
+    """Create a new job folder and record for the given processing options"""
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_dir(job_id), exist_ok=True)
+
+    job = {
+        'id': job_id,
+        'created_at': _now(),
+        'updated_at': _now(),
+        'status': 'pending',
+        'message': '',
+        'progress': 0,
+        'error': None,
+        'options': options,
+        'stages': {},
+        'clip_stages': {},
+        'clips': [],
+    }
+    save_job(job)
+    return job
+
+
+def is_valid_job_id(job_id):
+    return bool(job_id) and re.fullmatch(r'[0-9a-f]{32}', job_id) is not None
+
+
+def load_job(job_id):
+    """Load a job record, or None if it doesn't exist or can't be read"""
+    if not is_valid_job_id(job_id):
+        return None
+    record_path = job_path(job_id, JOB_RECORD)
+    try:
+        with open(record_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[ERROR] Could not read job record {record_path}: {e}")
+        return None
+
+
+def save_job(job):
+    """Write the job record atomically so a crash never leaves a half-written file"""
+    job['updated_at'] = _now()
+    record_path = job_path(job['id'], JOB_RECORD)
+    tmp_path = record_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, record_path)
+
+
+def list_jobs():
+    if not os.path.isdir(JOBS_FOLDER):
+        return []
+    jobs = []
+    for job_id in sorted(os.listdir(JOBS_FOLDER)):
+        job = load_job(job_id)
+        if job:
+            jobs.append(job)
+    return jobs
+
+
+def stage_done(job, stage):
+    return job['stages'].get(stage, {}).get('done', False)
+
+
+def stage_outputs(job, stage):
+    return job['stages'].get(stage, {}).get('outputs', {})
+
+
+def mark_stage_done(job, stage, outputs=None):
+    job['stages'][stage] = {
+        'done': True,
+        'outputs': outputs or {},
+        'finished_at': _now(),
+    }
+    save_job(job)
+
+
+def reset_stages(job, stages):
+    """Forget the completion markers of the given stages so they run again"""
+    for stage in stages:
+        job['stages'].pop(stage, None)
+        job['clip_stages'].pop(stage, None)
+    save_job(job)
+
+
+def clip_done(job, stage, index):
+    return str(index) in job['clip_stages'].get(stage, {})
+
+
+def mark_clip_done(job, stage, index, output=None):
+    job['clip_stages'].setdefault(stage, {})[str(index)] = output
+    save_job(job)
+
+
+def _claim(lock_path):
+    handle = open(lock_path, 'a+')
+    if fcntl is None:
+        return handle
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def claim_job(job_id):
+    """
+    Take an exclusive lock on a job so only one worker runs it.
+
+    Returns a handle to pass to release_job(), or None if another process
+    already holds the job. The lock is released automatically if the
+    process dies, which is what lets a restarted worker pick the job up.
+    """
+    return _claim(job_path(job_id, LOCK_FILE))
+
+
+def claim_background_runner():
+    """
+    Lock held for its whole life by the one process that runs the background
+    work (resuming jobs, sweeping artifacts) for JOBS_FOLDER. Returns the
+    handle to keep, or None if another process already has it.
+    """
+    os.makedirs(JOBS_FOLDER, exist_ok=True)
+    return _claim(os.path.join(JOBS_FOLDER, RUNNER_LOCK_FILE))
+
+
+def release_job(handle):
+    if handle is None:
+        return
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    finally:
+        handle.close()
+
+
+def is_job_locked(job_id):
+    handle = claim_job(job_id)
+    if handle is None:
+        return True
+    release_job(handle)
+    return False
+
+
+def _is_stale(job):
+    updated = datetime.fromisoformat(job['updated_at'])
+    return (datetime.now() - updated).total_seconds() > PENDING_STALE_SECONDS
+
+
+def find_resumable_jobs():
+    """
+    Jobs that were interrupted mid-run and aren't held by a live worker. A
+    pending job has only just been submitted and is about to be started by
+    its own worker, so it is left alone unless it has been pending for long.
+    """
+    return [job for job in list_jobs()
+            if job.get('status') not in FINISHED_STATUSES
+            and (job.get('status') != 'pending' or _is_stale(job))
+            and not is_job_locked(job['id'])]
@@ -0,0 +1,353 @@
+"""
+HTTP load test for the web tier.
+
+Starts the Flask app with the pipeline stubbed out (jobs walk through their
+stages on a timer and finish with placeholder clips of a realistic size) and
+drives it with virtual users that behave like the web UI: submit a video
+(upload or URL), poll /status until the job is done, preview every clip
+(a range request, as the <video> tags do) and download the zip. Each
+concurrency level runs for a fixed time and reports latency percentiles,
+throughput and error rates per route, for every gunicorn worker/thread
+configuration given, so those counts can be picked from data.
+
+Examples:
+    python load_test.py
+    python load_test.py --server 1x8 --server 2x4 --server 4x2 --concurrency 4,16,64
+    python load_test.py --url http://127.0.0.1:8000 --duration 60 --json results.json
+
+The stubbed app can also be served by hand: gunicorn 'load_test:stub_app()'.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit, quote
+
+# Stubbed jobs: how long one takes, how many clips it makes and how big they are
+STUB_JOB_SECONDS = float(os.getenv('LOADTEST_JOB_SECONDS', '10'))
+STUB_CLIPS = int(os.getenv('LOADTEST_CLIPS', '3'))
+STUB_CLIP_MB = float(os.getenv('LOADTEST_CLIP_MB', '8'))
+# Bytes a <video preload="metadata"> preview fetches
+PREVIEW_BYTES = 1024 * 1024
+REQUEST_TIMEOUT = 120
+
+
+def stub_app():
+    """The real Flask app with submit_job replaced by a timer-driven fake pipeline"""
+    os.environ.setdefault('RESUME_JOBS_ON_START', 'false')
+    import app as clipah
+    import render_cache
+
+    fixture = os.path.join(clipah.JOBS_FOLDER, 'loadtest_clip.mp4')
+    if not os.path.exists(fixture):
+        tmp_path = f"{fixture}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(os.urandom(int(STUB_CLIP_MB * 1024 * 1024)))
+        os.replace(tmp_path, fixture)
+
+    def run_stub_job(job):
+        clipah.update_job_status(job, status='processing', error=None)
+        stages = clipah.job_stages(job['options'])
+        for step, (name, _, _, _) in enumerate(stages, start=1):
+            clipah.update_job_status(job, message=f"{name}: stubbed", progress=int(step / len(stages) * 100) - 1)
+            time.sleep(STUB_JOB_SECONDS / len(stages))
+
+        clips = []
+        for i in range(STUB_CLIPS):
+            clip = {'clip_title': f"Clip {i+1}", 'start_time': f"00:0{i}:00.000", 'end_time': f"00:0{i}:45.000",
+                    'summary': 'Load test clip', 'full_text': 'Load test clip'}
+            basename = clipah.clip_basename(i, clip)
+            for folder, name in (('output_clips', f"{basename}.mp4"), ('output_clips_final', f"{basename}_final.mp4")):
+                os.makedirs(clipah.job_path(job['id'], folder), exist_ok=True)
+                # Hardlinks: thousands of jobs share one file on disk
+                render_cache.link_or_copy(fixture, clipah.job_path(job['id'], folder, name))
+            clips.append(clip)
+        clipah.remove_uploaded_source(job)
+        clipah.update_job_status(job, status='completed', message='Processing completed successfully!',
+                                 progress=100, clips=clips)
+
+    def submit_stub_job(job):
+        threading.Thread(target=run_stub_job, args=(job,), daemon=True).start()
+
+    clipah.submit_job = submit_stub_job
+    return clipah.app
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def safe_title(title):
+    """The clip file name the web UI builds from a clip title (see static/script.js)"""
+    return ' '.join(''.join(c for c in title if c.isalnum() or c in ' _').split())
+
+
+class VirtualUser:
+    """One client running the web UI's flow in a loop until the deadline"""
+
+    def __init__(self, base_url, deadline, record, upload_bytes, upload_share, poll_interval):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.deadline = deadline
+        self.record = record
+        self.upload_bytes = upload_bytes
+        self.upload_share = upload_share
+        self.poll_interval = poll_interval
+        self.connection = None
+
+    def _send(self, method, path, body, headers):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        self.connection.request(method, path, body=body, headers=headers or {})
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def request(self, route, method, path, body=None, headers=None):
+        """Send one request, record it under route; returns (status, body) or (None, None) on a network error"""
+        started = time.perf_counter()
+        try:
+            reused = self.connection is not None
+            try:
+                response, data = self._send(method, path, body, headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused or method != 'GET':
+                    raise
+                # The server closed an idle keep-alive connection; a browser retries on a new one too
+                self.connection.close()
+                self.connection = None
+                response, data = self._send(method, path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            self.record(route, None, time.perf_counter() - started, 0, type(e).__name__)
+            return None, None
+        self.record(route, response.status, time.perf_counter() - started, len(data),
+                    None if response.status < 400 else f"HTTP {response.status}")
+        return response.status, data
+
+    def submit(self):
+        if random.random() < self.upload_share:
+            boundary = uuid.uuid4().hex
+            fields = {'language': 'English', 'include_subtitles': 'true', 'include_watermark': 'true',
+                      'aspect_ratio': '9:16'}
+            body = b''.join(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+                for name, value in fields.items())
+            body += (f'--{boundary}\r\nContent-Disposition: form-data; name="video_file"; filename="load.mp4"\r\n'
+                     f'Content-Type: video/mp4\r\n\r\n').encode() + os.urandom(self.upload_bytes) + \
+                    f'\r\n--{boundary}--\r\n'.encode()
+            status, data = self.request('POST /process (upload)', 'POST', '/process', body,
+                                        {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        else:
+            body = json.dumps({'video_url': f'https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}',
+                               'language': 'English', 'include_subtitles': True, 'include_watermark': True})
+            status, data = self.request('POST /process (url)', 'POST', '/process', body,
+                                        {'Content-Type': 'application/json'})
+        if status != 200:
+            return None
+        return json.loads(data).get('job_id')
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            job_id = self.submit()
+            if not job_id:
+                time.sleep(self.poll_interval)
+                continue
+
+            clips = None
+            while time.monotonic() < self.deadline:
+                time.sleep(self.poll_interval)
+                status, data = self.request('GET /status', 'GET', f'/status?job_id={job_id}')
+                if status == 200:
+                    state = json.loads(data)
+                    if state['status'] in ('completed', 'error'):
+                        clips = state.get('clips') or []
+                        break
+            if clips is None:
+                break
+
+            for i, clip in enumerate(clips):
+                name = quote(f"{i+1}_{safe_title(clip.get('clip_title', ''))}_final.mp4")
+                self.request('GET /output_clips_final/<clip> (preview)', 'GET',
+                             f'/output_clips_final/{name}?job_id={job_id}',
+                             headers={'Range': f'bytes=0-{PREVIEW_BYTES - 1}'})
+            self.request('GET /download', 'GET', f'/download?job_id={job_id}')
+        if self.connection is not None:
+            self.connection.close()
+
+
+def run_level(base_url, concurrency, duration, upload_bytes, upload_share, poll_interval):
+    """Run concurrency virtual users for duration seconds; returns per-route stats"""
+    samples = []
+    lock = threading.Lock()
+
+    def record(route, status, seconds, size, error):
+        with lock:
+            samples.append((route, status, seconds, size, error))
+
+    deadline = time.monotonic() + duration
+    users = [VirtualUser(base_url, deadline, record, upload_bytes, upload_share, poll_interval)
+             for _ in range(concurrency)]
+    threads = [threading.Thread(target=user.run, daemon=True) for user in users]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(duration + REQUEST_TIMEOUT)
+    elapsed = time.monotonic() - started
+
+    routes = {}
+    for route, status, seconds, size, error in samples:
+        entry = routes.setdefault(route, {'latencies': [], 'errors': {}, 'bytes': 0})
+        entry['latencies'].append(seconds * 1000)
+        entry['bytes'] += size
+        if error:
+            entry['errors'][error] = entry['errors'].get(error, 0) + 1
+
+    stats = {}
+    for route, entry in sorted(routes.items()):
+        latencies = entry['latencies']
+        stats[route] = {
+            'requests': len(latencies),
+            'errors': sum(entry['errors'].values()),
+            'error_kinds': entry['errors'],
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': max(latencies),
+            'mb': entry['bytes'] / 2 ** 20,
+        }
+    total = sum(route['requests'] for route in stats.values())
+    return {
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests': total,
+        'requests_per_second': total / elapsed,
+        'mb_per_second': sum(route['mb'] for route in stats.values()) / elapsed,
+        'error_rate': sum(route['errors'] for route in stats.values()) / total if total else 0.0,
+        'routes': stats,
+    }
+
+
+def print_level(level):
+    print(f"\n📊 {level['concurrency']} users: {level['requests']} requests in {level['seconds']:.1f}s "
+          f"({level['requests_per_second']:.1f} req/s, {level['mb_per_second']:.1f} MB/s), "
+          f"{level['error_rate'] * 100:.1f}% errors")
+    print(f"   {'Route':<42}{'Reqs':>7}{'Errs':>6}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'MB':>8}")
+    for route, s in level['routes'].items():
+        print(f"   {route:<42}{s['requests']:>7}{s['errors']:>6}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}{s['mb']:>8.1f}")
+        if s['error_kinds']:
+            print(f"      errors: {', '.join(f'{kind} x{count}' for kind, count in s['error_kinds'].items())}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, process, timeout=60):
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            connection.request('GET', '/status')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def start_server(config, workdir):
+    """Serve the stubbed app with gunicorn (WORKERSxTHREADS, gthread workers) in workdir; returns (process, url)"""
+    workers, threads = (int(n) for n in config.lower().split('x'))
+    port = free_port()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, RESUME_JOBS_ON_START='false', CLIPAH_JOBS_FOLDER=os.path.join(workdir, 'jobs'))
+    command = [sys.executable, '-m', 'gunicorn', 'load_test:stub_app()', '--pythonpath', package_dir,
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads),
+               '--worker-class', 'gthread', '--timeout', str(REQUEST_TIMEOUT), '--log-level', 'warning']
+    # The app prints a line per status request; keep it out of the report
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+                               stderr=open(os.path.join(workdir, 'server.log'), 'w'))
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(url, process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process, url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the web app with the processing pipeline stubbed out.")
+    parser.add_argument('--url', help="Test an already running instance instead of starting the stubbed app")
+    parser.add_argument('--server', action='append',
+                        help="gunicorn WORKERSxTHREADS to start and test (repeatable; default 2x4)")
+    parser.add_argument('--concurrency', default='1,4,16,32', help="Comma-separated virtual user counts (default 1,4,16,32)")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per concurrency level (default 30)")
+    parser.add_argument('--upload-mb', type=float, default=5, help="Size of uploaded videos (default 5)")
+    parser.add_argument('--upload-share', type=float, default=0.5, help="Share of jobs submitted as uploads (default 0.5)")
+    parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds between /status polls (default 2, as the UI)")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    levels = [int(n) for n in args.concurrency.split(',') if n.strip()]
+    upload_bytes = int(args.upload_mb * 1024 * 1024)
+    targets = [(None, args.url)] if args.url else [(config, None) for config in (args.server or ['2x4'])]
+
+    results = []
+    for config, url in targets:
+        with tempfile.TemporaryDirectory() as workdir:
+            process = None
+            if url is None:
+                print(f"🚀 Starting the stubbed app with gunicorn {config} (workers x threads)")
+                process, url = start_server(config, workdir)
+            try:
+                for concurrency in levels:
+                    level = run_level(url, concurrency, args.duration, upload_bytes, args.upload_share,
+                                      args.poll_interval)
+                    level['server'] = config or url
+                    print_level(level)
+                    results.append(level)
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait(timeout=30)
+                    url = None
+
+    print("\n📈 Summary")
+    print(f"   {'Server':<24}{'Users':>6}{'req/s':>9}{'MB/s':>8}{'errors':>8}{'status p99 ms':>15}")
+    for level in results:
+        status = level['routes'].get('GET /status', {})
+        print(f"   {level['server']:<24}{level['concurrency']:>6}{level['requests_per_second']:>9.1f}"
+              f"{level['mb_per_second']:>8.1f}{level['error_rate'] * 100:>7.1f}%{status.get('p99_ms', 0):>15.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results saved to: {args.json}")
+    return 0 if all(level['error_rate'] == 0 for level in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Live progress and ETA for running jobs.
+
+Each stage's expected duration comes from a throughput model: seconds of
+media a stage gets through per wall-clock second, recorded per stage and
+source resolution from earlier jobs and kept in JOBS_FOLDER/throughput.json.
+Job progress is the share of the job's expected total time that is done,
+with the running stage counted by the fraction it reports (ffmpeg's progress
+output for renders) or, for remote calls that report nothing, by elapsed
+time against the model. The recorded rates double as capacity planning data.
+
+The live state of a running stage is also written to the job's folder
+(LIVE_FILE), so a /status request served by another worker process sees it.
+"""
+import os
+import json
+import time
+import threading
+
+from job_store import JOBS_FOLDER, job_path
+
+THROUGHPUT_FILE = os.path.join(JOBS_FOLDER, 'throughput.json')
+# Weight of the newest measurement in a stage's running average
+SMOOTHING = 0.3
+# Measurements of stages that took less than this say little about throughput
+MIN_MEASURED_SECONDS = 1.0
+
+# Media seconds per wall-clock second for stages without history yet
+DEFAULT_THROUGHPUT = {
+    'source': 20.0,
+    'audio': 100.0,
+    'transcribe': 10.0,
+    'raw_subtitles': 5000.0,
+    'diarize': 30.0,
+    'analyze': 60.0,
+    'clips': 2.0,
+    'subtitles': 5.0,
+    'finalize': 2.0,
+}
+# Clip seconds assumed before the analysis has picked the clips
+ESTIMATED_CLIP_SECONDS = 8 * 50
+# Stages without a fraction of their own are shown at most this far along
+UNREPORTED_CAP = 0.95
+# Live state of a running stage, next to job.json; job.json itself is only written by the job's runner
+LIVE_FILE = 'progress.json'
+# Fractions reported more often than this are written out at this pace
+LIVE_WRITE_INTERVAL = 0.5
+
+
+def resolution_bucket(height):
+    if not height:
+        return 'unknown'
+    for bucket in (480, 720, 1080, 1440):
+        if height <= bucket:
+            return f"{bucket}p"
+    return '2160p'
+
+
+class ThroughputModel:
+    def __init__(self, path=THROUGHPUT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.rates = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.rates = {}
+
+    def rate(self, stage, resolution):
+        """Media seconds per second for a stage: this resolution's history, any resolution's, or the default"""
+        with self.lock:
+            entry = self.rates.get(f"{stage}:{resolution}")
+            if entry is None:
+                same_stage = [value['rate'] for key, value in self.rates.items() if key.split(':')[0] == stage]
+                if same_stage:
+                    return sum(same_stage) / len(same_stage)
+                return DEFAULT_THROUGHPUT.get(stage)
+            return entry['rate']
+
+    def record(self, stage, resolution, media_seconds, wall_seconds):
+        if media_seconds <= 0 or wall_seconds < MIN_MEASURED_SECONDS:
+            return
+        measured = media_seconds / wall_seconds
+        with self.lock:
+            entry = self.rates.setdefault(f"{stage}:{resolution}", {'rate': measured, 'samples': 0})
+            if entry['samples']:
+                entry['rate'] = (1 - SMOOTHING) * entry['rate'] + SMOOTHING * measured
+            entry['samples'] += 1
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.rates, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def snapshot(self):
+        with self.lock:
+            return [{'stage': key.split(':')[0], 'resolution': key.split(':')[1],
+                     'media_seconds_per_second': round(value['rate'], 3), 'samples': value['samples']}
+                    for key, value in sorted(self.rates.items())]
+
+
+THROUGHPUT = ThroughputModel()
+
+# job id -> live state of the stage it is running in this process
+_live = {}
+# job id -> when its live state was last written to LIVE_FILE
+_written = {}
+# job id -> highest progress reported, so a revised estimate never moves the bar back
+_shown = {}
+_live_lock = threading.Lock()
+
+
+def _write_live(job_id, force=False):
+    """Write a job's live state for other processes (at most every LIVE_WRITE_INTERVAL unless forced); call with _live_lock held"""
+    now = time.monotonic()
+    if not force and now - _written.get(job_id, 0) < LIVE_WRITE_INTERVAL:
+        return
+    _written[job_id] = now
+    path = job_path(job_id, LIVE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_live[job_id], f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARNING] Could not write live progress of job {job_id}: {e}")
+
+
+def _remove_live(job_id):
+    _written.pop(job_id, None)
+    try:
+        os.remove(job_path(job_id, LIVE_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def _read_live(job_id):
+    """A job's live state from this process, or from LIVE_FILE if another process runs it"""
+    with _live_lock:
+        if job_id in _live:
+            return dict(_live[job_id], clips=dict(_live[job_id]['clips']))
+    try:
+        with open(job_path(job_id, LIVE_FILE), 'r', encoding='utf-8') as f:
+            live = json.load(f)
+    except (OSError, ValueError):
+        return None
+    live['clips'] = {int(index): value for index, value in live['clips'].items()}
+    return live
+
+
+def start_stage(job_id, stage, measure=True):
+    """
+    Note that a job started a stage. measure=False (e.g. a stage resuming
+    halfway) keeps the run out of the throughput history.
+    """
+    with _live_lock:
+        # Wall-clock start, so other processes can work out the elapsed time too
+        _live[job_id] = {'stage': stage, 'started': time.time(), 'fraction': None, 'clips': {},
+                         'measure': measure}
+        _write_live(job_id, force=True)
+
+
+def set_fraction(job_id, fraction):
+    with _live_lock:
+        if job_id in _live:
+            _live[job_id]['fraction'] = max(0.0, min(1.0, fraction))
+            _write_live(job_id)
+
+
+def set_clip_progress(job_id, index, fraction):
+    with _live_lock:
+        if job_id in _live:
+            _live[job_id]['clips'][index] = max(0.0, min(1.0, fraction))
+            _write_live(job_id)
+
+
+def finish_stage(job_id, media_seconds, resolution):
+    """Record the throughput of the stage that just finished (media_seconds processed) and clear the live state"""
+    with _live_lock:
+        live = _live.pop(job_id, None)
+        _remove_live(job_id)
+    if live and live['measure'] and media_seconds:
+        THROUGHPUT.record(live['stage'], resolution, media_seconds, time.time() - live['started'])
+
+
+def forget(job_id):
+    with _live_lock:
+        _live.pop(job_id, None)
+        _shown.pop(job_id, None)
+        _remove_live(job_id)
+
+
+def estimate(job_id, plan, resolution):
+    """
+    Progress (percent), ETA (seconds) and per-clip progress of a running job,
+    or None if the job isn't running a stage or its length isn't known yet.
+    plan lists (stage, media seconds, done) for each of the job's stages in order.
+    """
+    live = _read_live(job_id)
+    if live is None:
+        return None
+
+    done_time = remaining = 0.0
+    fraction = 0.0
+    for stage, media_seconds, done in plan:
+        rate = THROUGHPUT.rate(stage, resolution)
+        if media_seconds is None or (media_seconds and not rate):
+            return None
+        expected = media_seconds / rate if media_seconds else 0.0
+
+        if stage == live['stage']:
+            elapsed = max(0.0, time.time() - live['started'])
+            fraction = live['fraction']
+            if fraction is not None and fraction >= 0.05:
+                # Far enough in for the stage's own pace to beat the model
+                stage_remaining = elapsed * (1 - fraction) / fraction
+            else:
+                stage_remaining = max(0.0, expected - elapsed)
+                if fraction is None:
+                    fraction = min(UNREPORTED_CAP, elapsed / expected) if expected else 0.0
+            done_time += elapsed
+            remaining += stage_remaining
+        elif done:
+            done_time += expected
+        else:
+            remaining += expected
+
+    total = done_time + remaining
+    with _live_lock:
+        shown = _shown[job_id] = max(_shown.get(job_id, 0), min(99, int(done_time / total * 100)) if total else 0)
+    return {
+        'stage': live['stage'],
+        'stage_progress': int(fraction * 100),
+        'progress': shown,
+        'eta_seconds': int(remaining),
+        'clip_progress': {str(index): int(value * 100) for index, value in sorted(live['clips'].items())},
+    }
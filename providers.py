@@ -0,0 +1,245 @@
+"""
+Shared call layer for the remote APIs (AssemblyAI and Groq).
+
+Every request to a provider goes through Provider.call() (or Provider.stream()
+for streamed responses), which
+  - waits for a free slot (bounded concurrency per provider),
+  - takes requests (and, for LLMs, estimated tokens) from per-minute token buckets,
+  - retries rate limits, timeouts and 5xx errors with jittered exponential backoff,
+  - records how long calls waited in the queue, so quotas can be sized from real numbers.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously; callers reserve and then sleep off any debt"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take amount tokens now and return how many seconds to wait before they are really available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A single request larger than the whole budget would otherwise wait forever
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, amount=1):
+        delay = self.reserve(amount)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def estimate_tokens(text, expected_output=0):
+    """Rough token count for an LLM request (about 4 characters per token)"""
+    return len(text or '') // 4 + 1 + expected_output
+
+
+def status_code_of(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def retry_after_of(error):
+    """Seconds from a Retry-After header, if the error carries one"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    import httpx
+
+    # Timeouts and dropped connections; SDKs such as openai wrap the httpx error as __cause__
+    transient = (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError)
+    return isinstance(error, transient) or isinstance(error.__cause__, transient)
+
+
+class Provider:
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None, max_concurrency=4,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # asyncio semaphores belong to one event loop; the web app and the batch CLI use different ones
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.waiting = 0
+        self.in_flight = 0
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than what the provider asked for"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                setattr(self, key, getattr(self, key) + delta)
+
+    async def call(self, request, tokens=0):
+        """
+        Run request() (a function returning a fresh awaitable on every call, so it
+        can be retried) under this provider's limits and return its result.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self._admitted(tokens):
+                    return await request()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, open_stream, tokens=0):
+        """
+        Open a streaming response with open_stream() and hold this provider's
+        slot until the block exits. Only opening is retried; a failure while
+        reading is raised to the caller.
+        """
+        attempt = 0
+        while True:
+            async with self._admitted(tokens):
+                try:
+                    stream = await open_stream()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                else:
+                    yield stream
+                    return
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, error, attempt):
+        """Backoff before retry attempt + 1, or re-raise error when it should not be retried"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self._count(failures=1)
+            raise error
+        delay = self.backoff_delay(attempt, retry_after_of(error))
+        self._count(retries=1)
+        print(f"[WARNING] {self.name} call failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    @asynccontextmanager
+    async def _admitted(self, tokens):
+        """Hold a concurrency slot and rate-limit budget for one attempt, recording the queue wait"""
+        queued = time.monotonic()
+        self._count(waiting=1)
+        try:
+            async with self._semaphore():
+                if self.requests:
+                    await self.requests.acquire()
+                if self.tokens and tokens:
+                    await self.tokens.acquire(tokens)
+                wait = time.monotonic() - queued
+                with self._stats_lock:
+                    self._waits.append(wait)
+                    self.waiting -= 1
+                    self.in_flight += 1
+                    self.calls += 1
+                queued = None
+                if wait > 1:
+                    print(f"[INFO] {self.name} call waited {wait:.1f}s for a rate-limit slot")
+                try:
+                    yield
+                finally:
+                    self._count(in_flight=-1)
+        finally:
+            if queued is not None:
+                # Cancelled before getting through the limits
+                self._count(waiting=-1)
+
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._waits)
+            return {
+                'provider': self.name,
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'waiting': self.waiting,
+                'in_flight': self.in_flight,
+                'max_concurrency': self.max_concurrency,
+                'requests_per_minute': self.requests.capacity if self.requests else None,
+                'tokens_per_minute': self.tokens.capacity if self.tokens else None,
+                'queue_wait_avg_ms': int(sum(waits) / len(waits) * 1000) if waits else 0,
+                'queue_wait_p95_ms': int(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000) if waits else 0,
+                'queue_wait_max_ms': int(waits[-1] * 1000) if waits else 0,
+            }
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+MAX_RETRIES = _env_int('PROVIDER_MAX_RETRIES', 5)
+
+ASSEMBLYAI = Provider(
+    'AssemblyAI',
+    requests_per_minute=_env_int('ASSEMBLYAI_RPM', 600),
+    max_concurrency=_env_int('ASSEMBLYAI_MAX_CONCURRENCY', 16),
+    max_retries=MAX_RETRIES,
+)
+
+GROQ = Provider(
+    'Groq',
+    requests_per_minute=_env_int('GROQ_RPM', 30),
+    tokens_per_minute=_env_int('GROQ_TPM', 30000),
+    max_concurrency=_env_int('GROQ_MAX_CONCURRENCY', 4),
+    max_retries=MAX_RETRIES,
+)
+
+PROVIDERS = (ASSEMBLYAI, GROQ)
+
+
+def provider_stats():
+    return [provider.stats() for provider in PROVIDERS]
@@ -0,0 +1,286 @@
+"""
+ffmpeg rendering of clips.
+
+A clip segment is decoded once and, when several aspect ratios are wanted,
+split into one branch per ratio with its own crop and encoder, so every
+extra format costs encode time only.
+
+In batch mode all of a job's clips come out of one ffmpeg process: the
+source is read and decoded in a single ordered sweep from the first clip
+start to the last clip end, and trim/atrim branches cut each clip out of
+that stream. Overlapping or nearby clips no longer decode the same frames
+again, and N random-access reads become one sequential read.
+"""
+import os
+import re
+import tempfile
+import threading
+import subprocess
+from functools import lru_cache
+
+SUPPORTED_RATIOS = ('9:16', '1:1', '4:5', '16:9', 'original')
+
+VIDEO_CODEC_ARGS = ['-c:v', 'libx264', '-preset', 'medium']
+AUDIO_CODEC_ARGS = ['-c:a', 'aac']
+# Threads per encoder; a clip with three ratios runs three encoders
+ENCODER_THREADS = '2'
+# 'batch' renders up to BATCH_SIZE clips per ffmpeg process, 'per_clip' one process per clip
+RENDER_MODE = os.getenv('CLIP_RENDER_MODE', 'batch')
+BATCH_SIZE = int(os.getenv('CLIP_RENDER_BATCH_SIZE', '10'))
+# Bump when a change to the filters below changes the rendered output (part of the render cache key)
+RENDERER_VERSION = 1
+# Machine-readable progress on stdout (key=value blocks) twice a second
+PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats', '-stats_period', '0.5']
+
+
+@lru_cache(maxsize=None)
+def renderer_version():
+    """Everything besides the inputs that decides what a render looks like: filters, encoder settings, ffmpeg build"""
+    try:
+        build = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.split('\n')[0]
+    except FileNotFoundError:
+        build = 'unknown'
+    return f"{RENDERER_VERSION}|{' '.join(VIDEO_CODEC_ARGS + AUDIO_CODEC_ARGS)}|{build}"
+
+
+def remove_outputs(paths):
+    """
+    Unlink old outputs before rendering over them: they may be hardlinks shared
+    with the render cache, and ffmpeg would otherwise truncate the shared file.
+    """
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def parse_ratios(value):
+    """Accept '9:16', '9:16,1:1' or a list; returns the valid ratios in order without duplicates"""
+    if isinstance(value, str):
+        value = value.split(',')
+    ratios = []
+    for ratio in value or []:
+        ratio = ratio.strip()
+        if ratio not in SUPPORTED_RATIOS:
+            raise ValueError(f"Unsupported aspect ratio: {ratio}")
+        if ratio not in ratios:
+            ratios.append(ratio)
+    return ratios
+
+
+def ratio_suffix(ratio, primary):
+    """File name suffix for a ratio; the job's first ratio keeps the plain clip name"""
+    if ratio == primary:
+        return ''
+    return '_' + ratio.replace(':', 'x')
+
+
+def crop_filter(ratio):
+    """Centre crop to the ratio, keeping as much of the frame as possible (None for 'original')"""
+    if ratio == 'original':
+        return None
+    num, den = ratio.split(':')
+    # Even sizes, as libx264 needs them
+    return (f"crop=w='trunc(min(iw,ih*{num}/{den})/2)*2'"
+            f":h='trunc(min(ih,iw*{den}/{num})/2)*2'")
+
+
+def fade_filters(duration):
+    """Fade in/out to black, skipped for clips of a second or less"""
+    if duration <= 1.0:
+        return []
+    fade_duration = min(0.5, duration / 4)
+    return [f"fade=t=in:st=0:d={fade_duration:.3f}",
+            f"fade=t=out:st={duration - fade_duration:.3f}:d={fade_duration:.3f}"]
+
+
+def probe_media(path):
+    """
+    Duration in seconds, video height (None if unknown) and whether there is an
+    audio stream, from ffmpeg's input banner
+    """
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', path], capture_output=True, text=True)
+    duration = None
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    size = re.search(r'Video: .*?(\d{2,5})x(\d{2,5})', result.stderr)
+    return {'duration': duration, 'height': int(size.group(2)) if size else None,
+            'has_audio': 'Audio: ' in result.stderr}
+
+
+def branch_filters(label, filters, ratios, prefix):
+    """
+    Filter graph lines that take [label] through filters and fan it out to one
+    output per ratio. Returns (graph lines, output labels in ratio order).
+    """
+    lines = []
+    chain = ','.join(filters) if filters else 'null'
+    if len(ratios) == 1:
+        crop = crop_filter(ratios[0])
+        lines.append(f"[{label}]{chain}{',' + crop if crop else ''}[{prefix}o0]")
+        return lines, [f"{prefix}o0"]
+
+    split_labels = ''.join(f"[{prefix}s{n}]" for n in range(len(ratios)))
+    lines.append(f"[{label}]{chain},split={len(ratios)}{split_labels}")
+    outputs = []
+    for n, ratio in enumerate(ratios):
+        crop = crop_filter(ratio) or 'null'
+        lines.append(f"[{prefix}s{n}]{crop}[{prefix}o{n}]")
+        outputs.append(f"{prefix}o{n}")
+    return lines, outputs
+
+
+def output_args(video_label, audio_map, path):
+    maps = ['-map', f"[{video_label}]"]
+    if audio_map:
+        maps += ['-map', audio_map]
+    return maps + VIDEO_CODEC_ARGS + AUDIO_CODEC_ARGS + ['-threads', ENCODER_THREADS, path]
+
+
+def build_clip_command(source, start, end, ratios, outputs):
+    """ffmpeg command rendering source[start:end] (seconds) once per ratio into outputs (same order)"""
+    duration = end - start
+    lines, labels = branch_filters('0:v', fade_filters(duration), ratios, 'c')
+
+    command = ['ffmpeg', '-hide_banner', '-y',
+               '-ss', f"{start:.3f}", '-t', f"{duration:.3f}", '-i', source,
+               '-filter_complex', ';'.join(lines)]
+    for label, path in zip(labels, outputs):
+        command += output_args(label, '0:a?', path)
+    return command
+
+
+def build_batch_command(source, segments, ratios, has_audio=True, progress_output=False):
+    """
+    ffmpeg command rendering several clips in one sweep over the source.
+    segments is a list of (start, end, outputs) in seconds, outputs in ratio order.
+
+    With progress_output, the untrimmed stream also goes to a null output so
+    ffmpeg's reported out_time is the sweep position rather than some clip's.
+    """
+    sweep_start = min(start for start, _, _ in segments)
+    sweep_end = max(end for _, end, _ in segments)
+    count = len(segments)
+
+    lines = []
+    video_inputs = ['0:v'] * count
+    audio_inputs = ['0:a'] * count
+    branches = count + 1 if progress_output else count
+    if branches > 1:
+        video_inputs = [f"v{k}" for k in range(branches)]
+        lines.append(f"[0:v]split={branches}" + ''.join(f"[{label}]" for label in video_inputs))
+    if count > 1 and has_audio:
+        audio_inputs = [f"a{k}" for k in range(count)]
+        lines.append(f"[0:a]asplit={count}" + ''.join(f"[{label}]" for label in audio_inputs))
+
+    command = ['ffmpeg', '-hide_banner', '-y',
+               # Input seeking resets timestamps, so the trims below are relative to sweep_start
+               '-ss', f"{sweep_start:.3f}", '-t', f"{sweep_end - sweep_start:.3f}", '-i', source]
+    outputs_args = []
+    for k, (start, end, outputs) in enumerate(segments):
+        rel_start, rel_end = start - sweep_start, end - sweep_start
+        filters = [f"trim=start={rel_start:.3f}:end={rel_end:.3f}", 'setpts=PTS-STARTPTS'] + fade_filters(end - start)
+        video_lines, video_labels = branch_filters(video_inputs[k], filters, ratios, f"c{k}")
+        lines += video_lines
+
+        audio_labels = [None] * len(ratios)
+        if has_audio:
+            audio_chain = f"[{audio_inputs[k]}]atrim=start={rel_start:.3f}:end={rel_end:.3f},asetpts=PTS-STARTPTS"
+            if len(ratios) == 1:
+                lines.append(f"{audio_chain}[c{k}a0]")
+            else:
+                lines.append(f"{audio_chain},asplit={len(ratios)}" + ''.join(f"[c{k}a{n}]" for n in range(len(ratios))))
+            audio_labels = [f"[c{k}a{n}]" for n in range(len(ratios))]
+
+        for video_label, audio_label, path in zip(video_labels, audio_labels, outputs):
+            outputs_args += output_args(video_label, audio_label, path)
+
+    if progress_output:
+        # First output, so it's the one ffmpeg's progress report follows
+        outputs_args = ['-map', f"[{video_inputs[count]}]", '-f', 'null', '-'] + outputs_args
+    return command + ['-filter_complex', ';'.join(lines)] + outputs_args
+
+
+def run_ffmpeg(command, timeout=600, on_progress=None):
+    """
+    Run an ffmpeg command; raises RuntimeError with ffmpeg's output on failure.
+    on_progress, if given, is called with the output position in seconds
+    (ffmpeg's out_time) each time ffmpeg reports progress.
+    """
+    if on_progress is None:
+        try:
+            subprocess.run(command, capture_output=True, text=True, check=True, timeout=timeout)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"ffmpeg failed: {e.stderr[-2000:]}")
+        except subprocess.TimeoutExpired:
+            raise RuntimeError("ffmpeg timed out")
+        except FileNotFoundError:
+            raise RuntimeError("FFmpeg not found. Please install FFmpeg and add it to your PATH")
+        return
+
+    # stderr goes to a file: a pipe nobody reads while stdout is followed could fill up and stall ffmpeg
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+        try:
+            process = subprocess.Popen(command[:1] + PROGRESS_ARGS + command[1:], stdout=subprocess.PIPE,
+                                       stderr=stderr, text=True)
+        except FileNotFoundError:
+            raise RuntimeError("FFmpeg not found. Please install FFmpeg and add it to your PATH")
+
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                if key == 'out_time_us' and value.isdigit():
+                    on_progress(int(value) / 1_000_000)
+            process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+
+        if timed_out.is_set():
+            raise RuntimeError("ffmpeg timed out")
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg failed: {stderr.read()[-2000:]}")
+
+
+def render_clip(source, start, end, ratios, outputs, timeout=600, on_progress=None):
+    """Render one clip in every ratio; on_progress gets the fraction done (0-1)"""
+    duration = end - start
+    report = None
+    if on_progress:
+        report = lambda position: on_progress(min(1.0, position / duration))
+    remove_outputs(outputs)
+    run_ffmpeg(build_clip_command(source, start, end, ratios, outputs), timeout, report)
+
+
+def render_clips(source, segments, ratios, has_audio=True, timeout_per_clip=600, on_progress=None):
+    """
+    Render several clips (see build_batch_command) in one ffmpeg process.
+    on_progress gets a list with the fraction done (0-1) of each segment.
+    """
+    report = None
+    if on_progress:
+        sweep_start = min(start for start, _, _ in segments)
+        done = [0.0] * len(segments)
+
+        def report(position):
+            # ffmpeg's final report can name an earlier position; progress never goes back
+            position += sweep_start
+            for k, (start, end, _) in enumerate(segments):
+                done[k] = max(done[k], min(1.0, max(0.0, (position - start) / (end - start))))
+            on_progress(list(done))
+
+    for _, _, outputs in segments:
+        remove_outputs(outputs)
+    command = build_batch_command(source, segments, ratios, has_audio, progress_output=bool(on_progress))
+    run_ffmpeg(command, timeout_per_clip * len(segments), report)
@@ -0,0 +1,153 @@
+"""
+Content-addressed cache of rendered clips.
+
+A render is stored under a key hashed from everything that determines its
+bytes: the source file's content hash, the exact clip range, the aspect
+ratio, subtitle and watermark inputs, and the renderer version (encoder
+settings plus the ffmpeg build). Another job asking for the same variant gets
+a hardlink to the cached file instead of a new encode, so a popular video
+clipped by many users costs one encode per unique variant.
+
+The cache lives inside JOBS_FOLDER so hardlinks stay on one filesystem and
+the space counts toward the disk quota. Files are shared between the cache
+and job folders, so a cached path must never be written through: outputs are
+unlinked before they are rendered again (see render.remove_outputs).
+artifact_store's sweeper expires unused entries and evicts them first under
+disk pressure.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+from contextlib import suppress
+
+from job_store import JOBS_FOLDER
+
+CACHE_FOLDER = os.path.join(JOBS_FOLDER, 'render_cache')
+ENABLED = os.getenv('CLIPAH_RENDER_CACHE', 'true').lower() == 'true'
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def file_hash(path):
+    """sha256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(HASH_CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def cache_key(**parts):
+    """Key for a render described by parts (JSON-serialisable values)"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def cache_path(key):
+    return os.path.join(CACHE_FOLDER, key[:2], f"{key}.mp4")
+
+
+def contains(key):
+    return ENABLED and os.path.exists(cache_path(key))
+
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Different filesystem or no hardlink support
+        shutil.copy2(source, destination)
+
+
+def fetch(key, destination):
+    """Put the cached render for key at destination; False on a miss"""
+    path = cache_path(key)
+    if not ENABLED or not os.path.exists(path):
+        return False
+    try:
+        if os.path.exists(destination):
+            os.remove(destination)
+        link_or_copy(path, destination)
+        # mtime is the entry's last use, for expiry and LRU eviction
+        os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+def store(key, rendered_path):
+    """Add a finished render to the cache (a hardlink, so it takes no extra space)"""
+    if not ENABLED or not os.path.exists(rendered_path):
+        return
+    path = cache_path(key)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        link_or_copy(rendered_path, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARNING] Could not add {rendered_path} to the render cache: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def entries():
+    """(last used, size, path, also used by a job) for every cached render"""
+    found = []
+    if not os.path.isdir(CACHE_FOLDER):
+        return found
+    for root, _, files in os.walk(CACHE_FOLDER):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.append((st.st_mtime, st.st_size, path, st.st_nlink > 1))
+    return found
+
+
+def expire(max_idle_seconds):
+    """Remove entries unused for longer than max_idle_seconds; returns (entries removed, bytes freed)"""
+    now = time.time()
+    removed = freed = 0
+    for used, size, path, shared in entries():
+        if now - used > max_idle_seconds:
+            with suppress(FileNotFoundError):  # Another sweep got there first
+                os.remove(path)
+            removed += 1
+            # A file still linked from a job folder only goes once that job's copy does
+            freed += 0 if shared else size
+    return removed, freed
+
+
+def evict(bytes_needed):
+    """
+    Remove least recently used entries that no job folder links to until
+    bytes_needed are freed; returns bytes freed.
+    """
+    freed = 0
+    for used, size, path, shared in sorted(entries()):
+        if freed >= bytes_needed:
+            break
+        if shared:
+            continue
+        with suppress(FileNotFoundError):
+            os.remove(path)
+        freed += size
+    return freed
+
+
+def cache_stats():
+    cached = entries()
+    return {
+        'enabled': ENABLED,
+        'entries': len(cached),
+        'bytes': sum(size for _, size, _, _ in cached),
+        'shared_with_jobs': sum(1 for _, _, _, shared in cached if shared),
+    }
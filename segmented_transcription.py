@@ -0,0 +1,148 @@
+"""
+Segmented transcription for long audio.
+
+One transcription request for a 3-hour stream takes as long as the provider
+needs for 3 hours of audio. Here the audio is uploaded once and cut into
+segments of about SEGMENT_MINUTES, each transcribed as its own request
+(audio_start_from/audio_end_at on the same upload) so they run concurrently.
+
+Cuts are placed in the silence nearest each target boundary, so a cut rarely
+falls inside a word. Every segment also reaches OVERLAP_SECONDS past its cuts
+to give the recognizer context at the edges; when stitching, each segment
+only contributes the words between its own cuts, which drops the overlap's
+duplicates. Sentences are rebuilt from each segment's sentence boundaries
+over the words it kept. Timestamps are milliseconds from the start of the
+whole audio, as in a single transcription.
+"""
+import os
+import re
+import asyncio
+import subprocess
+
+import assemblyai_client
+
+ENABLED = os.getenv('TRANSCRIBE_SEGMENTED', 'true').lower() == 'true'
+# Audio shorter than this is transcribed in one request
+MIN_MINUTES = float(os.getenv('TRANSCRIBE_SEGMENT_MIN_MINUTES', '30'))
+SEGMENT_MINUTES = float(os.getenv('TRANSCRIBE_SEGMENT_MINUTES', '15'))
+OVERLAP_SECONDS = float(os.getenv('TRANSCRIBE_SEGMENT_OVERLAP', '5'))
+# How far from a target boundary to look for a silence to cut in
+SILENCE_SEARCH_SECONDS = 60.0
+SILENCE_NOISE = '-35dB'
+SILENCE_MIN_SECONDS = 0.4
+
+SILENCE_RE = re.compile(r'silence_(start|end): (-?[\d.]+)')
+
+
+def should_segment(duration):
+    return ENABLED and bool(duration) and duration >= MIN_MINUTES * 60 and duration > SEGMENT_MINUTES * 60
+
+
+def detect_silences(audio_path, timeout=1800):
+    """(start, end) seconds of every silence in the audio; empty if ffmpeg can't tell"""
+    command = ['ffmpeg', '-hide_banner', '-nostats', '-i', audio_path, '-vn',
+               '-af', f'silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_SECONDS}', '-f', 'null', '-']
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        print(f"[WARNING] Silence detection failed ({e}); cutting segments at fixed times")
+        return []
+
+    silences = []
+    start = None
+    for kind, value in SILENCE_RE.findall(result.stderr):
+        if kind == 'start':
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+
+def plan_cuts(duration, silences, segment_seconds=None):
+    """
+    Cut points (seconds, including 0 and duration) about segment_seconds
+    apart, each moved to the middle of the silence nearest its target.
+    """
+    segment_seconds = segment_seconds or SEGMENT_MINUTES * 60
+    count = max(1, round(duration / segment_seconds))
+    step = duration / count
+    cuts = [0.0]
+    for k in range(1, count):
+        target = k * step
+        nearby = [(abs((a + b) / 2 - target), -(b - a), (a + b) / 2) for a, b in silences
+                  if abs((a + b) / 2 - target) <= SILENCE_SEARCH_SECONDS and (a + b) / 2 > cuts[-1]]
+        # Nearest silence wins; among equally near ones the longest
+        cuts.append(min(nearby)[2] if nearby else target)
+    cuts.append(duration)
+    return cuts
+
+
+def _offset(words, request_start_ms):
+    """
+    What to add to a segment's timestamps to count from the whole audio's start:
+    nothing, unless the provider counted from the segment's start.
+    """
+    if request_start_ms and words and min(w['start'] for w in words) < request_start_ms - 1000:
+        return request_start_ms
+    return 0
+
+
+def stitch(segments):
+    """
+    One transcript from (transcript, keep_from_ms, keep_to_ms, request_start_ms)
+    segments in order: each segment keeps the words whose middle lies in its
+    own range, and its sentences cut down to those words.
+    """
+    words, sentences = [], []
+    for transcript, keep_from, keep_to, request_start in segments:
+        shift = _offset(transcript['words'], request_start)
+        segment_words = [dict(w, start=w['start'] + shift, end=w['end'] + shift) for w in transcript['words']]
+        kept = [w for w in segment_words if keep_from <= (w['start'] + w['end']) / 2 < keep_to]
+        words.extend(kept)
+
+        for sentence in transcript.get('sentences') or []:
+            start, end = sentence['start'] + shift, sentence['end'] + shift
+            sentence_words = [w for w in kept if start <= (w['start'] + w['end']) / 2 <= end]
+            if sentence_words:
+                sentences.append({'text': ' '.join(w['text'] for w in sentence_words),
+                                  'start': sentence_words[0]['start'], 'end': sentence_words[-1]['end']})
+    return {'words': words, 'sentences': sentences}
+
+
+async def transcribe_segmented(client, audio_url, duration, silences, on_progress=None, **config):
+    """
+    Transcribe an uploaded audio of duration seconds in concurrent segments
+    cut at silences. Returns the same shape as assemblyai_client.transcribe
+    with sentences, plus the segments' ids and ranges.
+    """
+    cuts = plan_cuts(duration, silences)
+    ranges = [(cuts[k], cuts[k + 1]) for k in range(len(cuts) - 1)]
+    print(f"[INFO] Transcribing {duration / 60:.0f} minutes of audio as {len(ranges)} concurrent segments "
+          f"cut at {', '.join(f'{c / 60:.1f}' for c in cuts[1:-1])} min")
+
+    done = 0
+
+    async def segment(start, end):
+        nonlocal done
+        request_start = max(0.0, start - OVERLAP_SECONDS)
+        request_end = min(duration, end + OVERLAP_SECONDS)
+        transcript = await assemblyai_client.transcribe(client, audio_url, with_sentences=True,
+                                                        audio_start_from=request_start * 1000,
+                                                        audio_end_at=request_end * 1000, **config)
+        done += 1
+        if on_progress:
+            on_progress(done / len(ranges))
+        return transcript, request_start
+
+    results = await asyncio.gather(*(segment(start, end) for start, end in ranges))
+
+    # The first and last segment keep everything before/after their outer cut
+    bounds = [(0 if k == 0 else start * 1000, float('inf') if k == len(ranges) - 1 else end * 1000)
+              for k, (start, end) in enumerate(ranges)]
+    stitched = stitch([(transcript, keep_from, keep_to, request_start * 1000)
+                       for (transcript, request_start), (keep_from, keep_to) in zip(results, bounds)])
+    stitched['id'] = results[0][0]['id']
+    stitched['segments'] = [{'id': transcript['id'], 'start': int(start * 1000), 'end': int(end * 1000)}
+                            for (transcript, _), (start, end) in zip(results, ranges)]
+    return stitched
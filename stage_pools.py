@@ -0,0 +1,111 @@
+"""
+Bounded resource pools for pipeline stages.
+
+Each stage waits on one kind of resource: downloads on the network, the
+transcription and LLM stages on remote APIs, audio extraction and rendering on
+local CPU, and the small file stages on disk. Every kind has its own pool of
+slots shared by all jobs, so one job's clips can keep the encoders busy while
+other jobs wait on AssemblyAI or Groq, and a job only holds a slot while a
+stage that needs it is running.
+
+When a pool is full, the job with the least work left goes next
+(shortest-remaining-first), so a short video isn't stuck behind a
+multi-hour one. Each second spent waiting lowers a job's place in the queue
+by AGING seconds of work, so long jobs can't be starved.
+"""
+import os
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+STAGE_POOLS = {
+    'source': 'network',
+    'audio': 'cpu',
+    'transcribe': 'api',
+    'raw_subtitles': 'io',
+    'diarize': 'api',
+    'analyze': 'api',
+    'clips': 'cpu',
+    'subtitles': 'api',
+    'finalize': 'cpu',
+    'package': 'io',
+}
+
+DEFAULT_LIMITS = {
+    'network': int(os.getenv('STAGE_POOL_NETWORK', '4')),
+    'api': int(os.getenv('STAGE_POOL_API', '16')),
+    # As many CPU stages as there are render threads, so ffmpeg work never queues unseen in the executor
+    'cpu': int(os.getenv('STAGE_POOL_CPU', os.getenv('RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))),
+    'io': int(os.getenv('STAGE_POOL_IO', '8')),
+}
+# Seconds of remaining work forgiven per second spent waiting for a slot
+AGING = float(os.getenv('STAGE_POOL_AGING', '10'))
+
+
+class FairPool:
+    """A pool of slots handed out to the waiter with the least (aged) remaining work"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self.waiters = []
+        self.order = itertools.count()
+
+    def _rank(self, waiter, now):
+        _, work, enqueued, seq = waiter
+        return (work - AGING * (now - enqueued), seq)
+
+    def _wake(self):
+        now = time.monotonic()
+        while self.active < self.limit and self.waiters:
+            waiter = min(self.waiters, key=lambda w: self._rank(w, now))
+            self.waiters.remove(waiter)
+            if waiter[0].done():
+                continue
+            self.active += 1
+            waiter[0].set_result(None)
+
+    async def acquire(self, work=0.0):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((future, work, time.monotonic(), next(self.order)))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as the wait was cancelled; pass it on
+                self.release()
+            else:
+                self.waiters = [w for w in self.waiters if w[0] is not future]
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def stats(self):
+        return {'limit': self.limit, 'active': self.active, 'waiting': len(self.waiters)}
+
+
+class StagePools:
+    """Handed to app.run_job_async as its stage_gate: stage_gate(stage, work) holds a slot of the stage's pool"""
+
+    def __init__(self, limits=None):
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.pools = {name: FairPool(name, limit) for name, limit in limits.items()}
+
+    @asynccontextmanager
+    async def __call__(self, stage, work=0.0):
+        pool = self.pools[STAGE_POOLS.get(stage, 'io')]
+        await pool.acquire(work)
+        try:
+            yield
+        finally:
+            pool.release()
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark for the web app.
+
+Imports app.py in fresh interpreters, the way a new gunicorn worker or an
+autoscaled instance does, and reports how long the import and the first
+request take, the process's peak memory, and whether any pipeline-only
+dependency was loaded on the way. Exits with status 1 when a run is over
+budget, so it can guard deploys.
+
+Examples:
+    python startup_benchmark.py
+    python startup_benchmark.py --runs 10 --budget-ms 400 --budget-mb 80
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Pipeline dependencies a web worker should only load once it runs a job
+PIPELINE_MODULES = ('yt_dlp', 'openai', 'httpx', 'numpy', 'assemblyai', 'moviepy')
+
+IMPORT_BUDGET_MS = int(os.getenv('STARTUP_IMPORT_BUDGET_MS', '500'))
+RSS_BUDGET_MB = int(os.getenv('STARTUP_RSS_BUDGET_MB', '60'))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/status')
+served = time.perf_counter()
+
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+except ImportError:
+    rss_mb = None
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'rss_mb': rss_mb,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+""" % (PIPELINE_MODULES,)
+
+
+def run_probe(jobs_folder):
+    env = dict(os.environ, RESUME_JOBS_ON_START='false', CLIPAH_JOBS_FOLDER=jobs_folder)
+    result = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app failed:\n{result.stderr[-2000:]}")
+    # app prints a few lines of its own while handling the request; the result is the last one
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how fast a fresh web worker imports app.py and starts serving.")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to measure (default 5)")
+    parser.add_argument('--budget-ms', type=int, default=IMPORT_BUDGET_MS,
+                        help=f"Median import time allowed (default {IMPORT_BUDGET_MS})")
+    parser.add_argument('--budget-mb', type=int, default=RSS_BUDGET_MB,
+                        help=f"Peak memory allowed per worker (default {RSS_BUDGET_MB})")
+    args = parser.parse_args(argv)
+
+    # A throwaway jobs folder, so importing app never touches real jobs
+    with tempfile.TemporaryDirectory() as jobs_folder:
+        runs = [run_probe(jobs_folder) for _ in range(args.runs)]
+
+    import_ms = statistics.median(run['import_ms'] for run in runs)
+    first_request_ms = statistics.median(run['first_request_ms'] for run in runs)
+    rss = [run['rss_mb'] for run in runs if run['rss_mb'] is not None]
+    rss_mb = max(rss) if rss else None
+    loaded = sorted({name for run in runs for name in run['loaded']})
+
+    print(f"📊 Startup over {args.runs} runs")
+    print(f"   Import app:     {import_ms:.0f} ms median (budget {args.budget_ms} ms)")
+    print(f"   First request:  {first_request_ms:.0f} ms median")
+    if rss_mb is not None:
+        print(f"   Peak memory:    {rss_mb:.0f} MB (budget {args.budget_mb} MB)")
+    print(f"   Pipeline modules loaded: {', '.join(loaded) if loaded else 'none'}")
+
+    over = []
+    if import_ms > args.budget_ms:
+        over.append(f"import took {import_ms:.0f} ms")
+    if rss_mb is not None and rss_mb > args.budget_mb:
+        over.append(f"peak memory was {rss_mb:.0f} MB")
+    if loaded:
+        over.append(f"{', '.join(loaded)} loaded at startup")
+    if over:
+        print(f"[ERROR] Over the startup budget: {'; '.join(over)}")
+        return 1
+    print("[SUCCESS] Within the startup budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The pipeline modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def jobs_folder(tmp_path, monkeypatch):
+    """An empty JOBS_FOLDER (with its render cache) for the modules that keep files there"""
+    import job_store
+    import artifact_store
+    import render_cache
+
+    folder = str(tmp_path / 'jobs')
+    monkeypatch.setattr(job_store, 'JOBS_FOLDER', folder)
+    monkeypatch.setattr(artifact_store, 'JOBS_FOLDER', folder)
+    monkeypatch.setattr(render_cache, 'CACHE_FOLDER', os.path.join(folder, 'render_cache'))
+    monkeypatch.setattr(render_cache, 'ENABLED', True)
+    return folder
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import artifact_store
+import job_store
+
+
+def make_job(hours_idle, status='completed', ttl_hours=24, sizes=None, upload=None):
+    options = {'video_source': upload or 'x', 'source_type': 'file' if upload else 'url', 'ttl_hours': ttl_hours}
+    job = job_store.create_job(options)
+    job['status'] = status
+    job_store.save_job(job)
+    for name, size in (sizes or {'main_video.mp4': 1000}).items():
+        path = job_store.job_path(job['id'], name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+    # save_job stamps updated_at, so the age is written into the record afterwards
+    job['updated_at'] = (datetime.now() - timedelta(hours=hours_idle)).isoformat(timespec='seconds')
+    with open(job_store.job_path(job['id'], job_store.JOB_RECORD), 'w') as f:
+        json.dump(job, f)
+    return job['id']
+
+
+@pytest.fixture
+def quota(monkeypatch):
+    def set_quota(quota_bytes):
+        monkeypatch.setattr(artifact_store, 'DISK_QUOTA_BYTES', quota_bytes)
+    return set_quota
+
+
+def test_sweep_removes_only_expired_idle_jobs(jobs_folder):
+    expired = make_job(hours_idle=30)
+    fresh = make_job(hours_idle=2)
+    protected = make_job(hours_idle=30)
+    long_lived = make_job(hours_idle=30, ttl_hours=48)
+
+    result = artifact_store.sweep(protected=[protected])
+    assert result['removed_jobs'] == 1
+    assert job_store.load_job(expired) is None
+    assert all(job_store.load_job(job_id) for job_id in (fresh, protected, long_lived))
+
+
+def test_sweep_skips_a_running_job(jobs_folder):
+    running = make_job(hours_idle=30, status='processing')
+    lock = job_store.claim_job(running)
+    try:
+        artifact_store.sweep()
+    finally:
+        job_store.release_job(lock)
+    assert job_store.load_job(running) is not None
+
+
+def test_sweep_keeps_uploads_of_jobs_that_have_not_expired(jobs_folder, tmp_path):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    old = time.time() - 30 * 3600
+    paths = {}
+    for name in ('failed.mp4', 'expired.mp4', 'orphan.mp4'):
+        paths[name] = uploads / name
+        paths[name].write_bytes(b'x')
+        os.utime(paths[name], (old, old))
+    make_job(hours_idle=2, status='error', upload=str(paths['failed.mp4']))
+    make_job(hours_idle=30, upload=str(paths['expired.mp4']))
+
+    artifact_store.sweep(upload_folder=str(uploads))
+    assert sorted(os.listdir(uploads)) == ['failed.mp4']
+
+
+def test_quota_evicts_sources_of_least_recently_used_jobs_first(jobs_folder, quota):
+    sizes = {'main_video.mp4': 4000, 'output_clips/1.mp4': 2000, 'output_clips_final/1.mp4': 2000}
+    older = make_job(hours_idle=5, sizes=sizes)
+    newer = make_job(hours_idle=3, sizes=sizes)
+    quota(artifact_store.disk_usage() - 2000)
+
+    artifact_store.sweep()
+    assert job_store.load_job(older)['evicted'] == ['source']
+    assert not os.path.exists(job_store.job_path(older, 'main_video.mp4'))
+    assert os.path.exists(job_store.job_path(older, 'output_clips_final', '1.mp4'))
+    assert 'evicted' not in job_store.load_job(newer)
+    assert os.path.exists(job_store.job_path(newer, 'main_video.mp4'))
+
+
+def test_removing_what_is_already_gone_counts_as_done(jobs_folder):
+    job_id = make_job(hours_idle=30)
+    artifact_store.remove_path(job_store.job_path(job_id, 'missing.mp4'))
+    assert artifact_store.remove_job(job_id) > 0
+    assert artifact_store.remove_job(job_id) == 0
+    assert artifact_store.evict_artifacts(job_id, 'source') == 0
+
+
+def test_concurrent_sweeps_finish_without_errors(jobs_folder, quota):
+    for i in range(40):
+        make_job(hours_idle=30 if i % 2 else 3, sizes={'main_video.mp4': 1000, 'output_clips/1.mp4': 500})
+    quota(1)
+
+    errors = []
+
+    def run():
+        try:
+            artifact_store.sweep()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert not any(os.path.exists(path) for path in artifact_store.class_paths('*', 'source'))
+
+
+def test_sweep_request_is_seen_through_the_jobs_folder(jobs_folder):
+    before = time.time() - 1
+    assert not artifact_store.sweep_requested_since(before)
+    artifact_store.request_sweep()
+    assert artifact_store.sweep_requested_since(before)
+    assert artifact_store.list_jobs() == []
@@ -0,0 +1,67 @@
+import candidates
+from compact_transcript import merge_lines
+
+HOT_START = 600.0
+
+
+def make_cues(minutes=20):
+    """Slow monologue with dead air, and one lively exchange of questions and answers at HOT_START"""
+    cues = []
+    t = 0.0
+    while t < minutes * 60:
+        if HOT_START <= t < HOT_START + 50:
+            speaker = 'Speaker A' if len(cues) % 2 else 'Speaker B'
+            text = ('Why would anyone ever do that to their own savings account?' if len(cues) % 2
+                    else 'Because nobody told them what compound interest really means for them.')
+            cues.append({'start': t, 'end': t + 3.0, 'text': text, 'speaker': speaker})
+            t += 3.2
+        else:
+            cues.append({'start': t, 'end': t + 3.0, 'text': 'and so well um', 'speaker': 'Speaker A'})
+            t += 6.0
+    return cues
+
+
+def test_should_prerank_only_long_sources():
+    cues = make_cues()
+    assert candidates.should_prerank(cues, count=5)
+    assert not candidates.should_prerank(cues[:20], count=5)
+    assert not candidates.should_prerank(cues, count=0)
+
+
+def test_best_candidate_is_the_lively_exchange():
+    cues = make_cues()
+    first, last, scores = candidates.score_windows(cues)
+    best = scores.argmax()
+    assert HOT_START - 10 <= cues[first[best]]['start'] < HOT_START + 50
+    assert len(first) == len(last) == len(scores) == len(cues) * len(candidates.WINDOW_SECONDS)
+
+
+def test_selected_candidates_do_not_overlap():
+    cues = make_cues()
+    chosen = candidates.select_candidates(cues, count=6)
+    assert 0 < len(chosen) <= 6
+    assert chosen == sorted(chosen)
+    for (a1, b1), (a2, b2) in zip(chosen, chosen[1:]):
+        assert cues[b1]['end'] <= cues[a2]['start']
+    assert any(cues[a]['start'] <= HOT_START + 30 and cues[b]['end'] >= HOT_START for a, b in chosen)
+
+
+def test_excerpts_add_context_and_merge():
+    cues = make_cues()
+    excerpts = candidates.candidate_excerpts(cues, count=6)
+    assert excerpts == sorted(excerpts)
+    for (a1, b1), (a2, b2) in zip(excerpts, excerpts[1:]):
+        assert b1 + 1 < a2
+
+
+def test_candidate_transcript_has_summary_and_real_line_numbers():
+    cues = make_cues()
+    lines = merge_lines(cues)
+    text = candidates.build_candidate_transcript(cues, lines, count=3)
+    assert text.startswith('Video length: 20 minutes')
+    assert 'Speakers: Speaker A, Speaker B.' in text
+    numbered = [row for row in text.splitlines() if row[:1].isdigit() and ' @' in row]
+    assert numbered
+    for row in numbered:
+        n, at = row.split(' ', 2)[:2]
+        assert int(at[1:]) == int(lines[int(n)]['start'])
@@ -0,0 +1,40 @@
+import pytest
+
+from clip_stream import ClipStreamParser, parse_clips_json
+
+RESPONSE = '''Here are the clips:
+```json
+[
+  {"clip_title": "Brace } in a \\"title\\" [1]", "start_line": 3, "end_line": 9, "summary": "a"},
+  {"clip_title": "Nested", "start_line": 12, "end_line": 20, "tags": {"mood": ["fun"]}},
+  {"clip_title": "Broken", "start_line": }
+]
+```
+For example: [{"clip_title": "ignored"}]'''
+
+
+def feed_in_chunks(text, size):
+    parser = ClipStreamParser()
+    clips = []
+    for i in range(0, len(text), size):
+        clips += parser.feed(text[i:i + size])
+    return clips
+
+
+@pytest.mark.parametrize('size', [1, 7, 10000])
+def test_parser_returns_each_clip_whatever_the_chunking(size):
+    clips = feed_in_chunks(RESPONSE, size)
+    assert [clip['clip_title'] for clip in clips] == ['Brace } in a "title" [1]', 'Nested']
+    assert clips[1]['tags'] == {'mood': ['fun']}
+
+
+def test_parser_returns_a_clip_as_soon_as_it_closes():
+    parser = ClipStreamParser()
+    assert parser.feed('[{"clip_title": "One", "start_line": 1') == []
+    assert parser.feed('}, {"clip_title": ') == [{'clip_title': 'One', 'start_line': 1}]
+
+
+def test_parse_clips_json_strips_fences():
+    assert parse_clips_json('```json\n[{"clip_title": "A"}]\n```') == [{'clip_title': 'A'}]
+    assert parse_clips_json('```\n[]\n```') == []
+    assert parse_clips_json(' [{"a": 1}] ') == [{'a': 1}]
@@ -0,0 +1,87 @@
+import compact_transcript
+from compact_transcript import (
+    parse_vtt, merge_lines, encode, resolve_clip, parse_speaker_runs, cue_labels, labelled_vtt
+)
+
+VTT = """WEBVTT
+
+00:00:00.000 --> 00:00:02.000
+Speaker A: Hello there.
+
+00:00:02.500 --> 00:00:04.000
+Speaker A: How are you?
+
+00:00:04.000 --> 00:00:05.000
+
+
+00:00:05.000 --> 00:00:07.000
+Speaker B: Fine, thanks.
+
+01:00:00.000 --> 01:00:01.500
+Speaker B: Much later.
+"""
+
+
+def test_parse_vtt_reads_times_speakers_and_empty_cues():
+    cues = parse_vtt(VTT)
+    assert [c['start'] for c in cues] == [0, 2.5, 4, 5, 3600]
+    assert cues[0]['speaker'] == 'Speaker A' and cues[0]['text'] == 'Hello there.'
+    assert cues[2]['text'] == '' and cues[2]['speaker'] is None
+    assert cues[4]['end'] == 3601.5
+
+
+def test_merge_lines_joins_one_speakers_cues_and_skips_empty_ones():
+    lines = merge_lines(parse_vtt(VTT))
+    assert [(l['first'], l['last']) for l in lines] == [(0, 1), (3, 3), (4, 4)]
+    assert lines[0]['text'] == 'Hello there. How are you?'
+
+
+def test_encode_labels_speaker_changes_and_marks_jumps():
+    lines = merge_lines(parse_vtt(VTT))
+    assert encode(lines) == "0 @0 A: Hello there. How are you?\n1 @5 B: Fine, thanks.\n2 @3600 Much later."
+    assert encode(lines, ranges=[(0, 0), (2, 2)], with_speakers=False) == \
+        "0 @0 Hello there. How are you?\n...\n2 @3600 Much later."
+
+
+def test_resolve_clip_maps_line_numbers_to_timestamps():
+    lines = merge_lines(parse_vtt(VTT))
+    clip = resolve_clip({'clip_title': 'x', 'start_line': '0', 'end_line': 1}, lines)
+    assert (clip['start_time'], clip['end_time']) == ('00:00:00.000', '00:00:07.000')
+    assert resolve_clip({'start_line': 1, 'end_line': 9}, lines) is None
+    assert resolve_clip({'start_line': 2, 'end_line': 1}, lines) is None
+
+
+def test_resolve_clip_keeps_timestamps_without_line_numbers():
+    clip = {'start_time': '00:00:01.000', 'end_time': '00:00:02.000'}
+    assert resolve_clip(dict(clip), []) == clip
+    assert resolve_clip({'clip_title': 'x'}, []) is None
+
+
+def test_parse_speaker_runs_reads_rows_and_fills_gaps():
+    assert parse_speaker_runs("0-1 A\n3: Speaker B\n4 b", 5) == \
+        ['Speaker A', 'Speaker A', 'Speaker A', 'Speaker B', 'Speaker B']
+
+
+def test_parse_speaker_runs_reads_several_runs_on_one_row():
+    assert parse_speaker_runs("1-4 A, 5-9 B", 10) == ['Speaker A'] * 5 + ['Speaker B'] * 5
+    assert parse_speaker_runs("Runs: 0 to 1 A; 2-3 B", 4) == ['Speaker A'] * 2 + ['Speaker B'] * 2
+
+
+def test_cue_labels_follow_lines_past_an_empty_cue():
+    # The diarization prompt sends one line per non-empty cue
+    cues = parse_vtt(VTT)
+    lines = merge_lines(cues, max_seconds=0)
+    assert [(l['first'], l['last']) for l in lines] == [(0, 0), (1, 1), (3, 3), (4, 4)]
+
+    labels = cue_labels(lines, ['Speaker A', 'Speaker A', 'Speaker B', 'Speaker C'], len(cues))
+    assert labels == ['Speaker A', 'Speaker A', 'Speaker A', 'Speaker B', 'Speaker C']
+
+    vtt = labelled_vtt(cues, labels)
+    assert "00:00:05.000 --> 00:00:07.000\nSpeaker B: Fine, thanks." in vtt
+    assert "01:00:00.000 --> 01:00:01.500\nSpeaker C: Much later." in vtt
+
+
+def test_timecodes_round_to_the_millisecond():
+    assert compact_transcript.seconds_to_timecode(3723.4567) == '01:02:03.457'
+    assert compact_transcript.milliseconds_to_timecode(2300) == '00:00:02.300'
+    assert compact_transcript.milliseconds_to_timecode(1999.6) == '00:00:02.000'
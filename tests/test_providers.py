@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from providers import Provider, TokenBucket
+
+
+class ServerError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type('Response', (), {'headers': {'retry-after': retry_after} if retry_after else {}})()
+
+
+def test_token_bucket_charges_debt_once_the_budget_is_spent():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0
+    # One request per second; the next one has to wait about a second
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+
+def test_token_bucket_caps_a_request_larger_than_the_budget():
+    bucket = TokenBucket(60)
+    bucket.reserve(10_000)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_backoff_never_undercuts_retry_after():
+    provider = Provider('Test', base_delay=1.0, max_delay=60.0)
+    for attempt in range(6):
+        assert 0 <= provider.backoff_delay(attempt) <= min(60.0, 2 ** attempt)
+        assert provider.backoff_delay(attempt, retry_after=30) >= 30
+    # A Retry-After beyond max_delay is capped like any other wait
+    assert provider.backoff_delay(0, retry_after=600) == 60.0
+
+
+def test_call_gives_up_after_max_retries():
+    provider = Provider('Test', max_retries=3, base_delay=0)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise ServerError(503)
+
+    with pytest.raises(ServerError):
+        asyncio.run(provider.call(request))
+    assert len(attempts) == 4
+    assert (provider.retries, provider.failures) == (3, 1)
+
+
+def test_call_does_not_retry_client_errors():
+    provider = Provider('Test', max_retries=3, base_delay=0)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise ServerError(400)
+
+    with pytest.raises(ServerError):
+        asyncio.run(provider.call(request))
+    assert len(attempts) == 1
+
+
+def test_call_retries_until_success():
+    provider = Provider('Test', max_retries=3, base_delay=0)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ServerError(429, retry_after='0')
+        return 'ok'
+
+    assert asyncio.run(provider.call(request)) == 'ok'
+    assert provider.retries == 2
+
+
+def test_counters_settle_after_cancellation():
+    provider = Provider('Test', max_concurrency=1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def request():
+            await release.wait()
+
+        running = asyncio.create_task(provider.call(request))
+        queued = asyncio.create_task(provider.call(request))
+        await asyncio.sleep(0.01)
+        assert (provider.in_flight, provider.waiting) == (1, 1)
+
+        queued.cancel()
+        running.cancel()
+        await asyncio.gather(running, queued, return_exceptions=True)
+
+    asyncio.run(main())
+    assert (provider.in_flight, provider.waiting) == (0, 0)
+
+
+def test_stream_holds_the_slot_until_the_block_exits():
+    provider = Provider('Test', max_concurrency=1, base_delay=0)
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        if len(opened) == 1:
+            raise ServerError(502)
+        return iter(['a', 'b'])
+
+    async def main():
+        async with provider.stream(open_stream) as stream:
+            assert provider.in_flight == 1
+            return list(stream)
+
+    assert asyncio.run(main()) == ['a', 'b']
+    assert len(opened) == 2
+    assert provider.in_flight == 0
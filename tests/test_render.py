@@ -0,0 +1,81 @@
+from render import build_batch_command, crop_filter
+
+
+def split_command(command):
+    """(input args, filter graph lines, [(mapped labels, output path)]) of an ffmpeg command"""
+    graph_at = command.index('-filter_complex')
+    graph = command[graph_at + 1].split(';')
+    outputs = []
+    maps = []
+    args = command[graph_at + 2:]
+    i = 0
+    while i < len(args):
+        if args[i] == '-map':
+            maps.append(args[i + 1])
+            i += 2
+        elif args[i] in ('-c:v', '-c:a', '-preset', '-threads', '-f'):
+            i += 2
+        else:
+            outputs.append((maps, args[i]))
+            maps = []
+            i += 1
+    return command[:graph_at], graph, outputs
+
+
+def test_single_clip_needs_no_split():
+    inputs, graph, outputs = split_command(build_batch_command('src.mp4', [(10, 20, ['a.mp4'])], ['9:16']))
+
+    assert inputs[-6:] == ['-ss', '10.000', '-t', '10.000', '-i', 'src.mp4']
+    assert len(graph) == 2
+    assert graph[0].startswith('[0:v]trim=start=0.000:end=10.000,setpts=PTS-STARTPTS,fade=t=in')
+    assert graph[0].endswith(crop_filter('9:16') + '[c0o0]')
+    assert graph[1] == '[0:a]atrim=start=0.000:end=10.000,asetpts=PTS-STARTPTS[c0a0]'
+    assert outputs == [(['[c0o0]', '[c0a0]'], 'a.mp4')]
+
+
+def test_clips_are_trimmed_relative_to_one_sweep():
+    segments = [(30, 40, ['a.mp4']), (12, 20, ['b.mp4']), (35, 50, ['c.mp4'])]
+    inputs, graph, outputs = split_command(build_batch_command('src.mp4', segments, ['original']))
+
+    # One read from the earliest start to the latest end
+    assert inputs[-6:] == ['-ss', '12.000', '-t', '38.000', '-i', 'src.mp4']
+    assert graph[0] == '[0:v]split=3[v0][v1][v2]'
+    assert graph[1] == '[0:a]asplit=3[a0][a1][a2]'
+    assert graph[2].startswith('[v0]trim=start=18.000:end=28.000,')
+    assert graph[4].startswith('[v1]trim=start=0.000:end=8.000,')
+    assert graph[6].startswith('[v2]trim=start=23.000:end=38.000,')
+    assert graph[7] == '[a2]atrim=start=23.000:end=38.000,asetpts=PTS-STARTPTS[c2a0]'
+    assert outputs == [(['[c0o0]', '[c0a0]'], 'a.mp4'),
+                       (['[c1o0]', '[c1a0]'], 'b.mp4'),
+                       (['[c2o0]', '[c2a0]'], 'c.mp4')]
+
+
+def test_each_ratio_gets_its_own_crop_and_output():
+    segments = [(0, 10, ['a.mp4', 'a_1x1.mp4']), (5, 15, ['b.mp4', 'b_1x1.mp4'])]
+    _, graph, outputs = split_command(build_batch_command('src.mp4', segments, ['9:16', '1:1']))
+
+    assert graph[2].endswith(',split=2[c0s0][c0s1]')
+    assert graph[3] == f"[c0s0]{crop_filter('9:16')}[c0o0]"
+    assert graph[4] == f"[c0s1]{crop_filter('1:1')}[c0o1]"
+    assert graph[5].endswith(',asplit=2[c0a0][c0a1]')
+    assert outputs == [(['[c0o0]', '[c0a0]'], 'a.mp4'),
+                       (['[c0o1]', '[c0a1]'], 'a_1x1.mp4'),
+                       (['[c1o0]', '[c1a0]'], 'b.mp4'),
+                       (['[c1o1]', '[c1a1]'], 'b_1x1.mp4')]
+
+
+def test_without_audio_only_video_is_mapped():
+    segments = [(0, 10, ['a.mp4']), (20, 30, ['b.mp4'])]
+    _, graph, outputs = split_command(build_batch_command('src.mp4', segments, ['original'], has_audio=False))
+
+    assert not any('[0:a]' in line or 'atrim' in line for line in graph)
+    assert outputs == [(['[c0o0]'], 'a.mp4'), (['[c1o0]'], 'b.mp4')]
+
+
+def test_progress_output_follows_the_untrimmed_stream_first():
+    command = build_batch_command('src.mp4', [(0, 10, ['a.mp4'])], ['original'], progress_output=True)
+    _, graph, outputs = split_command(command)
+
+    assert graph[0] == '[0:v]split=2[v0][v1]'
+    assert outputs[0] == (['[v1]'], '-')
+    assert outputs[1] == (['[c0o0]', '[c0a0]'], 'a.mp4')
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+import render_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_cache, 'CACHE_FOLDER', str(tmp_path / 'render_cache'))
+    monkeypatch.setattr(render_cache, 'ENABLED', True)
+    return tmp_path
+
+
+def make_render(folder, name, size=1000):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+
+def test_cache_key_depends_on_every_part_but_not_their_order():
+    assert render_cache.cache_key(a=1, b='x') == render_cache.cache_key(b='x', a=1)
+    assert render_cache.cache_key(a=1, b='x') != render_cache.cache_key(a=2, b='x')
+
+
+def test_store_then_fetch_shares_the_file(cache):
+    key = render_cache.cache_key(clip=1)
+    rendered = make_render(cache, 'clip.mp4')
+    assert not render_cache.fetch(key, str(cache / 'other.mp4'))
+
+    render_cache.store(key, rendered)
+    assert render_cache.contains(key)
+    destination = str(cache / 'other.mp4')
+    make_render(cache, 'other.mp4', size=5)  # An older output is replaced
+    assert render_cache.fetch(key, destination)
+    assert os.path.samefile(destination, render_cache.cache_path(key))
+    assert render_cache.cache_stats()['shared_with_jobs'] == 1
+
+
+def test_disabled_cache_stores_and_serves_nothing(cache, monkeypatch):
+    monkeypatch.setattr(render_cache, 'ENABLED', False)
+    key = render_cache.cache_key(clip=1)
+    render_cache.store(key, make_render(cache, 'clip.mp4'))
+    assert not os.path.exists(render_cache.cache_path(key))
+    assert not render_cache.contains(key)
+
+
+def test_expire_removes_idle_entries_and_counts_only_unshared_bytes(cache):
+    idle_key, shared_key, fresh_key = (render_cache.cache_key(clip=i) for i in range(3))
+    render_cache.store(idle_key, make_render(cache, 'a.mp4'))
+    os.remove(cache / 'a.mp4')
+    render_cache.store(shared_key, make_render(cache, 'b.mp4'))
+    render_cache.store(fresh_key, make_render(cache, 'c.mp4'))
+    for key in (idle_key, shared_key):
+        os.utime(render_cache.cache_path(key), (time.time() - 7200,) * 2)
+
+    assert render_cache.expire(3600) == (2, 1000)
+    assert not render_cache.contains(idle_key) and not render_cache.contains(shared_key)
+    assert render_cache.contains(fresh_key)
+
+
+def test_evict_removes_least_recently_used_unshared_entries(cache):
+    keys = [render_cache.cache_key(clip=i) for i in range(3)]
+    for i, key in enumerate(keys):
+        render_cache.store(key, make_render(cache, f'{i}.mp4'))
+        if i != 1:
+            os.remove(cache / f'{i}.mp4')
+        os.utime(render_cache.cache_path(key), (1000 + i,) * 2)
+
+    # Entry 1 is still linked from a job and is skipped
+    assert render_cache.evict(1500) == 2000
+    assert [render_cache.contains(key) for key in keys] == [False, True, False]
+
+
+def test_expire_and_evict_tolerate_entries_removed_meanwhile(cache, monkeypatch):
+    key = render_cache.cache_key(clip=1)
+    render_cache.store(key, make_render(cache, 'a.mp4'))
+    os.remove(cache / 'a.mp4')
+    listed = render_cache.entries()
+    # Another sweep deletes the entry between listing and removing it
+    os.remove(render_cache.cache_path(key))
+    monkeypatch.setattr(render_cache, 'entries', lambda: listed)
+    assert render_cache.evict(10 ** 6) == 1000
+    assert render_cache.expire(-1) == (1, 1000)
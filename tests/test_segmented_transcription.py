@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import assemblyai_client
+import segmented_transcription
+from segmented_transcription import plan_cuts, stitch, transcribe_segmented
+
+# One word every 500 ms over 40 minutes, and one sentence per 10 words
+TRUTH = [{'text': f'w{i}', 'start': i * 500 + 50, 'end': i * 500 + 400, 'confidence': 1.0, 'speaker': None}
+         for i in range(2400 * 2)]
+
+
+def fake_transcribe(relative):
+    """A stand-in for assemblyai_client.transcribe returning TRUTH's words inside the requested range"""
+    async def transcribe(client, audio_url, with_sentences=False, audio_start_from=0, audio_end_at=None, **config):
+        words = [w for w in TRUTH if w['start'] >= audio_start_from and w['end'] <= audio_end_at]
+        offset = audio_start_from if relative else 0
+        words = [dict(w, start=w['start'] - offset, end=w['end'] - offset) for w in words]
+        sentences = [{'text': '', 'start': words[i]['start'], 'end': words[min(i + 9, len(words) - 1)]['end']}
+                     for i in range(0, len(words), 10)]
+        return {'id': f'segment-{int(audio_start_from)}', 'words': words, 'sentences': sentences}
+    return transcribe
+
+
+def test_plan_cuts_moves_boundaries_into_nearby_silences():
+    silences = [(590.0, 591.0), (1210.0, 1212.0), (1190.0, 1190.5)]
+    # The nearest silence wins, however short
+    assert plan_cuts(1800, silences, segment_seconds=600) == [0.0, 590.5, 1190.25, 1800]
+    # No silence within reach: the fixed target is used
+    assert plan_cuts(1800, [], segment_seconds=600) == [0.0, 600.0, 1200.0, 1800]
+    assert plan_cuts(300, [], segment_seconds=600) == [0.0, 300]
+
+
+def test_should_segment_only_long_audio(monkeypatch):
+    monkeypatch.setattr(segmented_transcription, 'ENABLED', True)
+    monkeypatch.setattr(segmented_transcription, 'MIN_MINUTES', 30)
+    monkeypatch.setattr(segmented_transcription, 'SEGMENT_MINUTES', 15)
+    assert segmented_transcription.should_segment(3 * 3600)
+    assert not segmented_transcription.should_segment(10 * 60)
+    assert not segmented_transcription.should_segment(None)
+
+
+def test_stitch_drops_overlap_duplicates_and_splits_sentences_at_the_cut():
+    first = {'words': TRUTH[:12], 'sentences': [{'text': '', 'start': 50, 'end': TRUTH[11]['end']}]}
+    second = {'words': TRUTH[8:20], 'sentences': [{'text': '', 'start': TRUTH[8]['start'], 'end': TRUTH[19]['end']}]}
+    cut = 5000
+    result = stitch([(first, 0, cut, 0), (second, cut, float('inf'), TRUTH[8]['start'])])
+    assert result['words'] == TRUTH[:20]
+    assert [s['text'] for s in result['sentences']] == [
+        ' '.join(f'w{i}' for i in range(10)), ' '.join(f'w{i}' for i in range(10, 20))]
+
+
+@pytest.mark.parametrize('relative', [False, True])
+def test_segments_stitch_back_into_the_whole_transcript(monkeypatch, relative):
+    monkeypatch.setattr(assemblyai_client, 'transcribe', fake_transcribe(relative))
+    monkeypatch.setattr(segmented_transcription, 'SEGMENT_MINUTES', 15)
+    monkeypatch.setattr(segmented_transcription, 'OVERLAP_SECONDS', 5)
+    silences = [(k * 60 - 0.4, k * 60 + 0.4) for k in range(1, 40)]
+    fractions = []
+
+    result = asyncio.run(transcribe_segmented(None, 'upload-url', 2400, silences, on_progress=fractions.append,
+                                              language_code='en_us'))
+    assert len(result['segments']) == 3
+    assert result['id'] == 'segment-0'
+    assert result['words'] == TRUTH
+    assert sum(len(s['text'].split()) for s in result['sentences']) == len(TRUTH)
+    assert all(a['end'] <= b['start'] for a, b in zip(result['sentences'], result['sentences'][1:]))
+    assert fractions[-1] == 1.0
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import stage_pools
+from stage_pools import FairPool, StagePools
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def hold(pool, work, order, release):
+    await pool.acquire(work)
+    order.append(work)
+    await release.wait()
+    pool.release()
+
+
+def test_waiters_get_slots_shortest_remaining_work_first():
+    async def scenario():
+        pool = FairPool('cpu', 1)
+        order = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(pool, work, order, release)) for work in (0, 900, 30, 300)]
+        await asyncio.sleep(0.01)
+        assert order == [0] and pool.stats() == {'limit': 1, 'active': 1, 'waiting': 3}
+        release.set()
+        await asyncio.gather(*tasks)
+        return order, pool.stats()
+
+    order, stats = run(scenario())
+    assert order == [0, 30, 300, 900]
+    assert stats == {'limit': 1, 'active': 0, 'waiting': 0}
+
+
+def test_long_waits_age_a_job_ahead(monkeypatch):
+    monkeypatch.setattr(stage_pools, 'AGING', 1000.0)
+
+    async def scenario():
+        pool = FairPool('cpu', 1)
+        order = []
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(pool, 0, order, release))
+        await asyncio.sleep(0.01)
+        long_job = asyncio.create_task(hold(pool, 50, order, release))
+        await asyncio.sleep(0.2)  # 200 seconds of work forgiven
+        short_job = asyncio.create_task(hold(pool, 10, order, release))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(first, long_job, short_job)
+        return order
+
+    assert run(scenario()) == [0, 50, 10]
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        pool = FairPool('api', 1)
+        await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire(5))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        pool.release()
+        return pool.stats()
+
+    assert run(scenario()) == {'limit': 1, 'active': 0, 'waiting': 0}
+
+
+def test_stage_pools_bound_each_resource_separately():
+    async def scenario():
+        pools = StagePools({'cpu': 1, 'api': 2})
+        peak = {'cpu': 0, 'api': 0}
+        running = {'cpu': 0, 'api': 0}
+
+        async def stage(name):
+            pool = stage_pools.STAGE_POOLS[name]
+            async with pools(name):
+                running[pool] += 1
+                peak[pool] = max(peak[pool], running[pool])
+                await asyncio.sleep(0.01)
+                running[pool] -= 1
+
+        await asyncio.gather(*(stage(name) for name in ['clips', 'audio', 'finalize'] + ['transcribe', 'analyze'] * 3))
+        return peak, pools.stats()
+
+    peak, stats = run(scenario())
+    assert peak == {'cpu': 1, 'api': 2}
+    assert all(pool['active'] == 0 and pool['waiting'] == 0 for pool in stats.values())
@@ -0,0 +1,52 @@
+from word_timeline import WordTimeline
+
+# Two phrases with a pause between them: "one two three" ... "four five"
+WORDS = [
+    {'text': 'one', 'start': 0, 'end': 200},
+    {'text': 'two', 'start': 250, 'end': 450},
+    {'text': 'three', 'start': 500, 'end': 900},
+    {'text': 'four', 'start': 2000, 'end': 2300},
+    {'text': 'five', 'start': 2350, 'end': 2600},
+]
+
+
+def test_from_words_skips_incomplete_words_and_keeps_order():
+    timeline = WordTimeline.from_words(WORDS[:2] + [{'text': '', 'start': 460, 'end': 470},
+                                                    {'text': 'late', 'start': 100, 'end': 150}])
+    assert len(timeline) == 3
+    assert list(timeline.starts) == [0, 250, 250]
+    assert list(timeline.ends) == [200, 450, 450]
+    assert timeline.duration_ms == 450
+
+
+def test_text_between_slices_words():
+    timeline = WordTimeline.from_words(WORDS)
+    assert timeline.word_text(2) == 'three'
+    assert timeline.text_between(1, 4) == 'two three four'
+    assert timeline.text_between(3, 3) == ''
+
+
+def test_index_range_and_words_between_use_word_starts():
+    timeline = WordTimeline.from_words(WORDS)
+    assert timeline.index_range(250, 2000) == (1, 3)
+    assert list(timeline.words_between(400, 2100)) == [(500, 900, 'three'), (2000, 2100, 'four')]
+
+
+def test_snap_start_prefers_a_word_after_a_pause():
+    timeline = WordTimeline.from_words(WORDS)
+    # 'four' follows a pause and is within reach, 'three' is nearer but mid-phrase
+    assert timeline.snap_start(1200) == 2000
+    # Nothing within reach: the nearest word start
+    assert timeline.snap_start(1200, max_shift_ms=100) == 500
+
+
+def test_snap_end_prefers_a_word_before_a_pause():
+    timeline = WordTimeline.from_words(WORDS)
+    assert timeline.snap_end(500) == 900
+    assert timeline.snap_end(2400) == 2600
+
+
+def test_empty_timeline_leaves_times_alone():
+    timeline = WordTimeline.from_words([])
+    assert len(timeline) == 0 and timeline.duration_ms == 0
+    assert timeline.snap_start(1234) == 1234 and timeline.snap_end(1234) == 1234
@@ -0,0 +1,317 @@
+"""
+Searchable library of every processed transcript.
+
+Job folders expire, but their transcripts are worth keeping: once a job has
+been transcribed and diarized, its subtitle lines (with speaker labels) and
+word timings are copied into an SQLite database with an FTS5 full-text index.
+A search finds matching moments across every source processed so far, and a
+moment can be rendered as a new clip straight from the stored words and a
+source file still on disk, without transcribing again.
+
+One row per source: processing the same URL (or the same uploaded file, by
+content hash) again replaces its transcript instead of adding a duplicate.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+from contextlib import closing
+
+from job_store import JOBS_FOLDER, job_path
+from compact_transcript import milliseconds_to_timecode
+
+LIBRARY_PATH = os.getenv('CLIPAH_LIBRARY_PATH', os.path.join(JOBS_FOLDER, 'library.sqlite3'))
+ENABLED = os.getenv('CLIPAH_LIBRARY', 'true').lower() == 'true'
+# A moment picked by subtitle line is widened with its neighbours to at least this long
+MOMENT_MIN_SECONDS = float(os.getenv('CLIPAH_LIBRARY_MOMENT_SECONDS', '30'))
+MAX_RESULTS = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    source_key TEXT UNIQUE NOT NULL,
+    video_source TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    language TEXT,
+    job_id TEXT NOT NULL,
+    media TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cues (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    speaker TEXT,
+    text TEXT NOT NULL,
+    words TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cues_by_source ON cues(source_id, start_ms);
+CREATE VIRTUAL TABLE IF NOT EXISTS cue_index USING fts5(
+    text, content='cues', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS cues_indexed AFTER INSERT ON cues BEGIN
+    INSERT INTO cue_index(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS cues_unindexed AFTER DELETE ON cues BEGIN
+    INSERT INTO cue_index(cue_index, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+_schema_ready = False
+
+
+def connect():
+    """A connection to the library, creating the database on first use"""
+    global _schema_ready
+    os.makedirs(os.path.dirname(LIBRARY_PATH) or '.', exist_ok=True)
+    connection = sqlite3.connect(LIBRARY_PATH, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA foreign_keys = ON')
+    if not _schema_ready:
+        # WAL lets searches run while a finished job is being indexed
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.executescript(SCHEMA)
+        _schema_ready = True
+    return connection
+
+
+def source_key(job):
+    """URLs are the same source wherever they're processed from; uploads are matched by content"""
+    options = job['options']
+    if options['source_type'] == 'url':
+        return options['video_source']
+    return f"sha256:{job['media']['sha256']}"
+
+
+def transcript_cues(job):
+    """Subtitle lines of a job's (speaker-labelled if available) transcript, each with the words spoken in it"""
+    from compact_transcript import parse_vtt
+
+    with open(job_path(job['id'], 'transcript.json'), 'r', encoding='utf-8') as f:
+        transcript = json.load(f)
+    words = sorted(((w['start'], w['end'], w['text']) for w in transcript.get('words') or []
+                    if w.get('start') is not None and w.get('end') is not None and w.get('text')))
+
+    cues = []
+    for name in ('main_transcript.vtt', 'raw_transcript.vtt'):
+        try:
+            with open(job_path(job['id'], name), 'r', encoding='utf-8') as f:
+                cues = parse_vtt(f.read())
+        except FileNotFoundError:
+            continue
+        if cues:
+            break
+    if not cues:
+        # No VTT survived: one line per sentence
+        cues = [{'start': s['start'] / 1000, 'end': s['end'] / 1000, 'text': s['text'], 'speaker': None}
+                for s in transcript.get('sentences') or []]
+    cues = sorted((cue for cue in cues if cue['text']), key=lambda cue: cue['start'])
+
+    # Every word goes to the line it starts in (or the last line before it), so the lines hold the whole transcript
+    rows = []
+    w = 0
+    for k, cue in enumerate(cues):
+        start_ms, end_ms = int(cue['start'] * 1000), int(cue['end'] * 1000)
+        next_start = int(cues[k + 1]['start'] * 1000) if k + 1 < len(cues) else None
+        cue_words = []
+        while w < len(words) and (next_start is None or words[w][0] < next_start):
+            cue_words.append(list(words[w]))
+            w += 1
+        rows.append((start_ms, max(end_ms, start_ms), cue['speaker'], cue['text'], json.dumps(cue_words)))
+    return rows
+
+
+def index_job(job):
+    """Add (or replace) a transcribed job's source in the library; returns the source id"""
+    rows = transcript_cues(job)
+    if not rows:
+        return None
+    options = job['options']
+    key = source_key(job)
+    started = time.perf_counter()
+    with closing(connect()) as connection, connection:
+        connection.execute('DELETE FROM sources WHERE source_key = ?', (key,))
+        cursor = connection.execute(
+            'INSERT INTO sources (source_key, video_source, source_type, language, job_id, media, indexed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, options['video_source'], options['source_type'], options.get('language'), job['id'],
+             json.dumps(job.get('media') or {}), time.time()))
+        source_id = cursor.lastrowid
+        connection.executemany(
+            'INSERT INTO cues (source_id, start_ms, end_ms, speaker, text, words) VALUES (?, ?, ?, ?, ?, ?)',
+            [(source_id,) + row for row in rows])
+    print(f"[INFO] Indexed {len(rows)} transcript lines of {options['video_source']} in the library "
+          f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return source_id
+
+
+def fts_query(text):
+    """
+    An FTS5 query matching every term of text; "quoted phrases" stay phrases and
+    a trailing * keeps its prefix meaning. Search syntax is never passed through raw.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text or ''):
+        if phrase:
+            tokens = re.findall(r'\w+', phrase)
+            if tokens:
+                terms.append('"' + ' '.join(tokens) + '"')
+        else:
+            tokens = re.findall(r'\w+', word)
+            prefix = '*' if word.endswith('*') and tokens else ''
+            terms.extend(f'"{token}"' for token in tokens[:-1])
+            if tokens:
+                terms.append(f'"{tokens[-1]}"{prefix}')
+    return ' '.join(terms)
+
+
+def local_source_path(source):
+    """A copy of the source video still on disk (in the job that indexed it), or None"""
+    path = job_path(source['job_id'], 'main_video.mp4')
+    return path if os.path.exists(path) else None
+
+
+def search(query, limit=20, source_id=None, speaker=None):
+    """
+    Subtitle lines matching query across every indexed source, best match first.
+    Returns (results, seconds taken).
+    """
+    match = fts_query(query)
+    if not match:
+        return [], 0.0
+    sql = ('SELECT cues.id, cues.source_id, cues.start_ms, cues.end_ms, cues.speaker, cues.text, '
+           "snippet(cue_index, 0, '[', ']', '…', 16) AS snippet, bm25(cue_index) AS rank, "
+           'sources.video_source, sources.source_type, sources.job_id '
+           'FROM cue_index JOIN cues ON cues.id = cue_index.rowid JOIN sources ON sources.id = cues.source_id '
+           'WHERE cue_index MATCH ?')
+    params = [match]
+    if source_id is not None:
+        sql += ' AND cues.source_id = ?'
+        params.append(int(source_id))
+    if speaker:
+        sql += ' AND cues.speaker = ?'
+        params.append(speaker)
+    sql += ' ORDER BY rank LIMIT ?'
+    params.append(max(1, min(int(limit), MAX_RESULTS)))
+
+    started = time.perf_counter()
+    with closing(connect()) as connection:
+        rows = connection.execute(sql, params).fetchall()
+    took = time.perf_counter() - started
+
+    results = []
+    for row in rows:
+        results.append({
+            'cue_id': row['id'],
+            'source_id': row['source_id'],
+            'video_source': row['video_source'],
+            'start_time': milliseconds_to_timecode(row['start_ms']),
+            'end_time': milliseconds_to_timecode(row['end_ms']),
+            'speaker': row['speaker'],
+            'text': row['text'],
+            'snippet': row['snippet'],
+            'score': round(-row['rank'], 3),
+            # Renderable without downloading again
+            'source_on_disk': local_source_path(row) is not None,
+        })
+    return results, took
+
+
+def get_source(source_id):
+    with closing(connect()) as connection:
+        row = connection.execute('SELECT * FROM sources WHERE id = ?', (int(source_id),)).fetchone()
+    if row is None:
+        return None
+    source = dict(row)
+    source['media'] = json.loads(source['media'])
+    return source
+
+
+def list_sources():
+    with closing(connect()) as connection:
+        rows = connection.execute(
+            'SELECT sources.id, video_source, source_type, language, job_id, indexed_at, COUNT(cues.id) AS lines '
+            'FROM sources LEFT JOIN cues ON cues.source_id = sources.id GROUP BY sources.id ORDER BY indexed_at DESC'
+        ).fetchall()
+    return [dict(row, source_on_disk=local_source_path(row) is not None) for row in rows]
+
+
+def moment(cue_id, min_seconds=MOMENT_MIN_SECONDS):
+    """
+    (source id, start ms, end ms) of a clip around a subtitle line, widened with
+    the following (then preceding) lines of the same source to at least min_seconds.
+    """
+    with closing(connect()) as connection:
+        cue = connection.execute('SELECT source_id, start_ms, end_ms FROM cues WHERE id = ?', (int(cue_id),)).fetchone()
+        if cue is None:
+            return None
+        lines = connection.execute('SELECT id, start_ms, end_ms FROM cues WHERE source_id = ? ORDER BY start_ms, id',
+                                   (cue['source_id'],)).fetchall()
+    k = next(i for i, line in enumerate(lines) if line['id'] == int(cue_id))
+    first = last = k
+    start_ms, end_ms = cue['start_ms'], cue['end_ms']
+    while end_ms - start_ms < min_seconds * 1000 and (last + 1 < len(lines) or first > 0):
+        if last + 1 < len(lines):
+            last += 1
+            end_ms = max(end_ms, lines[last]['end_ms'])
+        else:
+            first -= 1
+            start_ms = lines[first]['start_ms']
+    return cue['source_id'], start_ms, end_ms
+
+
+def source_transcript(source_id):
+    """The stored words and lines of a source, in the shape of a job's transcript.json"""
+    with closing(connect()) as connection:
+        rows = connection.execute('SELECT start_ms, end_ms, text, words FROM cues WHERE source_id = ? '
+                                  'ORDER BY start_ms, id', (int(source_id),)).fetchall()
+    words = [{'start': start, 'end': end, 'text': text}
+             for row in rows for start, end, text in json.loads(row['words'])]
+    sentences = [{'start': row['start_ms'], 'end': row['end_ms'], 'text': row['text']} for row in rows]
+    return {'id': None, 'words': words, 'sentences': sentences}
+
+
+def backfill():
+    """Index every job folder that still has a transcript (e.g. jobs from before the library existed)"""
+    import render_cache
+    from job_store import list_jobs, save_job
+
+    indexed = 0
+    for job in list_jobs():
+        if not job['stages'].get('raw_subtitles', {}).get('done'):
+            continue
+        if not os.path.exists(job_path(job['id'], 'transcript.json')):
+            continue
+        if job['options']['source_type'] != 'url' and not (job.get('media') or {}).get('sha256'):
+            video = job_path(job['id'], 'main_video.mp4')
+            if not os.path.exists(video):
+                continue
+            job.setdefault('media', {})['sha256'] = render_cache.file_hash(video)
+            save_job(job)
+        if index_job(job):
+            indexed += 1
+    return indexed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search the transcript library or index existing jobs into it.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    search_parser = commands.add_parser('search', help="Find moments matching a query")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    search_parser.add_argument('--speaker')
+    commands.add_parser('backfill', help="Index every job folder that still has a transcript")
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        print(f"✅ Indexed {backfill()} sources into {LIBRARY_PATH}")
+    else:
+        found, seconds = search(args.query, args.limit, speaker=args.speaker)
+        print(f"🔎 {len(found)} moments in {seconds * 1000:.1f} ms")
+        for result in found:
+            print(f"   [{result['cue_id']}] {result['video_source']} {result['start_time']} "
+                  f"{result['speaker'] or ''}: {result['snippet']}")
@@ -0,0 +1,129 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class WordTimeline:
+    """
+    Compact index over a transcript's word timings.
+
+    Word start/end times (in milliseconds) are kept in parallel arrays and the
+    word texts are joined into a single string addressed by offsets, so the
+    index is built once per transcript and every clip can slice its words with
+    a binary search instead of walking the whole transcript.
+    """
+
+    # A gap between two words at least this long counts as a pause boundary
+    PAUSE_MS = 300
+
+    def __init__(self, starts, ends, text, offsets):
+        self.starts = starts
+        self.ends = ends
+        self.text = text
+        self.offsets = offsets
+
+    @classmethod
+    def from_words(cls, words):
+        """Build the index from AssemblyAI word objects (or dicts with start/end/text)"""
+        starts = array('q')
+        ends = array('q')
+        offsets = array('q')
+        parts = []
+        position = 0
+
+        for word in words or []:
+            if isinstance(word, dict):
+                start, end, text = word.get('start'), word.get('end'), word.get('text')
+            else:
+                start, end, text = word.start, word.end, word.text
+            if start is None or end is None or not text:
+                continue
+
+            # ASR output is ordered, but guard the invariant binary search relies on
+            start = max(int(start), starts[-1]) if starts else int(start)
+            end = max(int(end), start, ends[-1]) if ends else max(int(end), start)
+            starts.append(start)
+            ends.append(end)
+            offsets.append(position)
+            parts.append(text)
+            position += len(text) + 1
+
+        offsets.append(position)
+        return cls(starts, ends, ' '.join(parts), offsets)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def duration_ms(self):
+        return self.ends[-1] if len(self) else 0
+
+    def word_text(self, index):
+        return self.text[self.offsets[index]:self.offsets[index + 1] - 1]
+
+    def text_between(self, lo, hi):
+        """Text of words [lo, hi) as a single slice of the joined transcript text"""
+        if hi <= lo:
+            return ''
+        return self.text[self.offsets[lo]:self.offsets[hi] - 1]
+
+    def index_range(self, start_ms, end_ms):
+        """Return (lo, hi) so that words lo..hi-1 start inside [start_ms, end_ms)"""
+        lo = bisect_left(self.starts, start_ms)
+        hi = bisect_left(self.starts, end_ms, lo)
+        return lo, hi
+
+    def words_between(self, start_ms, end_ms):
+        """Yield (start, end, text) for every word that starts inside the range, ends clamped to end_ms"""
+        lo, hi = self.index_range(start_ms, end_ms)
+        for i in range(lo, hi):
+            yield self.starts[i], min(self.ends[i], end_ms), self.word_text(i)
+
+    def _is_pause_before(self, index):
+        return index == 0 or self.starts[index] - self.ends[index - 1] >= self.PAUSE_MS
+
+    def snap_start(self, ms, max_shift_ms=1500):
+        """
+        Move a clip start onto the nearest word start, preferring one that
+        follows a pause within max_shift_ms so the clip opens on a fresh phrase.
+        """
+        if not len(self):
+            return ms
+
+        nearest = self._nearest(self.starts, ms)
+        best = None
+        lo = bisect_left(self.starts, ms - max_shift_ms)
+        hi = bisect_right(self.starts, ms + max_shift_ms)
+        for i in range(lo, hi):
+            if self._is_pause_before(i) and (best is None or abs(self.starts[i] - ms) < abs(self.starts[best] - ms)):
+                best = i
+
+        return self.starts[best if best is not None else nearest]
+
+    def snap_end(self, ms, max_shift_ms=1500):
+        """
+        Move a clip end onto the nearest word end, preferring one that is
+        followed by a pause within max_shift_ms so the clip doesn't cut a word.
+        """
+        if not len(self):
+            return ms
+
+        last = len(self) - 1
+        nearest = self._nearest(self.ends, ms)
+        best = None
+        lo = bisect_left(self.ends, ms - max_shift_ms)
+        hi = bisect_right(self.ends, ms + max_shift_ms)
+        for i in range(lo, hi):
+            pause_after = i == last or self._is_pause_before(i + 1)
+            if pause_after and (best is None or abs(self.ends[i] - ms) < abs(self.ends[best] - ms)):
+                best = i
+
+        return self.ends[best if best is not None else nearest]
+
+    @staticmethod
+    def _nearest(values, ms):
+        i = bisect_left(values, ms)
+        if i == 0:
+            return 0
+        if i == len(values):
+            return i - 1
+        return i if values[i] - ms < ms - values[i - 1] else i - 1